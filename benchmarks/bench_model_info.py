@@ -0,0 +1,43 @@
+"""
+Сравнивает поиск primary key через inspect.getmembers, как было раньше в Base.get_by_primary,
+с готовыми метаданными из Base.__model_info__. База не нужна: замеряется только подготовка запроса.
+Запуск: python -m benchmarks.bench_model_info
+"""
+import inspect
+import timeit
+
+from sqlalchemy import select
+
+from models import Resource, Visitor
+
+ROUNDS = 2000
+
+
+def legacy_primary_key(cls) -> str:
+    primary_field_name = ""
+    for name, member in inspect.getmembers(cls):
+        if hasattr(member, "primary_key") and getattr(member, "primary_key"):
+            primary_field_name = name
+    return primary_field_name
+
+
+def legacy_lookup(cls, value):
+    return select(cls).filter_by(**{legacy_primary_key(cls): value})
+
+
+def registry_lookup(cls, value):
+    info = cls.__model_info__
+    return select(cls).where(info.columns[info.primary_key] == value)
+
+
+def main():
+    for cls, value in [(Resource, 49), (Visitor, "mnoskov@skbkontur.ru")]:
+        assert legacy_primary_key(cls) == cls.__model_info__.primary_key
+        legacy = timeit.timeit(lambda: legacy_lookup(cls, value), number=ROUNDS) / ROUNDS
+        registry = timeit.timeit(lambda: registry_lookup(cls, value), number=ROUNDS) / ROUNDS
+        print(f"{cls.__name__}: inspect.getmembers {legacy * 1e6:.1f} мкс, "
+              f"__model_info__ {registry * 1e6:.1f} мкс, быстрее в {legacy / registry:.1f} раз")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Как долго другие чаты ждут ответа, пока бот проверяет большой csv. Пока идет импорт, отдельная задача каждые
+5 мс засыпает и меряет, насколько позже положенного проснулась: это задержка, которую увидел бы любой другой
+обработчик. Импорт выполняется прямо в цикле событий, как было раньше, в пуле потоков и в пуле процессов.
+Полную сборку мусора, которую вызывают тысячи новых записей, без gc.freeze() было бы видно как выброс
+на сотню миллисекунд даже в пуле потоков.
+База и Телеграм не нужны. Запуск: python -m benchmarks.bench_offload
+"""
+import asyncio
+import gc
+import os
+import statistics
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+from helpers.checker import KnownValues
+from helpers.executor import Offloader
+from helpers.ingest import read_csv
+
+ROWS = 50000
+TICK_SECONDS = 0.005
+
+
+def make_csv(path: str) -> None:
+    with open(path, "w", encoding="cp1251", newline="") as file:
+        file.write("Айди,Название,Категория,Артикул,Дата регистрации\r\n")
+        for i in range(1, ROWS + 1):
+            file.write(f"{i},Касса Эвотор {i},ККТ,VC-{i},18.05.2024\r\n")
+
+
+async def measure_lag(stop: asyncio.Event, lags: list[float]) -> None:
+    while not stop.is_set():
+        started = perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(perf_counter() - started - TICK_SECONDS)
+
+
+async def run_import(mode: str, path: str, known: KnownValues) -> tuple[float, list[float]]:
+    offloader = Offloader(mode, workers=1) if mode != "loop" else None
+    if offloader is not None:
+        # пул процессов стартует долго, поэтому прогреваем его до замера
+        await offloader.run(sum, [0])
+    stop = asyncio.Event()
+    lags: list[float] = []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(TICK_SECONDS * 4)
+    started = perf_counter()
+    if offloader is None:
+        errors, resources = read_csv(path, known)
+    else:
+        errors, resources = await offloader.run(read_csv, path, known)
+    elapsed = perf_counter() - started
+    assert len(errors) == 0 and len(resources) == ROWS
+    stop.set()
+    await ticker
+    if offloader is not None:
+        await offloader.stop()
+    return elapsed, lags
+
+
+def main():
+    # как main.py после запуска: объекты импортированных модулей не участвуют в полной сборке мусора
+    gc.freeze()
+    known = KnownValues(frozenset(), frozenset(), frozenset(["ККТ"]))
+    with NamedTemporaryFile(suffix=".csv", delete=False) as file:
+        path = file.name
+    try:
+        make_csv(path)
+        print(f"Импорт {ROWS} строк, размер файла {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+        for mode in ("loop", "thread", "process"):
+            elapsed, lags = asyncio.run(run_import(mode, path, known))
+            lags_ms = sorted(lag * 1000 for lag in lags)
+            p99 = lags_ms[int(len(lags_ms) * 0.99) - 1]
+            print(f"{mode:>7}: импорт {elapsed * 1000:.0f} мс, задержка других чатов: "
+                  f"медиана {statistics.median(lags_ms):.1f} мс, p99 {p99:.1f} мс, максимум {lags_ms[-1]:.1f} мс, "
+                  f"замеров {len(lags_ms)}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Сравнивает чтение 50 тысяч устройств ORM-объектами Resource через сессию и проекцией ResourceRow
+из Resource.select_rows: время и память, которую занимает готовый список.
+Нужна база из переменных окружения бота. Строки вставляются в транзакции, которая в конце откатывается.
+Запуск: python -m benchmarks.bench_projections
+"""
+import asyncio
+import gc
+import tracemalloc
+from time import perf_counter
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import RESOURCE_ROW_COLUMNS, Resource, ResourceRow, get_engine
+
+ROWS = 50000
+ROUNDS = 3
+CATEGORY = "Бенчмарк"
+FIRST_ID = 10_000_000
+
+
+async def load_orm(conn) -> list:
+    session = AsyncSession(bind=conn, expire_on_commit=False)
+    result = await session.scalars(select(Resource).where(Resource.category_name == CATEGORY))
+    resources = result.all()
+    await session.close()
+    return list(resources)
+
+
+async def load_projection(conn) -> list:
+    stmt = select(*RESOURCE_ROW_COLUMNS).where(Resource.category_name == CATEGORY)
+    return [ResourceRow.from_values(values) for values in await conn.execute(stmt)]
+
+
+async def measure(name: str, load, conn) -> None:
+    durations = []
+    for _ in range(ROUNDS):
+        gc.collect()
+        start = perf_counter()
+        rows = await load(conn)
+        durations.append(perf_counter() - start)
+        assert len(rows) == ROWS
+        del rows
+    gc.collect()
+    tracemalloc.start()
+    rows = await load(conn)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: лучшее время {min(durations) * 1000:.0f}мс, "
+          f"список занимает {retained / 2 ** 20:.1f}МБ, пик {peak / 2 ** 20:.1f}МБ")
+    del rows
+
+
+async def main():
+    engine = get_engine()
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(text("INSERT INTO category(name) VALUES (:name) ON CONFLICT DO NOTHING"),
+                               {"name": CATEGORY})
+            await conn.execute(text(
+                "INSERT INTO resource(id, name, category_name, vendor_code, comment, firmware, reg_date) "
+                "SELECT i, 'Устройство ' || i, :category, 'BENCH-' || i, 'Комментарий к устройству', '5.8.1', now() "
+                "FROM generate_series(CAST(:first AS integer), CAST(:last AS integer)) AS i"
+            ), {"category": CATEGORY, "first": FIRST_ID, "last": FIRST_ID + ROWS - 1})
+            print(f"Вставлено {ROWS} строк, замеры по {ROUNDS} прогона")
+            await measure("ORM Resource", load_orm, conn)
+            await measure("Проекция ResourceRow", load_projection, conn)
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
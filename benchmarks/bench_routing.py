@@ -0,0 +1,55 @@
+"""
+Сравнивает выбор обработчика для команды с id: каскад регулярных выражений, как раньше было в роутерах
+(/update_address.+, /take.+, /edit.+, ^(/return|/queue|/leave)(\\d+)$), и разбор команды один раз
+с поиском имени в таблице. Чтобы показать зависимость от числа команд, к настоящим добавляются вымышленные.
+База и Телеграм не нужны. Запуск: python -m benchmarks.bench_routing
+"""
+import re
+import timeit
+
+from middlewares.commands import parse_command
+
+ROUNDS = 20000
+REAL_COMMANDS = ["update_address", "take", "edit", "return", "queue", "leave"]
+MESSAGES = ["/leave12", "/take7", "/return3", "привет", "/edit150", "Отменить"]
+
+
+def make_regex_cascade(commands: list[str]) -> list[tuple[re.Pattern, str]]:
+    return [(re.compile(rf"\/{name}.+"), name) for name in commands]
+
+
+def route_by_regex(cascade: list[tuple[re.Pattern, str]], text: str) -> str | None:
+    if "отменить" in text.casefold() or "отмена" in text.casefold():
+        return "cancel"
+    for pattern, name in cascade:
+        if pattern.match(text):
+            return name
+    return None
+
+
+def route_by_table(table: dict[str, str], text: str) -> str | None:
+    if "отменить" in text.casefold() or "отмена" in text.casefold():
+        return "cancel"
+    command = parse_command(text)
+    if command is None or command.id is None:
+        return None
+    return table.get(command.name)
+
+
+def main():
+    for extra in (0, 50, 500):
+        # вымышленные команды стоят перед настоящими, как роутеры, подключенные раньше
+        commands = [f"fake{i}_" for i in range(extra)] + REAL_COMMANDS
+        cascade = make_regex_cascade(commands)
+        table = {name: name for name in commands}
+        for text in MESSAGES:
+            assert route_by_regex(cascade, text) == route_by_table(table, text)
+        regex = timeit.timeit(lambda: [route_by_regex(cascade, text) for text in MESSAGES], number=ROUNDS)
+        lookup = timeit.timeit(lambda: [route_by_table(table, text) for text in MESSAGES], number=ROUNDS)
+        per_message = ROUNDS * len(MESSAGES)
+        print(f"{len(commands)} команд: регулярные выражения {regex / per_message * 1e6:.2f} мкс на сообщение, "
+              f"таблица {lookup / per_message * 1e6:.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,5 +7,9 @@ from models import Visitor
 
 
 class NotAuthFilter(BaseFilter):
-    async def __call__(self, message: Message) -> Union[bool, Dict[str, Any]]:
+    """Если AuthMiddleware уже проверил пользователя, берет результат из data["authorized"] без повторного запроса"""
+
+    async def __call__(self, message: Message, authorized: bool | None = None) -> Union[bool, Dict[str, Any]]:
+        if authorized is not None:
+            return not authorized
         return not await Visitor.is_exist(message.chat.id)
@@ -1,12 +1,12 @@
 import logging
-from re import Match
 
-from aiogram import F, Router
+from aiogram import Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, ReplyKeyboardRemove
 
 from helpers import db, chat, tg
+from middlewares.commands import IdCommand
 from models import Resource, Visitor, Record, ActionType
 
 router = Router()
@@ -16,10 +16,9 @@ class ActionsFSM(StatesGroup):
     confirm = State()
 
 
-@router.message(F.text.regexp(r"^(\/return|\/queue|\/leave)(\d+)$").as_("match"))
-async def actions_handler(message: Message, match: Match[str], state: FSMContext):
-    action = match.group(1)
-    resource_id = int(match.group(2))
+@router.message(IdCommand("return", "queue", "leave"))
+async def actions_handler(message: Message, state: FSMContext, command_name: str, resource_id: int):
+    action = f"/{command_name}"
     await message.answer(
         text="Вы уверены?",
         reply_markup=tg.get_reply_keyboard(["Подтвердить", "Отменить"]))
@@ -48,7 +47,7 @@ async def confirm_handler(message: Message, state: FSMContext):
 
 
 async def return_resource(message: Message, resource_id: int) -> str:
-    resources = await Resource.get_by_primary(resource_id)
+    resources = await Resource.get_by_primary(resource_id, primary=True)
     username = chat.get_username_str(message)
     if len(resources) == 0:
         logging.error(
@@ -61,7 +60,7 @@ async def return_resource(message: Message, resource_id: int) -> str:
         logging.error(f"Пользователь {repr(user)} пытался вернуть устройство, "
                       f"записанное на другого пользователя: {repr(resource)}")
         return chat.return_others_device_msg
-    await db.return_resource(resource_id)
+    await db.return_resource(resource)
     next_user_email = await db.pass_resource_to_next_user(resource_id)
     if next_user_email:
         await db.notify_next_user_about_taking(message, next_user_email, resource)
@@ -70,9 +69,9 @@ async def return_resource(message: Message, resource_id: int) -> str:
 
 
 async def queue_resource(message: Message, resource_id: int) -> str:
-    resource = (await Resource.get_by_primary(resource_id))[0]
+    resource = (await Resource.get_by_primary(resource_id, primary=True))[0]
     user = await Visitor.get_current(message.chat.id)
-    records = await db.get_resource_queue(resource_id)
+    records = await db.get_resource_queue(resource_id, primary=True)
     if user.email in [record.user_email for record in records]:
         return chat.queue_second_time_error_msg
     await Record.add(resource_id=resource.id, email=user.email, action=ActionType.QUEUE)
@@ -81,9 +80,9 @@ async def queue_resource(message: Message, resource_id: int) -> str:
 
 
 async def leave_resource(message: Message, resource_id: int) -> str:
-    resource = (await Resource.get_by_primary(resource_id))[0]
+    resource = (await Resource.get_by_primary(resource_id, primary=True))[0]
     user = await Visitor.get_current(message.chat.id)
-    records = await db.get_resource_queue(resource_id)
+    records = await db.get_resource_queue(resource_id, primary=True)
     if user.email not in [record.user_email for record in records]:
         logging.info(f"Пользователь {repr(user)} пытался дважды покинуть очередь на устройство {repr(resource)}")
         return chat.leave_left_error_msg
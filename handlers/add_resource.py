@@ -1,29 +1,32 @@
-import csv
 import logging
-from io import StringIO
-from typing import BinaryIO
 
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, ReplyKeyboardRemove
-from charset_normalizer import from_bytes
 
-from helpers import checker, db, tg, chat
-from models import Resource, Visitor, Category
+from helpers import checker, db, tg, chat, ingest
+from helpers.admins import roster
+from helpers.catalog import catalog
+from helpers.executor import executor
+from models import Resource, ResourceRow, Visitor
 
 CANCEL_BTN = "Галя, отмена"
 SKIP_BTN = "Пропустить"
 ADD_BTN = "Добавить"
+APPLY_BTN = "Применить"
+SYNC_BTN = "Сверить с файлом"
 CANCEL_KEYBOARD = tg.get_reply_keyboard([CANCEL_BTN])
 SKIP_OR_CANCEL_KEYBOARD = tg.get_reply_keyboard([SKIP_BTN, CANCEL_BTN])
 ADD_OR_CANCEL_KEYBOARD = tg.get_reply_keyboard([ADD_BTN, CANCEL_BTN])
+APPLY_OR_CANCEL_KEYBOARD = tg.get_reply_keyboard([APPLY_BTN, CANCEL_BTN])
 
 
 class AddResourceFSM(StatesGroup):
     choosing = State()
     uploading = State()
+    confirm_sync = State()
     write_id = State()
     write_vendor_code = State()
     write_name = State()
@@ -43,13 +46,13 @@ router = Router()
 @router.message(Command("add"))
 async def add_resource_command(message: Message, state: FSMContext):
     user = await Visitor.get_current(message.chat.id)
-    if not user.is_admin:
+    if not roster.is_admin(user):
         await message.answer(chat.not_found_msg)
         return
     await state.set_state(AddResourceFSM.choosing)
     await message.answer(
         text="Хотите добавить устройства по одному или загрузить файл?",
-        reply_markup=tg.get_reply_keyboard(["По одному", "Файлом"])
+        reply_markup=tg.get_reply_keyboard(["По одному", "Файлом", SYNC_BTN])
     )
 
 
@@ -63,6 +66,10 @@ async def add_one_by_one_handler(message: Message, state: FSMContext):
     elif text == "Файлом":
         await state.set_state(AddResourceFSM.uploading)
         await message.answer(text=chat.ask_file_msg, reply_markup=ReplyKeyboardRemove())
+    elif text == SYNC_BTN:
+        await state.set_state(AddResourceFSM.uploading)
+        await state.set_data({"sync": True})
+        await message.answer(text=chat.ask_sync_file_msg, reply_markup=ReplyKeyboardRemove())
     else:
         await message.answer(chat.ask_way_of_adding_msg)
 
@@ -73,7 +80,7 @@ async def add_id(message: Message, state: FSMContext):
         await message.answer(f"{checker.ResourceError.WRONG_ID.value}. Пожалуйста, введите число")
         return
     resource_id = int(message.text.strip())
-    existed_resources: list[Resource] = await Resource.get_by_primary(resource_id)
+    existed_resources: list[Resource] = await Resource.get_by_primary(resource_id, primary=True)
     if len(existed_resources) >= 1:
         await state.clear()
         await message.answer(
@@ -92,7 +99,7 @@ async def add_id(message: Message, state: FSMContext):
 @router.message(AddResourceFSM.write_vendor_code)
 async def add_vendor_code(message: Message, state: FSMContext):
     vendor_code = message.text.strip()
-    existed_resources: list[Resource] = await Resource.get_by_vendor_code(vendor_code)
+    existed_resources: list[Resource] = await Resource.get_by_vendor_code(vendor_code, primary=True)
     if len(existed_resources) >= 1:
         await state.clear()
         await message.answer(
@@ -111,7 +118,7 @@ async def add_vendor_code(message: Message, state: FSMContext):
 @router.message(AddResourceFSM.write_name)
 async def add_name(message: Message, state: FSMContext):
     await state.update_data(**{db.get_field_name(Resource.name): message.text.strip()})
-    available_categories = [i.name for i in (await Category.get_all())]
+    available_categories = await catalog.all()
     await state.set_state(AddResourceFSM.write_category)
     await message.answer(
         text=chat.ask_category_msg,
@@ -255,45 +262,20 @@ async def finish_adding_resource(message: Message, state: FSMContext):
     )
 
 
-def get_charset(file: BinaryIO):
-    charset = from_bytes(file.read()).best().encoding
-    logging.info(f"Charset normalizer определил кодировку как: {charset}")
-    if charset not in ["cp1251", "utf_8"]:
-        charset = "cp1251"
-    logging.info(f"Для декодирования выбрана кодировка: {charset}")
-    file.seek(0)
-    return charset
-
-
-async def check_csv(in_memory_file: BinaryIO) -> tuple[dict[int, list[checker.ResourceError]], list] | None:
-    errors: dict[int, list[checker.ResourceError]] = {}
-    resources = []
-    charset = get_charset(in_memory_file)
-    s = StringIO(in_memory_file.read().decode(encoding=charset))
-    try:
-        for index, row in enumerate(csv.reader(s), 1):
-            if row == [] or row[0].lower() == "айди":
-                continue
-            fields = checker.prepare_fields(row)
-            resource, resource_errors = await checker.check_resource(**fields)
-            if len(resource_errors) != 0:
-                errors.update({index: resource_errors})
-            elif resource:
-                resources.append(resource)
-        return errors, resources
-    except Exception:
-        logging.error("При парсинге файла произошла неожиданная ошибка", exc_info=True)
-
-
 @router.message(AddResourceFSM.uploading, F.document)
 async def paste_from_csv(message: Message, state: FSMContext):
     if not message.document.file_name.endswith(".csv"):
         await message.answer(chat.wrong_file_format_msg)
         return
-    await message.answer(chat.file_is_processing_msg)
-    original_file = await message.bot.get_file(message.document.file_id)
-    in_memory_file = await message.bot.download(file=original_file)
-    row_errors, resources = await check_csv(in_memory_file)
+    sync = (await state.get_data()).get("sync", False)
+    progress = ingest.Progress(await message.answer(chat.file_is_processing_msg), chat.file_is_processing_msg)
+    try:
+        async with ingest.downloaded(message.bot, message.document.file_id) as path:
+            row_errors, resources = await ingest.check_csv(path, progress, allow_existing=sync)
+    except Exception:
+        logging.error("При парсинге файла произошла неожиданная ошибка", exc_info=True)
+        await message.answer(chat.adding_file_error_msg)
+        return
     if not row_errors and not resources:
         await message.answer(chat.adding_file_error_msg)
         return
@@ -306,17 +288,50 @@ async def paste_from_csv(message: Message, state: FSMContext):
         error_reply = "Исправьте ошибки и попробуйте снова\r\n\r\n"
         await message.answer(f"{error_reply}{row_errors_text}{vendor_code_doubles_text}{resource_id_doubles_text}")
         return
-    for resource in resources:
-        if resource.user_email is not None:
-            await Visitor.add_if_needed(resource.user_email)
-        await Resource.add_existed(resource)
-        user_name = chat.get_username_str(message)
+    if sync:
+        await propose_sync(message, state, resources)
+        return
+    user_name = chat.get_username_str(message)
+    for resource in await Resource.add_many(resources):
         logging.info(
             f"Пользователь{user_name}с chat_id {message.chat.id} добавил устройство {repr(resource)}")
     await state.clear()
     await message.answer("Вы успешно внесли данные!", reply_markup=ReplyKeyboardRemove())
 
 
+async def propose_sync(message: Message, state: FSMContext, resources: list[ResourceRow]):
+    plan = await executor.run(ingest.plan_sync, await Resource.select_rows(primary=True), resources)
+    logging.info(f"Сверка файла от chat_id {message.chat.id} с базой: {repr(plan)}")
+    if len(plan.conflicts) != 0:
+        await message.answer(f"Исправьте ошибки и попробуйте снова\r\n\r\n{plan.get_conflicts_text()}")
+        return
+    if plan.is_empty:
+        await state.clear()
+        await message.answer(chat.sync_nothing_changed_msg, reply_markup=ReplyKeyboardRemove())
+        return
+    await state.set_state(AddResourceFSM.confirm_sync)
+    await state.update_data(sync_plan=plan)
+    await message.answer(text=str(plan), reply_markup=APPLY_OR_CANCEL_KEYBOARD)
+
+
+@router.message(AddResourceFSM.confirm_sync)
+async def apply_sync(message: Message, state: FSMContext):
+    if message.text is None or message.text.strip() != APPLY_BTN:
+        await message.answer("Выберите, применить изменения или отменить")
+        return
+    plan: ingest.SyncPlan = (await state.get_data())["sync_plan"]
+    await state.clear()
+    changed = await Resource.apply_sync(
+        plan.inserts, plan.get_update_params(), [row.id for row in plan.removed], plan.versions)
+    if changed is None:
+        await message.answer(chat.sync_stale_msg, reply_markup=ReplyKeyboardRemove())
+        return
+    user_name = chat.get_username_str(message)
+    logging.info(f"Пользователь{user_name}с chat_id {message.chat.id} синхронизировал устройства с файлом: "
+                 f"{repr(plan)}")
+    await message.answer("Синхронизация применена!\r\n\r\n" + str(plan), reply_markup=ReplyKeyboardRemove())
+
+
 @router.message(AddResourceFSM.uploading, F.text)
 async def wrong_text(message: Message, state: FSMContext):
     if message.text.casefold() == "да":
@@ -6,6 +6,7 @@ from aiogram.types import Message, ReplyKeyboardRemove
 
 from filters import not_auth
 from helpers import checker, chat, tg
+from helpers.admins import roster
 from models import Visitor
 
 
@@ -49,10 +50,10 @@ async def confirm_login(message: Message, state: FSMContext):
         )
     elif text == "Подтвердить":
         user_email = (await state.get_data())["user_email"]
-        user = await Visitor.auth(user_email, message)
+        user = await Visitor.auth(user_email, message, roster.is_admin_email(user_email))
         await state.clear()
         await message.answer(
-            text=chat.auth_message(user.email, user.is_admin),
+            text=chat.auth_message(user.email, roster.is_admin(user)),
             reply_markup=ReplyKeyboardRemove()
         )
     else:
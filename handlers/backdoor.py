@@ -1,33 +1,56 @@
 import csv
 import logging
 import os
+import shutil
 from io import StringIO
 
-from aiogram import Router
-from aiogram.filters import Command
+from aiogram import F, Router
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import BufferedInputFile
-from aiogram.types import Message, FSInputFile, ReplyKeyboardRemove
+from aiogram.types import CallbackQuery, FSInputFile, Message, ReplyKeyboardRemove
 
 import models
-from helpers import chat, tg, checker
-from models import Visitor
+from helpers import chat, tg, checker, logs, log_index, metrics
+from helpers.admins import roster
+from helpers.documents import CachedExport, documents
+from helpers.executor import executor
+from helpers.scheduler import scheduler
+from models import ResourceRow, Visitor
 
 LOGS_FOLDER = os.path.join(os.curdir, "logs")
 CURRENT_LOG_NAME = "cashbox_zoo.log"
 LOG_PATH = os.path.join(LOGS_FOLDER, CURRENT_LOG_NAME)
 CANCEL_KEYBOARD = tg.get_reply_keyboard(["Отменить"])
+INFO_KEYBOARD = tg.get_reply_keyboard(
+    ["Последний лог", "Все логи", "Устройства в csv", "Изменить почту юзера", "Метрики", "Выйти"])
+ALL_LOGS_BTN = "Все записи"
+ERRORS_ONLY_BTN = "Только ошибки"
+LOGS_FILTER_KEYBOARD = tg.get_reply_keyboard([ALL_LOGS_BTN, ERRORS_ONLY_BTN, "Отменить"])
+DEVICES_CSV_HEADER = [
+    "Айди",
+    "Название",
+    "Категория",
+    "Артикул",
+    "Дата регистрации",
+    "Прошивка",
+    "Комментарий",
+    "Электронная почта",
+    "Место устройства",
+    "Дата возврата"
+]
 
 
 class BackdoorFSM(StatesGroup):
     choosing = State()
+    ask_logs_filter = State()
     ask_current_email = State()
     ask_new_email = State()
     confirm_updating = State()
 
 
 router = Router()
+devices_export = CachedExport()
 
 
 def get_db_files() -> list[str]:
@@ -47,62 +70,95 @@ def get_log_files() -> list[str]:
 @router.message(Command("info"))
 async def info_handler(message: Message, state: FSMContext) -> None:
     user = await Visitor.get_current(message.chat.id)
-    if not user.is_admin:
+    if not roster.is_admin(user):
         await message.answer(chat.not_found_msg)
         return
     await state.set_state(BackdoorFSM.choosing)
-    await message.answer(
-        text="Что хотите?",
-        reply_markup=tg.get_reply_keyboard(
-            ["Последний лог", "Все логи", "Устройства в csv", "Изменить почту юзера", "Выйти"])
-    )
+    await message.answer(text="Что хотите?", reply_markup=INFO_KEYBOARD)
+
 
+@router.message(Command("logs"))
+async def logs_search_handler(message: Message, state: FSMContext, command: CommandObject) -> None:
+    user = await Visitor.get_current(message.chat.id)
+    if not roster.is_admin(user):
+        await message.answer(chat.not_found_msg)
+        return
+    query = log_index.parse_query(command.args or "")
+    if query is None:
+        await message.answer(chat.logs_query_help_msg)
+        return
+    logging.info(f"Поиск по логам {repr(query)} для chat_id {message.chat.id}")
+    await state.update_data(logs_query=query)
+    await show_found_logs(message, query, 1)
+
+
+async def show_found_logs(message: Message, query: log_index.LogQuery, page: int,
+                          call: CallbackQuery | None = None) -> None:
+    file_names = await executor.run(get_log_files)
+    try:
+        lines = await executor.run(log_index.search_logs, LOGS_FOLDER, file_names, query, cancellable=True)
+    except FileNotFoundError as e:
+        # лог переименовали или удалили между индексацией и чтением строк: список файлов и индекс собираются заново
+        logging.info(f"Лог ротирован во время поиска: {e.filename}")
+        await message.answer(chat.logs_rotated_msg)
+        file_names = await executor.run(get_log_files)
+        lines = await executor.run(log_index.search_logs, LOGS_FOLDER, file_names, query, cancellable=True)
+    if len(lines) == 0:
+        await message.answer(chat.logs_not_found_msg)
+        return
+    text, keyboard = tg.get_notes_paginator(page, [f"{line}\r\n\r\n" for line in lines], "logs_page")
+    if not call:
+        await message.answer(text=text, reply_markup=keyboard)
+    else:
+        await call.message.edit_text(text=text, reply_markup=keyboard)
 
-async def get_devices_csv() -> StringIO:
-    resources = await models.Resource.get_all(1000)
-    first_row = [
-        "Айди",
-        "Название",
-        "Категория",
-        "Артикул",
-        "Дата регистрации",
-        "Прошивка",
-        "Комментарий",
-        "Электронная почта",
-        "Место устройства",
-        "Дата возврата"
-    ]
+
+@router.callback_query(F.data.startswith("logs_page"))
+async def logs_page_callback(call: CallbackQuery, state: FSMContext) -> None:
+    user = await Visitor.get_current(call.message.chat.id)
+    query = (await state.get_data()).get("logs_query")
+    if not roster.is_admin(user) or query is None:
+        await call.answer(chat.logs_query_expired_msg)
+        return
+    page_number = int(str(call.data).split()[1])
+    await show_found_logs(call.message, query, page_number, call)
+
+
+def encode_devices_csv(resources: list[ResourceRow]) -> bytes:
+    """Задача для пула: собирает выгрузку устройств и кодирует ее в cp1251 для excel"""
     text = StringIO()
-    csv.writer(text).writerow(first_row)
-    for resource in resources:
-        resource_scv = await resource.get_csv_value()
-        csv.writer(text).writerow(resource_scv)
-    text.seek(0)
-    return text
+    writer = csv.writer(text)
+    writer.writerow(DEVICES_CSV_HEADER)
+    writer.writerows(resource.get_csv_value() for resource in resources)
+    return text.getvalue().encode(encoding="cp1251")
+
+
+async def get_devices_csv() -> bytes:
+    resources = await models.Resource.select_rows()
+    return await executor.run(encode_devices_csv, resources)
 
 
 @router.message(BackdoorFSM.choosing)
 async def choosing_handler(message: Message, state: FSMContext) -> None:
     text = message.text.strip()
     if text == "Последний лог":
+        # текущий лог дописывается между запросами, поэтому file_id для него не сохраняется
         await message.reply_document(FSInputFile(LOG_PATH))
     elif text == "Все логи":
-        file_names = get_log_files()
-        if len(file_names) == 0:
-            logging.error("В папке не найдены логи!")
-        for file_name in file_names:
-            await message.reply_document(FSInputFile(file_name))
+        await state.set_state(BackdoorFSM.ask_logs_filter)
+        await message.answer(chat.ask_logs_filter_msg, reply_markup=LOGS_FILTER_KEYBOARD)
     elif text == "Устройства в csv":
-        text_file = await get_devices_csv()
-        file = text_file.read().encode(encoding="cp1251")
-        input_file = BufferedInputFile(file, "devices.csv")
-        await message.reply_document(input_file)
+        key = await models.Resource.get_inventory_version()
+        content, sha256 = await devices_export.get(key, get_devices_csv)
+        await documents.send_bytes(message, content, "devices.csv", sha256)
     elif text == "Изменить почту юзера":
         await state.set_state(BackdoorFSM.ask_current_email)
         await message.answer(
             text="Введите текущую почту пользователя в формате email@skbkontur.ru",
             reply_markup=CANCEL_KEYBOARD
         )
+    elif text == "Метрики":
+        await message.answer(f"{metrics.report()}\n{state.storage}\n{executor}\n{documents}\n{scheduler}")
     elif text == "Выйти":
         await state.clear()
         await message.answer("Вы вышли из режима info", reply_markup=ReplyKeyboardRemove())
@@ -110,6 +166,31 @@ async def choosing_handler(message: Message, state: FSMContext) -> None:
         await message.answer("Выберите из списка вариантов")
 
 
+@router.message(BackdoorFSM.ask_logs_filter)
+async def ask_logs_filter_handler(message: Message, state: FSMContext) -> None:
+    text = message.text.strip() if message.text else ""
+    log_filter = logs.parse_log_filter("error" if text == ERRORS_ONLY_BTN else text.replace(ALL_LOGS_BTN, ""))
+    if log_filter is None:
+        await message.answer(chat.wrong_logs_filter_msg, reply_markup=LOGS_FILTER_KEYBOARD)
+        return
+    await state.set_state(BackdoorFSM.choosing)
+    file_names = await executor.run(get_log_files)
+    if len(file_names) == 0:
+        logging.error("В папке не найдены логи!")
+    directory, archives = await executor.run(logs.build_archives, file_names, log_filter, cancellable=True)
+    try:
+        if len(archives) == 0:
+            await message.answer(chat.logs_not_found_msg, reply_markup=INFO_KEYBOARD)
+            return
+        for number, path in enumerate(archives, 1):
+            file_name = "logs.zip" if len(archives) == 1 else f"logs_{number}_of_{len(archives)}.zip"
+            # архивы собираются заново на каждый запрос и не совпадают побайтно, file_id для них не сохраняется
+            await message.reply_document(FSInputFile(path, filename=file_name))
+        await message.answer(f"Логи: {log_filter}", reply_markup=INFO_KEYBOARD)
+    finally:
+        await executor.run(shutil.rmtree, directory, True)
+
+
 @router.message(BackdoorFSM.ask_current_email)
 async def ask_current_email_handler(message: Message, state: FSMContext):
     current_email = message.text.strip().lower()
@@ -119,7 +200,7 @@ async def ask_current_email_handler(message: Message, state: FSMContext):
             reply_markup=CANCEL_KEYBOARD
         )
         return
-    visitors = await Visitor.get_by_primary(current_email)
+    visitors = await Visitor.get_by_primary(current_email, primary=True)
     if len(visitors) == 0:
         await message.answer(
             text="Не найден пользователь с такой почтой. Укажите другую почту",
@@ -143,7 +224,7 @@ async def ask_new_email_handler(message: Message, state: FSMContext):
             reply_markup=CANCEL_KEYBOARD
         )
         return
-    visitors = await Visitor.get_by_primary(new_email)
+    visitors = await Visitor.get_by_primary(new_email, primary=True)
     if len(visitors) != 0:
         await message.answer(
             text="Пользователь с такой почтой уже есть. Укажите другую почту",
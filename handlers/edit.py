@@ -6,6 +6,7 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, ReplyKeyboardRemove
 
 from helpers import db, tg, checker, chat
+from middlewares.commands import IdCommand
 from models import Resource, Record
 
 SKIP_BTN = "Пропустить"
@@ -46,7 +47,7 @@ async def escape_editing(message: Message, state: FSMContext):
     note = ""
     if "resource_id" in data.keys():
         resource_id = data["resource_id"]
-        resource = await Resource.get_single(resource_id)
+        resource = await Resource.get_single(resource_id, primary=True)
         note = await db.format_note(resource, message.chat.id)
     await state.clear()
     await message.answer(
@@ -63,7 +64,7 @@ async def stop_editing_handler(message: Message, state: FSMContext):
 @router.message(F.text.lower().startswith("вернуться"))
 async def cancel_handler(message: Message, state: FSMContext):
     resource_id = (await state.get_data())["resource_id"]
-    resource = await Resource.get_single(resource_id)
+    resource = await Resource.get_single(resource_id, primary=True)
     await state.set_state(EditFSM.choosing)
     note = await db.format_note(resource, message.chat.id)
     await message.answer(
@@ -72,13 +73,12 @@ async def cancel_handler(message: Message, state: FSMContext):
     )
 
 
-@router.message(F.text.regexp(r"\/edit.+"))
-async def edit_resource_handler(message: Message, state: FSMContext):
+@router.message(IdCommand("edit"))
+async def edit_resource_handler(message: Message, state: FSMContext, resource_id: int):
     if not await checker.is_admin(message.chat.id):
         await message.answer(chat.not_admin_error_msg)
         return
-    resource_id = int(message.text.removeprefix("/edit"))
-    resource = await Resource.get_single(resource_id)
+    resource = await Resource.get_single(resource_id, primary=True)
     buttons = buttons_for_edit(not resource.user_email)
     await state.set_state(EditFSM.choosing)
     await state.update_data(resource_id=resource_id)
@@ -158,8 +158,8 @@ async def confirm_free_handler(message: Message, state: FSMContext):
     text = message.text.strip()
     resource_id = (await state.get_data())["resource_id"]
     if text == CONFIRM_BTN:
-        resource = await Resource.get_single(resource_id)
-        await db.return_resource(resource_id)
+        resource = await Resource.get_single(resource_id, primary=True)
+        await db.return_resource(resource)
         logging.info(
             f"Админ{chat.get_username_str(message)}с chat_id {message.chat.id} списал "
             f"с пользователя устройство {repr(resource)}")
@@ -181,15 +181,14 @@ async def confirm_delete_handler(message: Message, state: FSMContext):
     text = message.text.strip()
     resource_id = (await state.get_data())["resource_id"]
     if text == CONFIRM_BTN:
-        resource: Resource = await Resource.get_single(resource_id)
-        if resource.user_email:
+        resource = await Resource.delete(resource_id, only_free=True)
+        if not resource:
             await message.answer(
                 text=chat.delete_taken_error_msg,
                 reply_markup=ReplyKeyboardRemove()
             )
             await state.clear()
             return
-        await Resource.delete(resource_id)
         logging.info(
             f"Админ{chat.get_username_str(message)}с chat_id {message.chat.id} удалил "
             f"устройство {repr(resource)}")
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from aiogram import F, Router
+from aiogram.types import CallbackQuery, Message
+
+from helpers import chat, checker, tg
+from middlewares.commands import IdCommand, ParsedCommand
+from models import Event, HISTORY_PAGE_SIZE
+
+# время последнего события на странице едет в callback_data целиком, до микросекунд: лимит Телеграма - 64 байта
+CURSOR_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+router = Router()
+
+
+@router.message(IdCommand("history"))
+async def history_handler(message: Message, resource_id: int, parsed_command: ParsedCommand):
+    if not await checker.is_admin(message.chat.id):
+        await message.answer(chat.not_admin_error_msg)
+        return
+    if parsed_command.args:
+        await show_holders(message, resource_id, parsed_command.args)
+        return
+    await show_history(message, resource_id)
+
+
+async def show_holders(message: Message, resource_id: int, text: str):
+    period = checker.parse_period(text)
+    if period is None:
+        await message.answer(chat.history_wrong_period_msg)
+        return
+    start, end = period
+    holders = await Event.get_holders(resource_id, start, end)
+    first_day, last_day = start.strftime(r"%d.%m.%Y"), (end - timedelta(days=1)).strftime(r"%d.%m.%Y")
+    period_text = first_day if first_day == last_day else f"с {first_day} по {last_day}"
+    await message.answer(chat.history_holders_message(resource_id, period_text, holders))
+
+
+async def show_history(message: Message, resource_id: int, before: tuple[datetime, int] | None = None,
+                       call: CallbackQuery | None = None):
+    """Страницы идут от новых событий к старым, следующая начинается после последнего события текущей"""
+    events = await Event.get_page(resource_id, before)
+    if len(events) == 0:
+        if call:
+            await call.answer(chat.history_end_msg)
+        else:
+            await message.answer(chat.history_empty_msg)
+        return
+    text = f"История устройства {resource_id}:\r\n\r\n" + "\r\n".join(str(event) for event in events)
+    keyboard = None
+    if len(events) == HISTORY_PAGE_SIZE:
+        cursor = f"{resource_id} {events[-1].id} {events[-1].time.strftime(CURSOR_TIME_FORMAT)}"
+        keyboard = tg.get_inline_keyboard([cursor], "history", {cursor: "Раньше"})
+    if not call:
+        await message.answer(text=text, reply_markup=keyboard)
+    else:
+        await call.message.edit_text(text=text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("history"))
+async def history_callback(call: CallbackQuery):
+    if not await checker.is_admin(call.message.chat.id):
+        await call.answer(chat.not_admin_error_msg)
+        return
+    _, resource_id, before_id, before_time = str(call.data).split()
+    before = (datetime.strptime(before_time, CURSOR_TIME_FORMAT), int(before_id))
+    await show_history(call.message, int(resource_id), before, call)
@@ -0,0 +1,20 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from helpers import chat, checker, overdue
+
+router = Router()
+
+
+@router.message(Command("overdue"))
+async def overdue_handler(message: Message):
+    if not await checker.is_admin(message.chat.id):
+        await message.answer(chat.not_admin_error_msg)
+        return
+    messages = await overdue.get_overdue_messages()
+    if len(messages) == 0:
+        await message.answer(chat.overdue_empty_msg)
+        return
+    for text in messages:
+        await message.answer(text)
@@ -3,7 +3,10 @@ from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
 
 from helpers import db, tg, chat
-from models import Resource, Visitor
+from helpers.admins import roster
+from helpers.catalog import catalog
+from helpers.inventory import inventory
+from models import Resource, ResourceRow, Visitor
 
 router = Router()
 
@@ -12,7 +15,7 @@ router = Router()
 async def welcome_handler(message: Message, command: CommandObject):
     """Обрабатывает команду start. Если она с параметром (?start=something), то сразу ищет по ресурсам"""
     if command.args:
-        resources = await Resource.search(command.args.strip())
+        resources = await inventory.search(command.args.strip())
         if len(resources) == 0:
             await message.answer(chat.not_found_msg)
         else:
@@ -28,7 +31,7 @@ async def help_handler(message: Message):
 
 async def welcome(message: Message):
     user: Visitor = await Visitor.get_current(message.chat.id)
-    if not user.is_admin:
+    if not roster.is_admin(user):
         await message.answer(chat.welcome_msg)
     else:
         await message.answer(chat.admin_welcome_msg)
@@ -39,16 +42,14 @@ async def show_keyboard(message: Message):
     await search_resource(message, 1)
 
 
-async def search_resource(message: Message, page: int, resources: list[Resource] = None, call: CallbackQuery = None):
+async def search_resource(message: Message, page: int, resources: list[Resource | ResourceRow] = None,
+                          call: CallbackQuery = None):
     if not resources:
-        resources = await Resource.get_all()
+        resources = await inventory.all()
     if len(resources) == 0:
         await message.answer(chat.not_found_msg)
         return
-    paginator = tg.Paginator(page, resources)
-    keyboard = paginator.create_keyboard("search_resource")
-    notes = await db.format_notes(paginator.get_objects_on_page(), message.chat.id)
-    text = paginator.result_message() + notes
+    text, keyboard = await tg.get_standard_paginator(page, resources, "search_resource", message.chat.id)
     if not call:
         await message.answer(text=text, reply_markup=keyboard)
     else:
@@ -73,10 +74,7 @@ async def get_wishlist(message: Message, page: int, call: CallbackQuery | None =
     if len(resources) == 0:
         await message.answer(chat.empty_wishlist)
         return
-    paginator = tg.Paginator(page, resources)
-    keyboard = paginator.create_keyboard("wishlist")
-    notes = await db.format_notes(paginator.get_objects_on_page(), message.chat.id)
-    text = paginator.result_message() + notes
+    text, keyboard = await tg.get_standard_paginator(page, resources, "wishlist", message.chat.id)
     if not call:
         await message.answer(text=text, reply_markup=keyboard)
     else:
@@ -97,14 +95,11 @@ async def get_mine_resources_handler(message: Message):
 
 async def get_mine_resources(message: Message, page: int, call: CallbackQuery | None = None):
     user = await Visitor.get_current(message.chat.id)
-    resources = await Resource.get_resources_taken_by_user(user)
+    resources = await inventory.taken_by(user.email)
     if len(resources) == 0:
         await message.answer(chat.user_have_no_device_msg)
         return
-    paginator = tg.Paginator(page, resources)
-    keyboard = paginator.create_keyboard("mine")
-    notes = await db.format_notes(paginator.get_objects_on_page(), message.chat.id)
-    text = paginator.result_message() + notes
+    text, keyboard = await tg.get_standard_paginator(page, resources, "mine", message.chat.id)
     if not call:
         await message.answer(text=text, reply_markup=keyboard)
     else:
@@ -120,19 +115,19 @@ async def mine_callback(call: CallbackQuery):
 
 @router.message(Command("categories"))
 async def get_categories_handler(message: Message):
-    active_categories = await Resource.get_categories()
-    if len(active_categories) == 0:
+    labels = await catalog.labels()
+    if len(labels) == 0:
         await message.answer("Не найдена ни одна категория")
         return
     await message.answer(
-        text=chat.ask_category_msg,
-        reply_markup=tg.get_inline_keyboard(active_categories, "categories"))
+        text=chat.ask_category_with_counts_msg,
+        reply_markup=tg.get_inline_keyboard(list(labels.keys()), "categories", labels))
 
 
 @router.callback_query(F.data.startswith("categories"))
 async def category_callback(call: CallbackQuery):
-    category = str(call.data).split()[1]
-    resources = await Resource.get({"category_name": category})
+    category = str(call.data).split(maxsplit=1)[1]
+    resources = await inventory.in_category(category)
     await call.answer()
     await search_resource(call.message, 1, resources)
 
@@ -143,7 +138,7 @@ async def message_reply(message: Message):
     if text is None or text == "":
         await welcome_handler(message)
     else:
-        resources = await Resource.search(text)
+        resources = await inventory.search(text)
         if len(resources) == 0:
             await message.answer(chat.not_found_msg)
         else:
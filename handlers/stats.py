@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+from aiogram import F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, Message
+
+from helpers import analytics, chat, checker, tg
+from helpers.documents import documents
+from helpers.executor import executor
+from helpers.inventory import inventory
+from models import RollupWatermark, UsageCategoryDay, UsageDeviceDay
+
+CALLBACK_DAY_FORMAT = "%Y%m%d"
+
+router = Router()
+
+
+@router.message(Command("stats"))
+async def stats_handler(message: Message, command: CommandObject):
+    if not await checker.is_admin(message.chat.id):
+        await message.answer(chat.not_admin_error_msg)
+        return
+    watermark = await RollupWatermark.get_day(analytics.ROLLUP_NAME)
+    if watermark is None:
+        await message.answer(chat.stats_not_ready_msg)
+        return
+    end = watermark + timedelta(days=1)
+    start = end - timedelta(days=analytics.STATS_DAYS)
+    if command.args:
+        period = checker.parse_period(command.args)
+        if period is None:
+            await message.answer(chat.stats_wrong_period_msg)
+            return
+        start, end = period[0].date(), min(period[1].date(), end)
+        if start >= end:
+            await message.answer(chat.stats_not_ready_msg)
+            return
+    category_totals = await UsageCategoryDay.get_totals(start, end)
+    device_totals = await UsageDeviceDay.get_totals(start, end)
+    used = {row[0] for row in device_totals if row[2] > 0}
+    unused: dict[str, list[int]] = {}
+    for resource in await inventory.all():
+        if resource.id not in used:
+            unused.setdefault(resource.category_name, []).append(resource.id)
+    text = analytics.stats_report(start, end, category_totals, await inventory.category_counts(), unused)
+    cursor = f"{start.strftime(CALLBACK_DAY_FORMAT)} {end.strftime(CALLBACK_DAY_FORMAT)}"
+    await message.answer(text, reply_markup=tg.get_inline_keyboard([cursor], "stats_csv", {cursor: "Выгрузить в csv"}))
+
+
+@router.callback_query(F.data.startswith("stats_csv"))
+async def stats_csv_callback(call: CallbackQuery):
+    if not await checker.is_admin(call.message.chat.id):
+        await call.answer(chat.not_admin_error_msg)
+        return
+    start, end = (datetime.strptime(day, CALLBACK_DAY_FORMAT).date() for day in str(call.data).split()[1:])
+    content = await executor.run(analytics.encode_stats_csv, start, end, await inventory.all(),
+                                 await UsageDeviceDay.get_totals(start, end))
+    await call.answer()
+    file_name = f"stats_{start.isoformat()}_{(end - timedelta(days=1)).isoformat()}.csv"
+    await documents.send_bytes(call.message, content, file_name)
@@ -1,11 +1,12 @@
 import logging
 
-from aiogram import F, Router
+from aiogram import Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, ReplyKeyboardRemove
 
 from helpers import checker, tg, chat
+from middlewares.commands import IdCommand
 from models import Resource, Visitor, Record, ActionType
 
 
@@ -18,10 +19,9 @@ class TakeFSM(StatesGroup):
 router = Router()
 
 
-@router.message(F.text.regexp(r"\/update_address.+"))
-async def update_address_handler(message: Message, state: FSMContext):
-    resource_id = int(message.text.removeprefix("/update_address"))
-    resource: Resource = await Resource.get_single(resource_id)
+@router.message(IdCommand("update_address"))
+async def update_address_handler(message: Message, state: FSMContext, resource_id: int):
+    resource: Resource = await Resource.get_single(resource_id, primary=True)
     visitor = await Visitor.get_current(message.chat.id)
     if resource.user_email != visitor.email:
         await message.answer(chat.update_address_others_resource_msg)
@@ -31,14 +31,13 @@ async def update_address_handler(message: Message, state: FSMContext):
     await state.set_state(TakeFSM.choosing_address)
 
 
-@router.message(F.text.regexp(r"\/take.+"))
-async def take_resource_handler(message: Message, state: FSMContext):
-    resource_id = int(message.text.removeprefix("/take"))
+@router.message(IdCommand("take"))
+async def take_resource_handler(message: Message, state: FSMContext, resource_id: int):
     await take_resource(message, state, resource_id)
 
 
 async def take_resource(message: Message, state: FSMContext, resource_id: int):
-    resource: Resource = await Resource.get_single(resource_id)
+    resource: Resource = await Resource.get_single(resource_id, primary=True)
     if not resource:
         await message.answer(chat.take_nonnexisted_error_msg)
         return
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+import os
+
+from models import Visitor
+
+CONFIG_PATH = "config.json"
+ADMINS_POLL_SECONDS = 10
+
+
+class AdminRoster:
+    """
+    Список админов из config.json. Файл читается один раз и перечитывается в отдельном потоке, когда меняется
+    время его изменения. После каждого изменения списка флаг visitor.is_admin выравнивается одним UPDATE.
+    Проверка прав - поиск почты в памяти
+    """
+
+    def __repr__(self):
+        return f"AdminRoster(path={self.path}, emails={sorted(self._emails)})"
+
+    def __init__(self, path: str = CONFIG_PATH, poll_interval: float = ADMINS_POLL_SECONDS):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._emails: frozenset[str] = frozenset()
+        self._mtime: float | None = None
+        self._synced_emails: frozenset[str] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def emails(self) -> frozenset[str]:
+        """Без обращения к файлу: до start() список пуст, файл читают только start() и _watch в отдельном потоке"""
+        return self._emails
+
+    def is_admin_email(self, email: str) -> bool:
+        return email in self.emails
+
+    def is_admin(self, user: Visitor | None) -> bool:
+        return user is not None and self.is_admin_email(user.email)
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает файл, если он изменился. Возвращает True, если поменялся список админов"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logging.error(f"Не удалось прочитать список админов из {self.path}: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+        # время запоминается и для испорченного файла: его перечитают, только когда файл снова изменят
+        self._mtime = mtime
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                emails = frozenset(email.strip().lower() for email in json.loads(file.read())["admins"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.error(f"В {self.path} некорректный список админов, оставляем прежний: {e!r}")
+            return False
+        if emails == self._emails:
+            return False
+        logging.info(f"Список админов обновлен: {sorted(emails)}")
+        self._emails = emails
+        return True
+
+    async def sync_visitors(self) -> None:
+        emails = self._emails
+        changed = await Visitor.sync_admins(emails)
+        self._synced_emails = emails
+        if len(changed) != 0:
+            logging.info(f"Обновлен флаг is_admin у пользователей: {changed}")
+
+    async def start(self) -> None:
+        """Читает список, выравнивает флаги в базе и запускает фоновое слежение за файлом"""
+        await asyncio.to_thread(self.reload_if_changed)
+        await self.sync_visitors()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+                if self._emails != self._synced_emails:
+                    await self.sync_visitors()
+            except Exception:
+                logging.exception("Не удалось применить новый список админов")
+
+
+roster = AdminRoster()
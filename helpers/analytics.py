@@ -0,0 +1,180 @@
+import csv
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from io import StringIO
+from typing import Iterable, Iterator
+
+from helpers.executor import executor
+from models import (
+    USAGE_COUNTERS, Event, EventType, QueueWait, Resource, ResourceRow, RollupWatermark, UsageDeviceDay
+)
+
+# первый запуск считает сводки за последние ROLLUP_BACKFILL_DAYS дней: они еще в горячих партициях журнала
+ROLLUP_BACKFILL_DAYS = 60
+# долгий простой бота досчитывается кусками, чтобы не держать в памяти весь журнал
+ROLLUP_CHUNK_DAYS = 31
+ROLLUP_NAME = UsageDeviceDay.__tablename__
+STATS_DAYS = 30
+# остальные неиспользуемые устройства есть в выгрузке csv
+STATS_UNUSED_LIMIT = 20
+DAY_SECONDS = 24 * 60 * 60
+STATS_CSV_HEADER = [
+    "Айди",
+    "Название",
+    "Категория",
+    "Дней у пользователей",
+    "Занято, %",
+    "Сколько раз взяли",
+    "Вставали в очередь",
+    "Дождались",
+    "Среднее ожидание, ч",
+    "Средняя очередь"
+]
+
+
+def to_datetime(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def split_by_days(start: datetime, end: datetime, first_day: date, end_day: date) -> Iterator[tuple[date, float]]:
+    """(день, секунды) для частей интервала, которые попадают в дни с first_day до end_day, не включая end_day"""
+    start, end = max(start, to_datetime(first_day)), min(end, to_datetime(end_day))
+    while start < end:
+        part_end = min(end, to_datetime(start.date() + timedelta(days=1)))
+        yield start.date(), (part_end - start).total_seconds()
+        start = part_end
+
+
+def get_held_intervals(events: Iterable[tuple], compacted: Iterable[tuple],
+                       until: datetime) -> list[tuple[int, datetime, datetime]]:
+    """
+    (устройство, взяли, вернули) из событий журнала, упорядоченных по времени, и свернутых пар holding.
+    Устройства, которые еще не вернули, считаются занятыми до until
+    """
+    intervals = [(resource_id, taken_at, returned_at) for resource_id, taken_at, returned_at in compacted]
+    taken: dict[int, datetime] = {}
+    for resource_id, _, event_type, time in events:
+        if event_type == EventType.TAKE:
+            taken.setdefault(resource_id, time)
+        elif resource_id in taken:
+            intervals.append((resource_id, taken.pop(resource_id), time))
+    intervals.extend((resource_id, taken_at, until) for resource_id, taken_at in taken.items())
+    return intervals
+
+
+def rollup_days(first_day: date, end_day: date, events: list[tuple], compacted: list[tuple], waits: list[tuple],
+                categories: dict[int, str]) -> tuple[list[dict], list[dict]]:
+    """
+    Дневные сводки по устройствам и категориям за дни с first_day до end_day, не включая end_day.
+    events и compacted - как в Event.get_held, waits - как в QueueWait.get_overlapping, categories - категории
+    устройств по айди. В сводки попадают только дни, в которые с устройством что-то происходило
+    """
+    until = to_datetime(end_day)
+    devices: dict[tuple[date, int], Counter] = defaultdict(Counter)
+    for resource_id, taken_at, returned_at in get_held_intervals(events, compacted, until):
+        for day, seconds in split_by_days(taken_at, returned_at, first_day, end_day):
+            devices[day, resource_id]["held_seconds"] += seconds
+        if first_day <= taken_at.date() < end_day:
+            devices[taken_at.date(), resource_id]["takes"] += 1
+    for resource_id, queued_at, left_at, served in waits:
+        for day, seconds in split_by_days(queued_at, left_at or until, first_day, end_day):
+            devices[day, resource_id]["queue_seconds"] += seconds
+        if first_day <= queued_at.date() < end_day:
+            devices[queued_at.date(), resource_id]["queued"] += 1
+        if served and left_at is not None and first_day <= left_at.date() < end_day:
+            devices[left_at.date(), resource_id]["served"] += 1
+            devices[left_at.date(), resource_id]["wait_seconds"] += (left_at - queued_at).total_seconds()
+
+    device_rows = []
+    category_counters: dict[tuple[date, str], Counter] = defaultdict(Counter)
+    for (day, resource_id), counter in sorted(devices.items()):
+        category_name = categories.get(resource_id)
+        device_rows.append({"day": day, "resource_id": resource_id, "category_name": category_name,
+                            **{name: round(counter[name]) for name in USAGE_COUNTERS}})
+        if category_name is not None:
+            category_counters[day, category_name].update(counter)
+            category_counters[day, category_name]["devices"] += counter["held_seconds"] > 0
+    category_rows = [
+        {"day": day, "category_name": category_name, "devices": counter["devices"],
+         **{name: round(counter[name]) for name in USAGE_COUNTERS}}
+        for (day, category_name), counter in sorted(category_counters.items())
+    ]
+    return device_rows, category_rows
+
+
+async def run_rollup(today: date | None = None) -> int:
+    """
+    Задача планировщика: досчитывает сводки за дни после водяного знака по вчерашний включительно.
+    Возвращает число посчитанных дней
+    """
+    today = today or date.today()
+    watermark = await RollupWatermark.get_day(ROLLUP_NAME)
+    first_day = today - timedelta(days=ROLLUP_BACKFILL_DAYS) if watermark is None else watermark + timedelta(days=1)
+    categories = {row.id: row.category_name for row in await Resource.select_rows(primary=True)}
+    days = 0
+    while first_day < today:
+        end_day = min(today, first_day + timedelta(days=ROLLUP_CHUNK_DAYS))
+        start, end = to_datetime(first_day), to_datetime(end_day)
+        events, compacted = await Event.get_held(start, end)
+        waits = await QueueWait.get_overlapping(start, end)
+        device_rows, category_rows = await executor.run(
+            rollup_days, first_day, end_day, events, compacted, waits, categories)
+        await UsageDeviceDay.save_days(first_day, end_day - timedelta(days=1), device_rows, category_rows)
+        days += (end_day - first_day).days
+        first_day = end_day
+    if days != 0:
+        logging.info(f"Посчитаны сводки использования устройств за {days} дн. по {today - timedelta(days=1)}")
+    return days
+
+
+def format_hours(seconds: float) -> str:
+    hours = seconds / 3600
+    return f"{hours:.1f} ч" if hours < 48 else f"{hours / 24:.1f} дн"
+
+
+def stats_report(start: date, end: date, category_totals: list[tuple], category_counts: list[tuple[str, int, int]],
+                 unused: dict[str, list[int]]) -> str:
+    """
+    Текст /stats. category_totals - как в UsageCategoryDay.get_totals, category_counts - как в
+    Inventory.category_counts, unused - айди устройств, которые за период ни разу не брали, по категориям
+    """
+    period_seconds = (end - start).days * DAY_SECONDS
+    totals = {row[0]: dict(zip(USAGE_COUNTERS, row[1:])) for row in category_totals}
+    lines = [f"Использование устройств с {start.strftime(r'%d.%m.%Y')} "
+             f"по {(end - timedelta(days=1)).strftime(r'%d.%m.%Y')}:", ""]
+    for category_name, _, total in category_counts:
+        counters = totals.get(category_name, dict.fromkeys(USAGE_COUNTERS, 0))
+        busy = counters["held_seconds"] / (total * period_seconds) if total and period_seconds else 0
+        line = f"{category_name}: занято {busy:.0%} времени, выдач {counters['takes']}"
+        if counters["queued"] or counters["queue_seconds"]:
+            line += f", в очереди в среднем {counters['queue_seconds'] / period_seconds:.1f} чел., " \
+                    f"вставали {counters['queued']}, дождались {counters['served']}"
+            if counters["served"]:
+                line += f" в среднем за {format_hours(counters['wait_seconds'] / counters['served'])}"
+        lines.append(line)
+        if unused.get(category_name):
+            ids = ", ".join(str(resource_id) for resource_id in unused[category_name][:STATS_UNUSED_LIMIT])
+            if len(unused[category_name]) > STATS_UNUSED_LIMIT:
+                ids += ", ..."
+            lines.append(f"Ни разу не брали {len(unused[category_name])} из {total}: {ids}")
+    return "\r\n".join(lines)
+
+
+def encode_stats_csv(start: date, end: date, resources: list[ResourceRow], device_totals: list[tuple]) -> bytes:
+    """Задача для пула: строка на каждое устройство из инвентаря, в том числе на те, которые за период не брали"""
+    period_seconds = (end - start).days * DAY_SECONDS
+    totals = {row[0]: dict(zip(USAGE_COUNTERS, row[2:])) for row in device_totals}
+    text = StringIO()
+    writer = csv.writer(text)
+    writer.writerow(STATS_CSV_HEADER)
+    for resource in resources:
+        counters = totals.get(resource.id, dict.fromkeys(USAGE_COUNTERS, 0))
+        average_wait = counters["wait_seconds"] / counters["served"] / 3600 if counters["served"] else 0
+        writer.writerow([
+            resource.id, resource.name, resource.category_name,
+            f"{counters['held_seconds'] / DAY_SECONDS:.1f}", f"{100 * counters['held_seconds'] / period_seconds:.0f}",
+            counters["takes"], counters["queued"], counters["served"], f"{average_wait:.1f}",
+            f"{counters['queue_seconds'] / period_seconds:.2f}"
+        ])
+    return text.getvalue().encode(encoding="cp1251")
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from time import monotonic
+
+from sqlalchemy import select
+
+from helpers.changefeed import changefeed
+from helpers.inventory import inventory
+from models import Category, get_engine
+
+CATALOG_REFRESH_SECONDS = 60
+
+
+class CategoryCatalog:
+    """
+    Справочник категорий из таблицы category. Читается из базы один раз и заново - по уведомлению changefeed
+    об изменении category, а пока подписка не работает, раз в refresh_interval секунд.
+    Счетчики свободных и занятых устройств по категориям ведет инвентарь
+    """
+
+    def __repr__(self):
+        return f"CategoryCatalog(names={sorted(self.names)}, loaded={self.loaded})"
+
+    def __init__(self, refresh_interval: float = CATALOG_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.names: frozenset[str] = frozenset()
+        self.loaded = False
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self.loaded and (changefeed.connected or monotonic() - self._loaded_at < self.refresh_interval)
+
+    async def ensure_loaded(self) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if not self._is_fresh():
+                await self.load()
+
+    async def load(self) -> None:
+        async with get_engine().connect() as conn:
+            self.names = frozenset((await conn.execute(select(Category.name))).scalars().all())
+        self._loaded_at = monotonic()
+        self.loaded = True
+        logging.info(f"Загружен справочник категорий: {len(self.names)}")
+
+    def invalidate(self, *_) -> None:
+        self.loaded = False
+
+    async def contains(self, category_name: str) -> bool:
+        await self.ensure_loaded()
+        return category_name in self.names
+
+    async def all(self) -> list[str]:
+        await self.ensure_loaded()
+        return sorted(self.names)
+
+    @staticmethod
+    async def labels() -> dict[str, str]:
+        """Подписи кнопок вида "ККТ (12/30)": свободно из всего. Только категории, в которых есть устройства"""
+        return {name: f"{name} ({free}/{total})" for name, free, total in await inventory.category_counts()}
+
+
+catalog = CategoryCatalog()
+changefeed.subscribe("category", catalog.invalidate)
+changefeed.on_resync(catalog.invalidate)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+from typing import Callable
+
+import asyncpg
+
+from models import VISITOR_CACHE_SECONDS, get_database_url, visitor_cache
+
+CHANNEL = "zoo_changes"
+KEEPALIVE_SECONDS = 30
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 60
+
+ChangeCallback = Callable[[str, str], None]
+ResyncCallback = Callable[[], None]
+
+
+class ChangeFeed:
+    """
+    Подписка на уведомления, которые триггеры из миграции 0003 шлют при изменении resource, visitor, record и category.
+    Пока подписка активна, кэши процесса обновляются по уведомлениям, в том числе от других реплик бота.
+    Уведомления, пришедшие во время разрыва соединения, теряются, поэтому после каждого подключения
+    вызываются обработчики полной пересинхронизации
+    """
+
+    def __repr__(self):
+        return f"ChangeFeed(connected={self.connected}, " \
+               f"tables={sorted(self._subscribers)}, " \
+               f"received={self.received})"
+
+    def __init__(self):
+        self.connected = False
+        self.received = 0
+        self._subscribers: dict[str, list[ChangeCallback]] = {}
+        self._resync_callbacks: list[ResyncCallback] = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, table: str, callback: ChangeCallback) -> None:
+        """callback(op, key) вызывается на каждое изменение строки: op - INSERT, UPDATE или DELETE, key - ключ строки"""
+        self._subscribers.setdefault(table, []).append(callback)
+
+    def on_resync(self, callback: ResyncCallback) -> None:
+        self._resync_callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.connected:
+                    delay = RECONNECT_MIN_SECONDS
+                logging.warning(f"Подписка на изменения в базе прервана: {e!r}, переподключение через {delay}с")
+            finally:
+                self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def _listen(self) -> None:
+        dsn = get_database_url().replace("postgresql+asyncpg://", "postgresql://", 1)
+        connection = await asyncpg.connect(dsn)
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        try:
+            await connection.add_listener(CHANNEL, self._on_notification)
+            self._set_connected(True)
+            self._resync()
+            logging.info("Подписка на изменения в базе активна")
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    await connection.execute("SELECT 1", timeout=KEEPALIVE_SECONDS)
+            raise ConnectionError("соединение закрыто сервером")
+        finally:
+            if not connection.is_closed():
+                await connection.close(timeout=5)
+
+    def _set_connected(self, connected: bool) -> None:
+        if self.connected == connected:
+            return
+        self.connected = connected
+        visitor_cache.ttl = None if connected else VISITOR_CACHE_SECONDS
+        if not connected:
+            self._resync()
+
+    def _resync(self) -> None:
+        for callback in self._resync_callbacks:
+            callback()
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        self.received += 1
+        try:
+            change = json.loads(payload)
+            callbacks = self._subscribers.get(change["table"], [])
+            for callback in callbacks:
+                callback(change["op"], change["key"])
+        except Exception:
+            logging.exception(f"Не удалось обработать уведомление об изменении: {payload}")
+
+
+changefeed = ChangeFeed()
+changefeed.subscribe("visitor", lambda op, key: visitor_cache.forget_email(key))
+changefeed.on_resync(visitor_cache.clear)
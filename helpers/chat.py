@@ -48,7 +48,11 @@ welcome_msg = "Добро пожаловать в бот кассового зо
 admin_welcome_msg = "Вы смотритель кассового зоопарка, поэтому вам доступны " \
                     "две дополнительных команды, скрытых из меню:\r\n" \
                     "/add - для добавления устройств\r\n" \
-                    "/info - для скачивания логов\r\n\r\n" \
+                    "/info - для скачивания логов\r\n" \
+                    "/logs - поиск по логам\r\n" \
+                    "/history<айди> - кто и когда брал устройство\r\n" \
+                    "/stats - какие устройства простаивают и за какими стоят очереди\r\n" \
+                    "/overdue - устройства, которые не вернули в срок\r\n\r\n" \
                     "Также вы можете написать рабочую почту пользователя и увидеть, какие он взял устройства"
 
 
@@ -60,6 +64,8 @@ def auth_message(user_email: str, is_admin: bool) -> str:
 delete_success_msg = "Вы успешно удалили устройство"
 edit_success_msg = "Вы отредактировали запись"
 cancel_msg = "Вы отменили действие"
+throttled_msg = "Слишком много запросов подряд, подождите пару секунд"
+dialog_expired_msg = "Вы давно не отвечали, поэтому мы сбросили незавершенное действие. Начните его заново"
 
 not_auth_msg = "Чтобы авторизоваться, ведите адрес своей контуровской почты в формате email@skbkontur.ru"
 ask_confirm_auth = "Подтвердите, что это ваш адрес: изменить его в будущем не получится.\r\n" \
@@ -71,6 +77,7 @@ ask_id = "Укажите id, которое написано на устройс
 ask_vendor_code_msg = "Укажите артикул устройства"
 ask_name_msg = "Напишите название устройства. Например, MSPOS-N"
 ask_category_msg = "Выберите категорию из списка ниже"
+ask_category_with_counts_msg = "Выберите категорию из списка ниже. В скобках - сколько устройств свободно из всех"
 ask_email_msg = "Напишите email пользователя, у которого сейчас устройство, в формате email@skbkontur.ru"
 ask_address_msg = "Где пользователь хранит устройство? Например, дома у Пети"
 ask_return_date_msg = "Когда пользователь вернет устройство? Напишите примерную дату, например, 23.11.2024"
@@ -78,12 +85,44 @@ ask_reg_date_msg = "Введите дату регистрации устрой
 ask_firmware_msg = "Укажите, какая прошивка на устройстве? Например: Прошивка 5.8.100, ДТО 10.9.0.10"
 ask_comment_msg = "Введите комментарий к устройству. Например: Вернули в Атол (по договору тестирования)"
 
-ask_way_of_adding_msg = "Выберите, добавить устройства по одному или загрузить файл в формате csv"
+ask_way_of_adding_msg = "Выберите, добавить устройства по одному, загрузить файл в формате csv " \
+                        "или сверить базу с файлом"
 ask_file_msg = "Загрузите файл в формате csv. Максимум у вас получится 10 столбцов:\r\n\r\n" \
                "Айди, Название, Категория, Артикул, Дата регистрации, Прошивка, Комментарий, " \
                "Электронная почта, Место устройства, Дата возврата\r\n\r\n" \
                "Первые 4 поля обязательные, остальные можно оставить пустыми.\r\n" \
                "Пример строчки: 49, MSPOS-N, ККТ, 4894892299, 18.05.2024, 12-8541, ,email@skbkontur.ru"
+ask_sync_file_msg = "Загрузите полный список устройств в формате csv, столбцы такие же, как при добавлении " \
+                    "файлом.\r\n\r\nУстройства с новыми айди добавятся, у существующих обновятся название, " \
+                    "категория, артикул, дата регистрации, прошивка и комментарий. Свободные устройства, " \
+                    "которых нет в файле, удалятся. Кто взял устройство, синхронизация не меняет.\r\n\r\n" \
+                    "Перед применением бот покажет, что изменится"
+sync_nothing_changed_msg = "Устройства в базе уже совпадают с файлом, менять нечего"
+sync_stale_msg = "Пока вы подтверждали, устройства в базе изменились или изменения из файла конфликтуют " \
+                 "друг с другом. Ничего не применено, загрузите файл еще раз"
+ask_logs_filter_msg = "Какие записи собрать в архив? Выберите вариант или напишите даты и уровень, например " \
+                      "20.04.2024-22.04.2024 error, 21.04.2024 или warning"
+wrong_logs_filter_msg = "Не получилось разобрать фильтр. Даты пишите как дд.мм.гггг или дд.мм.гггг-дд.мм.гггг, " \
+                        "уровень - debug, info, warning, error или critical"
+logs_not_found_msg = "Нет записей, подходящих под фильтр"
+logs_query_help_msg = "Напишите после /logs айди устройства, chat_id или почту и, если нужно, даты, например " \
+                      "/logs 42, /logs id:42 21.04.2024, /logs chat:123456 или " \
+                      "/logs email@skbkontur.ru 20.04.2024-22.04.2024"
+logs_query_expired_msg = "Поиск устарел, повторите команду /logs"
+logs_rotated_msg = "Логи ротировались во время поиска, индекс обновлен, результаты перечитаны"
+history_empty_msg = "У устройства еще не было владельцев"
+history_end_msg = "Более ранних событий нет"
+stats_not_ready_msg = "Статистика за этот период еще не посчитана, она обновляется каждую ночь"
+overdue_empty_msg = "Просроченных устройств нет"
+stats_wrong_period_msg = "Напишите период после команды, например /stats 01.03.2024-31.03.2024"
+history_wrong_period_msg = "Напишите дату после команды, например /history49 15.03.2024 " \
+                           "или /history49 01.03.2024-31.03.2024"
+
+
+def history_holders_message(resource_id: int, period: str, holders: list[str]) -> str:
+    if len(holders) == 0:
+        return f"Устройство {resource_id} {period} ни на кого не было записано"
+    return f"Устройство {resource_id} {period} было записано на:\r\n" + "\r\n".join(holders)
 file_is_processing_msg = "Идет добавление устройств из файла. Бот сообщит об успехе или возникших ошибках"
 confirm_adding_msg = "Точно-точно добавить устройство?"
 
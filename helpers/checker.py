@@ -1,11 +1,14 @@
 import logging
 import re
 from collections import Counter
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 from re import Match
 
 import models
+from helpers.admins import roster
+from helpers.catalog import catalog
+from helpers.inventory import inventory
 
 
 class ResourceError(str, Enum):
@@ -25,17 +28,25 @@ class ResourceError(str, Enum):
 
 async def is_admin(chat_id) -> bool:
     user = await models.Visitor.get_current(chat_id)
-    return user.is_admin
+    return roster.is_admin(user)
 
 
-async def is_existed_vendor_code(vendor_code: str) -> bool:
-    existed_resources: list[models.Resource] = await models.Resource.get_by_vendor_code(vendor_code)
-    return len(existed_resources) >= 1
+class KnownValues:
+    """
+    Снимок того, что уже есть в базе, для проверки строк файла без запросов.
+    Обычные множества, поэтому снимок можно передать и в другой процесс
+    """
+    __slots__ = ("ids", "vendor_codes", "categories")
 
+    def __init__(self, ids: frozenset[int], vendor_codes: frozenset[str], categories: frozenset[str]):
+        self.ids = ids
+        self.vendor_codes = vendor_codes
+        self.categories = categories
 
-async def is_existed_id(resource_id: int) -> bool:
-    existed_resources: list[models.Resource] = await models.Resource.get_by_primary(resource_id)
-    return len(existed_resources) >= 1
+    @classmethod
+    async def collect(cls) -> "KnownValues":
+        await inventory.ensure_fresh()
+        return cls(frozenset(inventory.by_id), frozenset(inventory.by_vendor_code), frozenset(await catalog.all()))
 
 
 def prepare_fields(row: list[str]) -> dict[str, str | None]:
@@ -48,7 +59,8 @@ def prepare_fields(row: list[str]) -> dict[str, str | None]:
     return fields
 
 
-async def check_resource(
+def check_resource(
+        known: KnownValues,
         id: str,
         name: str,
         category_name: str,
@@ -58,7 +70,13 @@ async def check_resource(
         comment: str,
         user_email: str,
         address: str,
-        return_date: str) -> tuple[models.Resource | None, list[ResourceError]]:
+        return_date: str,
+        allow_existing: bool = False) -> tuple[models.ResourceRow | None, list[ResourceError]]:
+    """
+    Проверяет строку файла по снимку known, не обращаясь к базе и циклу событий.
+    Возвращает легкую запись ResourceRow: ее дешево создавать в потоке и передавать между процессами.
+    allow_existing - не проверять занятость id и артикула: при синхронизации существующие устройства обновляются
+    """
     errors = []
     if not id:
         errors.append(ResourceError.NO_ID)
@@ -67,19 +85,19 @@ async def check_resource(
             errors.append(ResourceError.WRONG_ID)
         else:
             id = int(id)
-            if await is_existed_id(id):
+            if not allow_existing and id in known.ids:
                 errors.append(ResourceError.EXISTED_ID)
     if not vendor_code:
         errors.append(ResourceError.NO_VENDOR_CODE)
     else:
-        if await is_existed_vendor_code(vendor_code):
+        if not allow_existing and vendor_code in known.vendor_codes:
             errors.append(ResourceError.EXISTED_VENDOR_CODE)
     if not name:
         errors.append(ResourceError.NO_NAME)
     if not category_name:
         errors.append(ResourceError.NO_CATEGORY)
     else:
-        if not await is_right_category(category_name):
+        if category_name not in known.categories:
             errors.append(ResourceError.WRONG_CATEGORY)
     if reg_date:
         reg_date = try_convert_to_ddmmyyyy(reg_date)
@@ -94,7 +112,7 @@ async def check_resource(
         elif is_paste_date(return_date):
             errors.append(ResourceError.PASSED_DATE)
     if len(errors) == 0:
-        resource = models.Resource(
+        resource = models.ResourceRow(
             id=id,
             name=name,
             category_name=category_name,
@@ -138,8 +156,7 @@ def format_errors(indexes_with_errors: dict[int, list[ResourceError]]) -> str:
 
 
 async def is_right_category(category: str) -> bool:
-    available_categories = [i.name for i in (await models.Category.get_all())]
-    return category in available_categories
+    return await catalog.contains(category)
 
 
 def try_convert_to_ddmmyyyy(date: str) -> datetime | None:
@@ -152,6 +169,14 @@ def try_convert_to_ddmmyyyy(date: str) -> datetime | None:
         return None
 
 
+def parse_period(text: str) -> tuple[datetime, datetime] | None:
+    """"15.03.2024" - весь этот день, "01.03.2024-31.03.2024" - с начала первого дня до конца последнего"""
+    dates = [try_convert_to_ddmmyyyy(part.strip()) for part in text.split("-")]
+    if len(dates) > 2 or None in dates or dates[0] > dates[-1]:
+        return None
+    return dates[0], dates[-1] + timedelta(days=1)
+
+
 def is_valid_email(email: str) -> Match | None:
     return re.search(r"^\w+@\w+\.\w+$", email)
 
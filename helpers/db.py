@@ -1,24 +1,27 @@
+import asyncio
 import logging
 
 from aiogram.types import Message
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from models import Resource, Visitor, Record, ActionType, engine
+from helpers import render
+from helpers.admins import roster
+from helpers.inventory import inventory
+from models import Resource, ResourceRow, Visitor, Record, ActionType, get_reader, get_session_maker
 
 
-async def get_waited_resources_for_user(user: Visitor):
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+async def get_queued_resource_ids(email: str, primary: bool = False) -> set[int]:
+    async_session = get_reader(primary)
     async with async_session() as session:
         async with session.begin():
-            stmt1 = select(Record).where(Record.user_email == user.email,
-                                         Record.action == ActionType.QUEUE).with_only_columns(Record.resource)
-            result1 = await session.scalars(stmt1)
-            resource_ids = result1.all()
-            stmt2 = select(Resource).filter(Resource.id.in_(resource_ids))
-            result2 = await session.scalars(stmt2)
-            resources = result2.all()
-    return resources
+            stmt = select(Record).where(Record.user_email == email,
+                                        Record.action == ActionType.QUEUE).with_only_columns(Record.resource)
+            result = await session.scalars(stmt)
+            return {int(resource_id) for resource_id in result.all()}
+
+
+async def get_waited_resources_for_user(user: Visitor) -> list[ResourceRow]:
+    return await inventory.get_many(list(await get_queued_resource_ids(user.email)))
 
 
 async def notify_user_about_returning(message: Message, email: str, resource: Resource) -> None:
@@ -76,7 +79,7 @@ async def notify_next_user_about_taking(message: Message, next_user_email: str,
 
 async def pass_resource_to_next_user(resource_id) -> str | None:
     next_user_email = None
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async_session = get_session_maker()
     async with async_session() as session:
         async with session.begin():
             stmt = select(Record).where(Record.resource == resource_id, Record.action == ActionType.QUEUE)
@@ -98,8 +101,8 @@ async def pass_resource_to_next_user(resource_id) -> str | None:
     return next_user_email
 
 
-async def get_resource_queue(resource_id) -> list[Record]:
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+async def get_resource_queue(resource_id, primary: bool = False) -> list[Record]:
+    async_session = get_reader(primary)
     async with async_session() as session:
         async with session.begin():
             stmt = select(Record).where(Record.resource == resource_id, Record.action == ActionType.QUEUE)
@@ -118,41 +121,54 @@ async def is_user_in_queue(user: Visitor, resource: Resource, records: list[Reco
     return user_in_queue
 
 
-async def get_available_action(resource: Resource, chat_id: int) -> ActionType:
-    user = await Visitor.get_current(chat_id)
-    records: list[Record] = await Record.get({"user_email": user.email})
+def get_action_for_viewer(resource: Resource | ResourceRow, user: Visitor, queued_ids: set[int]) -> ActionType:
     if not resource.user_email:
         return ActionType.TAKE
     elif resource.user_email == user.email:
         return ActionType.RETURN
-    elif await is_user_in_queue(user, resource, records):
+    elif resource.id in queued_ids:
         return ActionType.LEAVE
     else:
         return ActionType.QUEUE
 
 
-async def format_note(resource: Resource, chat_id: int) -> str:
-    command = (await get_available_action(resource, chat_id)).value
+async def get_available_action(resource: Resource, chat_id: int) -> ActionType:
     user = await Visitor.get_current(chat_id)
-    if user.is_admin:
-        return f"{str(resource)}\r\n{command}{resource.id}\r\n{ActionType.EDIT.value}{resource.id}\r\n\r\n"
-    else:
-        return f"{str(resource)}\r\n{command}{resource.id}\r\n\r\n"
+    return get_action_for_viewer(resource, user, await get_queued_resource_ids(user.email))
 
 
-async def format_notes(resources: list[Resource], chat_id: int) -> str:
-    return "".join([await format_note(resource, chat_id) for resource in resources])
+async def render_notes(resources: list[Resource | ResourceRow], chat_id: int) -> list[str]:
+    """Пользователь и его очереди читаются один раз на весь список, карточки берутся из кэша render.cards"""
+    if len(resources) == 0:
+        return []
+    user = await Visitor.get_current(chat_id)
+    queued_ids = await get_queued_resource_ids(user.email)
+    is_admin = roster.is_admin(user)
+    return [
+        render.render_note(resource, get_action_for_viewer(resource, user, queued_ids), is_admin)
+        for resource in resources
+    ]
+
+
+async def format_note(resource: Resource | ResourceRow, chat_id: int) -> str:
+    return await format_notes([resource], chat_id)
+
+
+async def format_notes(resources: list[Resource | ResourceRow], chat_id: int) -> str:
+    return "".join(await render_notes(resources, chat_id))
 
 
 def get_field_name(field) -> str:
     return str(field).split(".")[1]
 
 
-async def return_resource(resource_id) -> None:
-    resources = await Resource.get_by_primary(resource_id)
-    resource = resources[0]
-    await Resource.free(resource_id)
-    await Record.delete(**{
-        get_field_name(Record.resource): resource_id,
-        get_field_name(Record.action): ActionType.TAKE,
-        get_field_name(Record.user_email): resource.user_email})
+async def return_resource(resource: Resource) -> Resource | None:
+    """Списывает устройство с пользователя. resource - устройство до списания, из него берется почта пользователя"""
+    freed_resource, _ = await asyncio.gather(
+        Resource.free(resource.id),
+        Record.delete(**{
+            get_field_name(Record.resource): resource.id,
+            get_field_name(Record.action): ActionType.TAKE,
+            get_field_name(Record.user_email): resource.user_email})
+    )
+    return freed_resource
@@ -0,0 +1,73 @@
+import hashlib
+import logging
+from typing import Awaitable, Callable, Hashable
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+from helpers.executor import executor
+from models import TelegramFile
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class DocumentSender:
+    """
+    Отправляет документы, по возможности не загружая их заново. После первой загрузки file_id сохраняется в таблицу
+    telegram_file по sha256 содержимого и имени файла, и тот же файл потом отправляется по file_id.
+    Если Телеграм не принял сохраненный file_id (например, сменился токен бота), файл загружается снова.
+    Подходит для файлов, которые повторяются, например выгрузок CachedExport. Логи и архивы меняются между
+    запросами и отправляются напрямую, без file_id
+    """
+
+    def __repr__(self):
+        return f"DocumentSender(reused={self.reused}, uploaded={self.uploaded})"
+
+    def __str__(self):
+        return f"Документы: отправлено по file_id {self.reused}, загружено {self.uploaded}"
+
+    def __init__(self):
+        self.reused = 0
+        self.uploaded = 0
+
+    async def send_bytes(self, message: Message, content: bytes, file_name: str, sha256: str | None = None) -> Message:
+        file = BufferedInputFile(content, file_name)
+        return await self._send(message, file, sha256 or await executor.run(hash_bytes, content))
+
+    async def _send(self, message: Message, file: BufferedInputFile, sha256: str) -> Message:
+        file_id = await TelegramFile.get_file_id(sha256, file.filename)
+        if file_id is not None:
+            try:
+                sent = await message.reply_document(file_id)
+                self.reused += 1
+                return sent
+            except TelegramBadRequest as e:
+                logging.warning(f"Телеграм не принял сохраненный file_id для {file.filename}, загружаем заново: {e}")
+                await TelegramFile.forget(sha256, file.filename)
+        sent = await message.reply_document(file)
+        self.uploaded += 1
+        await TelegramFile.save(sha256, file.filename, sent.document.file_id)
+        return sent
+
+
+class CachedExport:
+    """Последняя собранная выгрузка и ключ, по которому она собрана. Пока ключ тот же, выгрузка не пересобирается"""
+
+    def __init__(self):
+        self.key: Hashable | None = None
+        self.content: bytes | None = None
+        self.sha256: str | None = None
+
+    async def get(self, key: Hashable, build: Callable[[], Awaitable[bytes]]) -> tuple[bytes, str]:
+        """Возвращает содержимое и его sha256"""
+        if key != self.key or self.content is None:
+            content = await build()
+            self.sha256 = await executor.run(hash_bytes, content)
+            self.key, self.content = key, content
+            logging.info(f"Выгрузка собрана заново для ключа {key}")
+        return self.content, self.sha256
+
+
+documents = DocumentSender()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from os import getenv
+from typing import Any, Callable
+
+EXECUTOR_KIND = getenv("EXECUTOR_KIND", "thread")
+EXECUTOR_WORKERS = int(getenv("EXECUTOR_WORKERS", "2"))
+EXECUTOR_KINDS = ("thread", "process")
+
+
+class Offloader:
+    """
+    Пул для тяжелой работы с файлами: разбора и проверки csv, выгрузок, чтения логов. Пока она идет в пуле,
+    цикл событий отвечает остальным чатам. kind - thread или process (переменная окружения EXECUTOR_KIND).
+    Одновременно выполняется не больше max_jobs задач, остальные ждут своей очереди в цикле.
+    Отмена ожидающей задачи убирает ее из очереди, а выполняющейся в потоке - выставляет ей событие cancelled
+    """
+
+    def __repr__(self):
+        return f"Offloader(kind={self.kind}, workers={self.workers}, max_jobs={self.max_jobs}, " \
+               f"running={self.running}, waiting={self.waiting}, completed={self.completed}, " \
+               f"cancelled={self.cancelled})"
+
+    def __str__(self):
+        return f"Пул для файлов ({self.kind}, {self.workers}): выполняется {self.running}, ждут {self.waiting}, " \
+               f"завершено {self.completed}, отменено {self.cancelled}"
+
+    def __init__(self, kind: str = EXECUTOR_KIND, workers: int = EXECUTOR_WORKERS, max_jobs: int | None = None):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Неизвестный тип пула {kind}, ожидается один из {EXECUTOR_KINDS}")
+        self.kind = kind
+        self.workers = workers
+        self.max_jobs = max_jobs or workers
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.cancelled = 0
+        self._semaphore = asyncio.Semaphore(self.max_jobs)
+        self._pool: Executor | None = None
+        self._cancel_events: set[threading.Event] = set()
+
+    @property
+    def shares_memory(self) -> bool:
+        """В потоки можно передавать колбэки и открытые файлы, в процессы - только то, что переживет pickle"""
+        return self.kind == "thread"
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "thread":
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="offload")
+            else:
+                # fork процесса с работающим циклом событий и потоками небезопасен
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args, cancellable: bool = False) -> Any:
+        """
+        Выполняет fn(*args) в пуле. С cancellable функция получает аргумент cancelled: threading.Event,
+        который стоит проверять в длинных циклах. В пуле процессов вместо события передается None
+        """
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        event = threading.Event() if cancellable and self.shares_memory else None
+        kwargs = {"cancelled": event} if cancellable else {}
+        try:
+            future = self._get_pool().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.running += 1
+        if event is not None:
+            self._cancel_events.add(event)
+        # место в очереди освобождается, только когда задача действительно закончилась, даже если ее отменили
+        future.add_done_callback(lambda _: self._on_done(loop, event))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._cancel(future, event)
+            raise
+
+    def _cancel(self, future: Future, event: threading.Event | None) -> None:
+        self.cancelled += 1
+        future.cancel()
+        if event is not None:
+            event.set()
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, event: threading.Event | None) -> None:
+        try:
+            loop.call_soon_threadsafe(self._finish, event)
+        except RuntimeError:
+            # цикл событий уже закрыт при остановке бота
+            pass
+
+    def _finish(self, event: threading.Event | None) -> None:
+        self.running -= 1
+        self.completed += 1
+        self._cancel_events.discard(event)
+        self._semaphore.release()
+
+    async def stop(self) -> None:
+        """Отменяет ждущие задачи, просит остановиться выполняющиеся и не ждет их"""
+        for event in self._cancel_events:
+            event.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        logging.info(f"Пул для файлов остановлен: {repr(self)}")
+
+
+class Cancelled(Exception):
+    """Задачу в пуле отменили, пока она выполнялась"""
+
+
+def raise_if_cancelled(cancelled: threading.Event | None) -> None:
+    if cancelled is not None and cancelled.is_set():
+        raise Cancelled()
+
+
+executor = Offloader()
@@ -0,0 +1,223 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from functools import partial
+from tempfile import NamedTemporaryFile
+from time import monotonic
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterator
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+from charset_normalizer import from_bytes
+
+from helpers import checker
+from helpers.executor import executor, raise_if_cancelled
+from models import Resource, ResourceRow
+
+CHARSET_SAMPLE_BYTES = 64 * 1024
+PROGRESS_EVERY_ROWS = 200
+PROGRESS_MIN_SECONDS = 2
+SUPPORTED_CHARSETS = ("cp1251", "utf_8")
+# поля, которые сверка с файлом переносит в существующие устройства. Кто взял устройство, куда и до какого
+# числа, меняют только "взять" и "вернуть": у них есть очереди и уведомления
+SYNC_FIELDS = ("name", "category_name", "vendor_code", "reg_date", "firmware", "comment")
+SUMMARY_ITEMS = 20
+
+
+class Progress:
+    """Одно сообщение о ходе обработки файла, которое редактируется не чаще раза в min_interval секунд"""
+
+    def __init__(self, message: Message, text: str, min_interval: float = PROGRESS_MIN_SECONDS):
+        self.message = message
+        self.text = text
+        self.min_interval = min_interval
+        self.updated_at = monotonic()
+        self._task: asyncio.Task | None = None
+
+    def report(self, rows: int) -> None:
+        """Вызывается в цикле событий. Из потока пула - через loop.call_soon_threadsafe"""
+        now = monotonic()
+        if now - self.updated_at < self.min_interval or (self._task is not None and not self._task.done()):
+            return
+        self.updated_at = now
+        self._task = asyncio.create_task(self._edit(rows))
+
+    async def _edit(self, rows: int) -> None:
+        try:
+            await self.message.edit_text(f"{self.text}\r\n\r\nОбработано строк: {rows}")
+        except TelegramBadRequest as e:
+            logging.warning(f"Не удалось обновить сообщение о ходе обработки файла: {e}")
+
+
+@asynccontextmanager
+async def downloaded(bot: Bot, file_id: str) -> AsyncIterator[str]:
+    """Скачивает файл частями во временный файл на диске и удаляет его после обработки"""
+    file = await bot.get_file(file_id)
+    with NamedTemporaryFile(suffix=".csv", delete=False) as destination:
+        path = destination.name
+    try:
+        await bot.download(file, destination=path)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def get_charset(file: BinaryIO) -> str:
+    """
+    Определяет кодировку по первому куску файла с не-ASCII байтами, а не по всему файлу.
+    Если таких байт нет, подойдет любая из поддерживаемых кодировок
+    """
+    charset = "utf_8"
+    while chunk := file.read(CHARSET_SAMPLE_BYTES):
+        if not chunk.isascii():
+            # кусок может оборваться посреди символа utf-8, поэтому добираем до конца строки
+            sample = chunk + file.readline()
+            charset = from_bytes(sample).best().encoding
+            logging.info(f"Charset normalizer определил кодировку как: {charset}")
+            break
+    if charset not in SUPPORTED_CHARSETS:
+        charset = "cp1251"
+    logging.info(f"Для декодирования выбрана кодировка: {charset}")
+    file.seek(0)
+    return charset
+
+
+def iter_rows(file: BinaryIO, charset: str) -> Iterator[tuple[int, list[str]]]:
+    """Построчно читает csv, не раскодируя файл целиком. Пропускает пустые строки и заголовок"""
+    text = io.TextIOWrapper(file, encoding=charset, newline="")
+    try:
+        for index, row in enumerate(csv.reader(text), 1):
+            if row == [] or row[0].lower() == "айди":
+                continue
+            yield index, row
+    finally:
+        text.detach()
+
+
+def read_csv(path: str, known: checker.KnownValues, allow_existing: bool = False,
+             report: Callable[[int], Any] | None = None, cancelled: threading.Event | None = None
+             ) -> tuple[dict[int, list[checker.ResourceError]], list[ResourceRow]]:
+    """Задача для пула: определяет кодировку, разбирает и проверяет строки файла по снимку known"""
+    errors: dict[int, list[checker.ResourceError]] = {}
+    resources = []
+    with open(path, "rb") as file:
+        charset = get_charset(file)
+        for count, (index, row) in enumerate(iter_rows(file, charset), 1):
+            fields = checker.prepare_fields(row)
+            resource, resource_errors = checker.check_resource(known, **fields, allow_existing=allow_existing)
+            if len(resource_errors) != 0:
+                errors.update({index: resource_errors})
+            elif resource:
+                resources.append(resource)
+            if count % PROGRESS_EVERY_ROWS == 0:
+                raise_if_cancelled(cancelled)
+                if report is not None:
+                    report(count)
+    return errors, resources
+
+
+async def check_csv(path: str, progress: Progress | None = None, allow_existing: bool = False
+                    ) -> tuple[dict[int, list[checker.ResourceError]], list[ResourceRow]]:
+    """
+    Проверяет строки файла в пуле executor по снимку инвентаря, без запросов в базу на каждую строку.
+    allow_existing - режим синхронизации, в котором существующие id и артикулы не считаются ошибкой
+    """
+    known = await checker.KnownValues.collect()
+    report = None
+    if progress is not None and executor.shares_memory:
+        loop = asyncio.get_running_loop()
+        report = partial(loop.call_soon_threadsafe, progress.report)
+    return await executor.run(read_csv, path, known, allow_existing, report, cancellable=True)
+
+
+class SyncPlan:
+    """Результат сверки файла с устройствами в базе: что добавить, что и в каких полях поменять, что удалить"""
+
+    def __repr__(self):
+        return f"SyncPlan(inserts={len(self.inserts)}, updates={len(self.updates)}, unchanged={self.unchanged}, " \
+               f"removed={len(self.removed)}, kept_taken={len(self.kept_taken)}, conflicts={len(self.conflicts)})"
+
+    def __str__(self):
+        parts = [
+            f"Новых устройств: {len(self.inserts)}",
+            f"Изменится: {len(self.updates)}",
+            f"Без изменений: {self.unchanged}",
+            f"Будет удалено: {len(self.removed)}",
+        ]
+        if len(self.updates) != 0:
+            parts.append("\r\nИзменения:\r\n" + self._format_items(
+                [f"/edit{row.id} {row.name}: {', '.join(fields)}" for row, fields in self.updates]))
+        if len(self.removed) != 0:
+            parts.append("\r\nУдалятся:\r\n" + self._format_items(
+                [f"{row.id} {row.name}" for row in self.removed]))
+        if len(self.kept_taken) != 0:
+            parts.append("\r\nНет в файле, но не удалятся, потому что заняты:\r\n" + self._format_items(
+                [f"{row.id} {row.name} - {row.user_email}" for row in self.kept_taken]))
+        return "\r\n".join(parts)
+
+    def __init__(self):
+        self.inserts: list[Resource | ResourceRow] = []
+        self.updates: list[tuple[ResourceRow, dict]] = []
+        self.unchanged = 0
+        self.removed: list[ResourceRow] = []
+        self.kept_taken: list[ResourceRow] = []
+        self.conflicts: list[tuple[Resource | ResourceRow, ResourceRow]] = []
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.inserts) == 0 and len(self.updates) == 0 and len(self.removed) == 0
+
+    @property
+    def versions(self) -> dict[int, int]:
+        """Версии обновляемых и удаляемых устройств на момент сверки"""
+        return {row.id: row.version for row in [row for row, _ in self.updates] + self.removed}
+
+    def get_update_params(self) -> list[dict]:
+        return [{"id": row.id, **fields} for row, fields in self.updates]
+
+    def get_conflicts_text(self) -> str:
+        return "Артикулы из файла уже есть у занятых устройств, которых нет в файле:\r\n" + self._format_items([
+            f"{resource.id}: артикул {resource.vendor_code} у {row.id} {row.name}" for resource, row in self.conflicts
+        ])
+
+    @staticmethod
+    def _format_items(items: list[str]) -> str:
+        text = "\r\n".join(items[:SUMMARY_ITEMS])
+        if len(items) > SUMMARY_ITEMS:
+            text += f"\r\nи еще {len(items) - SUMMARY_ITEMS}"
+        return text
+
+
+def plan_sync(current: list[ResourceRow], incoming: list[Resource | ResourceRow]) -> SyncPlan:
+    """
+    Сравнивает устройства из файла с текущими в памяти. Устройство из файла с новым id добавляется, с существующим -
+    обновляется в тех полях SYNC_FIELDS, которые отличаются. Свободные устройства, которых нет в файле, удаляются,
+    занятые остаются. Ожидается, что в файле нет повторов id и артикулов
+    """
+    plan = SyncPlan()
+    by_id = {row.id: row for row in current}
+    for resource in incoming:
+        row = by_id.pop(resource.id, None)
+        if row is None:
+            plan.inserts.append(resource)
+            continue
+        changed = {name: getattr(resource, name) for name in SYNC_FIELDS
+                   if getattr(resource, name) != getattr(row, name)}
+        if len(changed) == 0:
+            plan.unchanged += 1
+        else:
+            plan.updates.append((row, changed))
+    for row in by_id.values():
+        if row.user_email is None:
+            plan.removed.append(row)
+        else:
+            plan.kept_taken.append(row)
+    kept_vendor_codes = {row.vendor_code: row for row in plan.kept_taken}
+    plan.conflicts = [(resource, kept_vendor_codes[resource.vendor_code]) for resource in incoming
+                      if resource.vendor_code in kept_vendor_codes]
+    return plan
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+from collections import Counter
+from time import monotonic
+
+from sqlalchemy import func, select, text
+
+from helpers.changefeed import changefeed
+from models import (INVENTORY_VERSION, RESOURCE_ROW_COLUMNS, Resource, ResourceRow, get_engine,
+                    subscribe_resource_changes)
+
+INVENTORY_REFRESH_SECONDS = 5
+VERSION_OVERLAP = 100
+SEARCH_FIELDS = ("name", "category_name", "user_email", "vendor_code")
+
+
+class Inventory:
+    """
+    Копия таблицы resource в памяти процесса, из которой отвечают /all, /categories, /mine и поиск.
+    Свои записи применяются сразу через подписку на изменения в models, поэтому после записи в этом процессе
+    устаревшее чтение невозможно. Чужие записи приходят через changefeed: измененные строки дочитываются по id
+    перед следующим чтением. Пока подписка не работает, чужие записи подтягиваются инкрементально по версии строки
+    не реже, чем раз в refresh_interval секунд
+    """
+
+    def __repr__(self):
+        return f"Inventory(resources={len(self.by_id)}, " \
+               f"version={self.version}, " \
+               f"loaded={self.loaded})"
+
+    def __str__(self):
+        return f"Инвентарь из {len(self.by_id)} устройств, версия {self.version}"
+
+    def __init__(self, refresh_interval: float = INVENTORY_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.by_id: dict[int, ResourceRow] = {}
+        self.by_vendor_code: dict[str, ResourceRow] = {}
+        self.by_category: dict[str, dict[int, ResourceRow]] = {}
+        self.by_holder: dict[str, dict[int, ResourceRow]] = {}
+        self.taken_by_category: Counter[str] = Counter()
+        self.version = 0
+        self.loaded = False
+        self._watermark = 0
+        self._checked_at = 0.0
+        self._tombstones: dict[int, int] = {}
+        self._pending: dict[int, str] = {}
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        if not self.loaded or len(self._pending) != 0:
+            return False
+        return changefeed.connected or monotonic() - self._checked_at < self.refresh_interval
+
+    async def ensure_fresh(self) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if not self.loaded:
+                await self.reload()
+            elif len(self._pending) != 0:
+                await self.fetch_pending()
+            elif not self._is_fresh():
+                await self.refresh()
+
+    def on_change(self, op: str, key: str) -> None:
+        """Уведомление changefeed: строка будет дочитана из базы перед следующим чтением инвентаря"""
+        self._pending[int(key)] = op
+
+    def invalidate(self) -> None:
+        self.loaded = False
+
+    async def fetch_pending(self) -> None:
+        """
+        Дочитывает строки из уведомлений. Строка, которой нет в базе, удаляется только по уведомлению DELETE:
+        иначе ее вставка могла закоммититься после начала чтения
+        """
+        pending, self._pending = self._pending, {}
+        stmt = select(*RESOURCE_ROW_COLUMNS).where(Resource.id.in_(pending.keys()))
+        async with get_engine().connect() as conn:
+            rows = [ResourceRow.from_values(values) for values in await conn.execute(stmt)]
+        for row in rows:
+            self.put(row)
+        found = {row.id for row in rows}
+        for resource_id, op in pending.items():
+            if resource_id not in found and op == "DELETE":
+                self.remove(resource_id)
+
+    async def reload(self) -> None:
+        """Полностью перечитывает таблицу. Локальные записи, сделанные во время чтения, не теряются"""
+        self._pending.clear()
+        async with get_engine().connect() as conn:
+            snapshot_version = (await conn.execute(text(f"SELECT last_value FROM {INVENTORY_VERSION.name}"))).scalar()
+            fresh = [ResourceRow.from_values(values) for values in await conn.execute(select(*RESOURCE_ROW_COLUMNS))]
+        newer_local = [row for row in self.by_id.values() if row.version > snapshot_version]
+        self._clear()
+        for row in fresh + newer_local:
+            self.put(row)
+        self._watermark = snapshot_version
+        self._prune_tombstones()
+        self._checked_at = monotonic()
+        self.loaded = True
+        logging.info(f"Инвентарь загружен полностью: {len(self.by_id)} устройств, версия {self.version}")
+
+    async def refresh(self) -> None:
+        """
+        Дочитывает строки с версией выше отметки за вычетом VERSION_OVERLAP, чтобы не пропустить транзакцию,
+        которая получила номер версии раньше, а закоммитилась позже соседней.
+        Удаления видны по расхождению количества строк и приводят к полной перезагрузке
+        """
+        stmt = select(*RESOURCE_ROW_COLUMNS).where(Resource.version > self._watermark - VERSION_OVERLAP)
+        async with get_engine().connect() as conn:
+            rows = [ResourceRow.from_values(values) for values in await conn.execute(stmt)]
+            total = (await conn.execute(select(func.count()).select_from(Resource))).scalar()
+        for row in rows:
+            self.put(row)
+        self._watermark = max((row.version for row in rows), default=self._watermark)
+        self._prune_tombstones()
+        self._checked_at = monotonic()
+        if total != len(self.by_id):
+            logging.info(f"В инвентаре {len(self.by_id)} устройств, а в базе {total}: перезагружаем инвентарь")
+            await self.reload()
+
+    def _prune_tombstones(self) -> None:
+        """
+        Строки с версией не выше отметки за вычетом VERSION_OVERLAP следующий refresh уже не прочитает, а удаленных
+        строк нет в базе, поэтому такие отметки об удалении больше не нужны
+        """
+        horizon = self._watermark - VERSION_OVERLAP
+        self._tombstones = {resource_id: version for resource_id, version in self._tombstones.items()
+                            if version > horizon}
+
+    def put(self, row: ResourceRow) -> None:
+        current = self.by_id.get(row.id)
+        if current is not None and current.version > row.version:
+            return
+        if self._tombstones.get(row.id, -1) >= row.version:
+            return
+        if current is not None:
+            self._unindex(current)
+        self.by_id[row.id] = row
+        self.by_vendor_code[row.vendor_code] = row
+        self.by_category.setdefault(row.category_name, {})[row.id] = row
+        if row.user_email is not None:
+            self.by_holder.setdefault(row.user_email, {})[row.id] = row
+            self.taken_by_category[row.category_name] += 1
+        self.version = max(self.version, row.version)
+
+    def remove(self, resource_id: int) -> None:
+        row = self.by_id.pop(resource_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        self._tombstones[resource_id] = row.version
+
+    def apply_changes(self, changed: list[Resource], deleted_ids: list[int]) -> None:
+        for resource in changed:
+            self.put(ResourceRow.from_resource(resource))
+        for resource_id in deleted_ids:
+            self.remove(resource_id)
+
+    def _unindex(self, row: ResourceRow) -> None:
+        if self.by_vendor_code.get(row.vendor_code) is row:
+            del self.by_vendor_code[row.vendor_code]
+        self._discard(self.by_category, row.category_name, row.id)
+        if row.user_email is not None:
+            self._discard(self.by_holder, row.user_email, row.id)
+            self.taken_by_category[row.category_name] -= 1
+            if self.taken_by_category[row.category_name] <= 0:
+                del self.taken_by_category[row.category_name]
+
+    @staticmethod
+    def _discard(index: dict[str, dict[int, ResourceRow]], key: str, resource_id: int) -> None:
+        rows = index.get(key)
+        if rows is None:
+            return
+        rows.pop(resource_id, None)
+        if len(rows) == 0:
+            del index[key]
+
+    def _clear(self) -> None:
+        self.by_id.clear()
+        self.by_vendor_code.clear()
+        self.by_category.clear()
+        self.by_holder.clear()
+        self.taken_by_category.clear()
+
+    async def all(self) -> list[ResourceRow]:
+        await self.ensure_fresh()
+        return sorted(self.by_id.values(), key=lambda row: row.id)
+
+    async def get(self, resource_id: int) -> ResourceRow | None:
+        await self.ensure_fresh()
+        return self.by_id.get(resource_id)
+
+    async def get_many(self, resource_ids: list[int]) -> list[ResourceRow]:
+        await self.ensure_fresh()
+        return [self.by_id[resource_id] for resource_id in sorted(resource_ids) if resource_id in self.by_id]
+
+    async def get_by_vendor_code(self, vendor_code: str) -> ResourceRow | None:
+        await self.ensure_fresh()
+        return self.by_vendor_code.get(vendor_code)
+
+    async def categories(self) -> list[str]:
+        await self.ensure_fresh()
+        return sorted(self.by_category.keys())
+
+    async def category_counts(self) -> list[tuple[str, int, int]]:
+        """(категория, свободно, всего) для категорий, в которых есть устройства"""
+        await self.ensure_fresh()
+        return [
+            (name, len(rows) - self.taken_by_category[name], len(rows))
+            for name, rows in sorted(self.by_category.items())
+        ]
+
+    async def in_category(self, category_name: str) -> list[ResourceRow]:
+        await self.ensure_fresh()
+        return sorted(self.by_category.get(category_name, {}).values(), key=lambda row: row.id)
+
+    async def taken_by(self, email: str) -> list[ResourceRow]:
+        await self.ensure_fresh()
+        return sorted(self.by_holder.get(email, {}).values(), key=lambda row: row.id)
+
+    async def search(self, search_key: str, limit: int = 100) -> list[ResourceRow]:
+        """Та же логика, что в Resource.search: число - это id, иначе подстрока в названии, категории, почте, артикуле"""
+        await self.ensure_fresh()
+        if search_key.isnumeric() and int(search_key) < 1000000:
+            row = self.by_id.get(int(search_key))
+            return [row] if row is not None else []
+        key = search_key.casefold()
+        result = [
+            row for row in self.by_id.values()
+            if any(key in value.casefold() for value in (getattr(row, field) for field in SEARCH_FIELDS) if value)
+        ]
+        return sorted(result, key=lambda row: row.id)[:limit]
+
+
+inventory = Inventory()
+subscribe_resource_changes(inventory.apply_changes)
+changefeed.subscribe("resource", inventory.on_change)
+changefeed.on_resync(inventory.invalidate)
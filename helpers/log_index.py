@@ -0,0 +1,208 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date, datetime
+from typing import Iterable
+
+from helpers.executor import raise_if_cancelled
+from helpers.logs import RECORD_PREFIX, get_rotated_date
+
+INDEX_FILE_NAME = "search_index.sqlite3"
+SEARCH_LIMIT = 300
+MAX_LINE_CHARS = 1000
+INSERT_BATCH = 50000
+# что индексируется в строках логов: устройства (repr Resource и Record, resource_id=...), chat_id и почты
+RESOURCE_ID = re.compile(rb"(?:Resource\(id=|resource_id[=: ]+|resource=)(\d+)")
+CHAT_ID = re.compile(rb"chat_id[=: ]+(-?\d+)")
+EMAIL = re.compile(rb"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+EMAIL_QUERY = re.compile(r"^[\w.+-]+@[\w-]+(\.[\w-]+)+$")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS file (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        inode INTEGER NOT NULL UNIQUE,
+        path TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        day TEXT
+    );
+    CREATE TABLE IF NOT EXISTS entry (
+        term TEXT NOT NULL,
+        file_id INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        day TEXT,
+        PRIMARY KEY (term, file_id, offset)
+    ) WITHOUT ROWID;
+"""
+
+# один поток пула за раз дописывает индекс, из разных процессов защищает блокировка самого sqlite
+_update_lock = threading.Lock()
+
+
+class LogQuery:
+    """
+    Запрос к логам: группы терминов через И, внутри группы - через ИЛИ. Число без префикса ищется и как id устройства,
+    и как chat_id, почта - как почта. Даты ограничивают день записи
+    """
+    __slots__ = ("groups", "date_from", "date_to")
+
+    def __repr__(self):
+        return f"LogQuery(groups={self.groups}, date_from={self.date_from}, date_to={self.date_to})"
+
+    def __init__(self, groups: list[list[str]], date_from: date | None = None, date_to: date | None = None):
+        self.groups = groups
+        self.date_from = date_from
+        self.date_to = date_to
+
+
+def parse_query(text: str) -> LogQuery | None:
+    """Разбирает "5", "id:5 21.04.2024", "chat:123 a@skbkontur.ru", "a@skbkontur.ru 20.04.2024-22.04.2024"""
+    query = LogQuery([])
+    for token in text.split():
+        prefix, _, value = token.partition(":")
+        if prefix in ("id", "chat") and value.lstrip("-").isdigit():
+            query.groups.append([f"{prefix}:{int(value)}"])
+        elif token.lstrip("-").isdigit():
+            query.groups.append([f"id:{int(token)}", f"chat:{int(token)}"])
+        elif EMAIL_QUERY.match(token):
+            query.groups.append([f"email:{token.lower()}"])
+        else:
+            try:
+                days = [datetime.strptime(value, r"%d.%m.%Y").date() for value in token.split("-", 1)]
+            except ValueError:
+                return None
+            query.date_from, query.date_to = days[0], days[-1]
+    if len(query.groups) == 0 or (query.date_from is not None and query.date_from > query.date_to):
+        return None
+    return query
+
+
+def extract_terms(line: bytes) -> set[str]:
+    terms = {f"id:{int(value)}" for value in RESOURCE_ID.findall(line)}
+    terms.update(f"chat:{int(value)}" for value in CHAT_ID.findall(line))
+    terms.update(f"email:{value.decode(errors='replace').lower()}" for value in EMAIL.findall(line))
+    return terms
+
+
+class LogIndex:
+    """
+    Индекс логов в sqlite: какие строки каких файлов упоминают устройство, почту или chat_id и за какой день.
+    Файлы отслеживаются по inode, поэтому переименование при ротации не заставляет читать их заново:
+    дописывается только то, что появилось после запомненного смещения. Удаленные старые логи выпадают из индекса
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_FILE_NAME)
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        # индекс всегда можно собрать заново из логов, поэтому fsync на каждую запись не нужен
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def update(self, paths: Iterable[str], cancelled: threading.Event | None = None) -> int:
+        """Дописывает в индекс новые строки. Возвращает число прочитанных байт"""
+        indexed = 0
+        with _update_lock, closing(self.connect()) as conn, conn:
+            known = {inode: (file_id, offset, day)
+                     for file_id, inode, offset, day in conn.execute("SELECT id, inode, offset, day FROM file")}
+            seen = set()
+            for path in sorted(paths, key=lambda path: (get_rotated_date(path) or date.max, path)):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                seen.add(stat.st_ino)
+                file_id, offset, day = known.get(stat.st_ino, (None, 0, None))
+                if file_id is not None and stat.st_size < offset:
+                    # inode достался новому файлу после удаления старого
+                    self._forget(conn, file_id)
+                    file_id, offset, day = None, 0, None
+                if file_id is None:
+                    file_id = conn.execute("INSERT INTO file (inode, path, offset) VALUES (?, ?, 0)",
+                                           (stat.st_ino, path)).lastrowid
+                else:
+                    conn.execute("UPDATE file SET path = ? WHERE id = ?", (path, file_id))
+                if stat.st_size > offset:
+                    new_offset, day = self._index_file(conn, file_id, path, offset, day, cancelled)
+                    indexed += new_offset - offset
+                    conn.execute("UPDATE file SET offset = ?, day = ? WHERE id = ?", (new_offset, day, file_id))
+                conn.commit()
+            for inode, (file_id, _, _) in known.items():
+                if inode not in seen:
+                    self._forget(conn, file_id)
+        return indexed
+
+    @staticmethod
+    def _forget(conn: sqlite3.Connection, file_id: int) -> None:
+        conn.execute("DELETE FROM entry WHERE file_id = ?", (file_id,))
+        conn.execute("DELETE FROM file WHERE id = ?", (file_id,))
+
+    @staticmethod
+    def _index_file(conn: sqlite3.Connection, file_id: int, path: str, offset: int, day: str | None,
+                    cancelled: threading.Event | None) -> tuple[int, str | None]:
+        """Читает файл с offset до последней целой строки. Строки продолжения получают день своей записи"""
+        rows = []
+        with open(path, "rb") as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # строку еще дописывают, проиндексируем в следующий раз
+                    break
+                match = RECORD_PREFIX.match(line)
+                if match is not None:
+                    day = match.group(1).decode()
+                for term in extract_terms(line):
+                    rows.append((term, file_id, offset, day))
+                offset += len(line)
+                # пачка, отсортированная по терминам, вставляется в b-дерево заметно быстрее
+                if len(rows) >= INSERT_BATCH:
+                    raise_if_cancelled(cancelled)
+                    conn.executemany("INSERT OR IGNORE INTO entry VALUES (?, ?, ?, ?)", sorted(rows))
+                    rows = []
+        conn.executemany("INSERT OR IGNORE INTO entry VALUES (?, ?, ?, ?)", sorted(rows))
+        return offset, day
+
+    def search(self, query: LogQuery, limit: int = SEARCH_LIMIT) -> list[tuple[str, int]]:
+        """Пути и смещения подходящих строк, сначала самые новые"""
+        selects = []
+        params: list = []
+        for group in query.groups:
+            select = f"SELECT file_id, offset FROM entry WHERE term IN ({', '.join('?' * len(group))})"
+            params += group
+            if query.date_from is not None:
+                select += " AND day BETWEEN ? AND ?"
+                params += [query.date_from.isoformat(), query.date_to.isoformat()]
+            selects.append(select)
+        stmt = f"SELECT path, found.offset FROM ({' INTERSECT '.join(selects)}) AS found " \
+               f"JOIN file ON file.id = found.file_id ORDER BY file.id DESC, found.offset DESC LIMIT ?"
+        with closing(self.connect()) as conn:
+            return conn.execute(stmt, params + [limit]).fetchall()
+
+
+def read_lines(found: list[tuple[str, int]]) -> list[str]:
+    lines = []
+    files = {}
+    try:
+        for path, offset in found:
+            if path not in files:
+                files[path] = open(path, "rb")
+            files[path].seek(offset)
+            line = files[path].readline().decode(errors="replace").rstrip()
+            lines.append(line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "…")
+    finally:
+        for file in files.values():
+            file.close()
+    return lines
+
+
+def search_logs(folder: str, paths: list[str], query: LogQuery, limit: int = SEARCH_LIMIT,
+                cancelled: threading.Event | None = None) -> list[str]:
+    """Задача для пула: дописывает индекс и возвращает подходящие строки, сначала самые новые"""
+    index = LogIndex(folder)
+    index.update(paths, cancelled)
+    return read_lines(index.search(query, limit))
@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+from tempfile import mkdtemp
+from typing import BinaryIO, Iterable, Iterator
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from helpers.executor import raise_if_cancelled
+
+# Телеграм принимает от бота документы до 50 МБ, запас - на буфер сжатия и оглавление архива
+ARCHIVE_PART_BYTES = 45 * 1024 * 1024
+# как часто сверять размер части: перелет за part_bytes не больше этого объема несжатого текста
+SIZE_CHECK_EVERY_BYTES = 256 * 1024
+ARCHIVE_PREFIX = "logs"
+# строка записи из main.py: "2024-04-22 12:00:00,123 - INFO - root - текст". Строки без префикса -
+# продолжение предыдущей записи, например traceback
+RECORD_PREFIX = re.compile(rb"^(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2},\d{3} - ([A-Z]+) - ")
+ROTATED_SUFFIX = re.compile(r"\.(\d{4}-\d{2}-\d{2})$")
+LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR,
+          "CRITICAL": logging.CRITICAL}
+LEVEL_ALIASES = {"ОШИБКИ": logging.ERROR, "ПРЕДУПРЕЖДЕНИЯ": logging.WARNING}
+ONE_DAY = timedelta(days=1)
+
+
+class LogFilter:
+    """Диапазон дат включительно и минимальный уровень записей. Пустой фильтр пропускает все"""
+    __slots__ = ("date_from", "date_to", "min_level")
+
+    def __repr__(self):
+        return f"LogFilter(date_from={self.date_from}, date_to={self.date_to}, " \
+               f"min_level={logging.getLevelName(self.min_level)})"
+
+    def __str__(self):
+        parts = []
+        if self.date_from is not None or self.date_to is not None:
+            parts.append(f"с {self._format(self.date_from)} по {self._format(self.date_to)}")
+        if self.min_level > logging.NOTSET:
+            parts.append(f"уровень {logging.getLevelName(self.min_level)} и выше")
+        return ", ".join(parts) or "все записи"
+
+    def __init__(self, date_from: date | None = None, date_to: date | None = None, min_level: int = logging.NOTSET):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.min_level = min_level
+
+    @property
+    def is_empty(self) -> bool:
+        return self.date_from is None and self.date_to is None and self.min_level == logging.NOTSET
+
+    def accepts_date(self, day: date) -> bool:
+        return (self.date_from is None or day >= self.date_from) and (self.date_to is None or day <= self.date_to)
+
+    def may_contain(self, rotated_date: date) -> bool:
+        """Файлы ротируются по UTC, а время в строках местное, поэтому в файле бывают записи соседних дней"""
+        return self.accepts_date(rotated_date - ONE_DAY) or self.accepts_date(rotated_date) \
+            or self.accepts_date(rotated_date + ONE_DAY)
+
+    def accepts(self, day: bytes, level: bytes) -> bool:
+        if self.min_level > logging.NOTSET and LEVELS.get(level.decode(), logging.NOTSET) < self.min_level:
+            return False
+        if self.date_from is None and self.date_to is None:
+            return True
+        return self.accepts_date(date.fromisoformat(day.decode()))
+
+    @staticmethod
+    def _format(day: date | None) -> str:
+        return day.strftime(r"%d.%m.%Y") if day is not None else "..."
+
+
+def parse_log_filter(text: str) -> LogFilter | None:
+    """
+    Разбирает фильтр вида "20.04.2024-22.04.2024 error", "21.04.2024", "warning" или "все".
+    Возвращает None, если в тексте есть что-то непонятное
+    """
+    log_filter = LogFilter()
+    for token in text.replace(",", " ").split():
+        upper = token.upper()
+        if upper in ("ВСЕ", "ВСЁ"):
+            continue
+        if upper in LEVELS or upper in LEVEL_ALIASES:
+            log_filter.min_level = LEVELS.get(upper) or LEVEL_ALIASES[upper]
+            continue
+        dates = token.split("-")
+        if len(dates) > 2:
+            return None
+        try:
+            days = [datetime.strptime(value, r"%d.%m.%Y").date() for value in dates]
+        except ValueError:
+            return None
+        log_filter.date_from, log_filter.date_to = days[0], days[-1]
+    if log_filter.date_from is not None and log_filter.date_from > log_filter.date_to:
+        return None
+    return log_filter
+
+
+def get_rotated_date(path: str) -> date | None:
+    """Дата из имени файла, который TimedRotatingFileHandler закрыл в полночь, например cashbox_zoo.log.2024-04-21"""
+    match = ROTATED_SUFFIX.search(path)
+    return date.fromisoformat(match.group(1)) if match else None
+
+
+def iter_filtered_lines(lines: Iterable[bytes], log_filter: LogFilter) -> Iterator[bytes]:
+    """Пропускает записи целиком, вместе со строками продолжения"""
+    keep = False
+    for line in lines:
+        match = RECORD_PREFIX.match(line)
+        if match is not None:
+            keep = log_filter.accepts(match.group(1), match.group(2))
+        if keep:
+            yield line
+
+
+class SplitZipWriter:
+    """Пишет строки в zip-архивы потоком и начинает новую часть, когда сжатая часть дорастает до part_bytes"""
+
+    def __init__(self, directory: str, prefix: str = ARCHIVE_PREFIX, part_bytes: int = ARCHIVE_PART_BYTES):
+        self.directory = directory
+        self.prefix = prefix
+        self.part_bytes = part_bytes
+        self.paths: list[str] = []
+        self._file: BinaryIO | None = None
+        self._zip: ZipFile | None = None
+
+    def _is_full(self) -> bool:
+        return self._file is not None and self._file.tell() >= self.part_bytes
+
+    def _open_part(self) -> None:
+        path = os.path.join(self.directory, f"{self.prefix}_{len(self.paths) + 1}.zip")
+        self._file = open(path, "wb")
+        self._zip = ZipFile(self._file, "w", ZIP_DEFLATED)
+        self.paths.append(path)
+
+    def _close_part(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._file.close()
+        self._zip = None
+        self._file = None
+
+    def write(self, name: str, lines: Iterable[bytes], cancelled: threading.Event | None = None) -> None:
+        """Файл, который не поместился в часть, продолжается в следующей под именем name.2, name.3 и т.д."""
+        stream = None
+        piece = 1
+        unchecked = 0
+        for line in lines:
+            if stream is None:
+                if self._zip is None or self._is_full():
+                    self._close_part()
+                    self._open_part()
+                stream = self._zip.open(name if piece == 1 else f"{name}.{piece}", "w")
+            stream.write(line)
+            unchecked += len(line)
+            if unchecked >= SIZE_CHECK_EVERY_BYTES:
+                unchecked = 0
+                raise_if_cancelled(cancelled)
+                if self._is_full():
+                    stream.close()
+                    stream = None
+                    piece += 1
+        if stream is not None:
+            stream.close()
+
+    def close(self) -> list[str]:
+        self._close_part()
+        return self.paths
+
+
+def build_archives(paths: list[str], log_filter: LogFilter, part_bytes: int = ARCHIVE_PART_BYTES,
+                   cancelled: threading.Event | None = None) -> tuple[str, list[str]]:
+    """
+    Задача для пула: упаковывает логи в zip по фильтру и возвращает временную папку и пути частей.
+    Закрытые файлы за даты вне фильтра не читаются вовсе. После отправки папку удаляет вызывающий
+    """
+    directory = mkdtemp(prefix="zoo_logs_")
+    writer = SplitZipWriter(directory, part_bytes=part_bytes)
+    try:
+        for path in sorted(paths, key=lambda path: (get_rotated_date(path) or date.max, path)):
+            rotated_date = get_rotated_date(path)
+            if rotated_date is not None and not log_filter.may_contain(rotated_date):
+                continue
+            with open(path, "rb") as file:
+                lines = file if log_filter.is_empty else iter_filtered_lines(file, log_filter)
+                writer.write(os.path.basename(path), lines, cancelled)
+        return directory, writer.close()
+    except BaseException:
+        writer.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
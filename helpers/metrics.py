@@ -0,0 +1,78 @@
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class PoolMetrics:
+    """Счетчики пула соединений и запросов одного движка. Заполняются событиями SQLAlchemy"""
+
+    def __repr__(self):
+        return f"PoolMetrics(name={self.name}, " \
+               f"connects={self.connects}, " \
+               f"checkouts={self.checkouts}, " \
+               f"checked_out={self.checked_out}, " \
+               f"queries={self.queries})"
+
+    def __str__(self):
+        average = self.query_seconds / self.queries * 1000 if self.queries else 0
+        return f"Пул {self.name}: соединений открыто {self.connects}, выдано {self.checkouts}, " \
+               f"сейчас занято {self.checked_out} (максимум {self.max_checked_out}). " \
+               f"Запросов {self.queries}, в среднем {average:.1f}мс, самый долгий {self.slowest_query * 1000:.1f}мс"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.connects = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slowest_query = 0.0
+
+    def on_connect(self, *_) -> None:
+        self.connects += 1
+
+    def on_checkout(self, *_) -> None:
+        self.checkouts += 1
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self, *_) -> None:
+        self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_query(self, duration: float) -> None:
+        self.queries += 1
+        self.query_seconds += duration
+        self.slowest_query = max(self.slowest_query, duration)
+
+
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+def instrument(engine: AsyncEngine, name: str) -> PoolMetrics:
+    """Подключает счетчики к движку. Для каждого движка (основная база, реплика) ведутся свои"""
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine.pool, "connect", metrics.on_connect)
+    event.listen(sync_engine.pool, "checkout", metrics.on_checkout)
+    event.listen(sync_engine.pool, "checkin", metrics.on_checkin)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.on_query(perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+    return metrics
+
+
+def report() -> str:
+    return "\n".join(str(metrics) for metrics in pool_metrics.values()) or "Метрик пока нет"
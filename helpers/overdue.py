@@ -0,0 +1,72 @@
+import logging
+from datetime import date, datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from helpers import render
+from helpers.admins import roster
+from models import Resource, ResourceRow, RollupWatermark, Visitor
+
+DIGEST_NAME = "overdue_digest"
+
+
+def holder_blocks(overdue: list[tuple[ResourceRow, int]], today: date, limit: int = render.MESSAGE_LIMIT) -> list[str]:
+    """
+    Блок текста на каждого владельца. overdue - как в Resource.get_overdue, уже по порядку почт.
+    Блок длиннее limit продолжается в следующем блоке с той же почтой
+    """
+    blocks: list[str] = []
+    holder = None
+    for resource, queue_length in overdue:
+        days = (today - resource.return_date.date()).days
+        line = f"{resource.name} ({resource.category_name}) /history{resource.id} - " \
+               f"с {resource.return_date.strftime(r'%d.%m.%Y')}, {days} дн."
+        line += f", в очереди {queue_length}\r\n" if queue_length else "\r\n"
+        if resource.user_email != holder:
+            holder = resource.user_email
+            blocks.append(f"{holder}:\r\n")
+        elif len(blocks[-1]) + len(line) + 2 > limit:
+            blocks.append(f"{holder} (продолжение):\r\n")
+        blocks[-1] += line
+    return [block + "\r\n" for block in blocks]
+
+
+def overdue_messages(overdue: list[tuple[ResourceRow, int]], today: date) -> list[str]:
+    """Сообщения со всеми просроченными устройствами. Блок владельца не разрывается между сообщениями"""
+    holders = len({resource.user_email for resource, _ in overdue})
+    header = f"Просрочено устройств: {len(overdue)}, у пользователей: {holders}\r\n\r\n"
+    blocks = holder_blocks(overdue, today, render.MESSAGE_LIMIT - len(header))
+    bounds = render.split_pages([len(block) for block in blocks], reserved=len(header), max_elements=len(blocks))
+    return [header + "".join(blocks[left:right]) for left, right in zip(bounds, bounds[1:] + [len(blocks)])]
+
+
+async def get_overdue_messages(today: date | None = None) -> list[str]:
+    today = today or date.today()
+    return overdue_messages(await Resource.get_overdue(datetime.combine(today, datetime.min.time())), today)
+
+
+async def send_digest(bot: Bot, today: date | None = None) -> int:
+    """
+    Задача планировщика: раз в день присылает каждому админу все просроченные устройства несколькими сообщениями.
+    День отмечается в rollup_watermark до отправки, поэтому повторный запуск в этот день ничего не шлет.
+    Возвращает число отправленных сообщений
+    """
+    today = today or date.today()
+    if not await RollupWatermark.claim(DIGEST_NAME, today):
+        return 0
+    messages = await get_overdue_messages(today)
+    if len(messages) == 0:
+        return 0
+    admins = [visitor for visitor in await Visitor.get({"is_admin": True}, primary=True)
+              if roster.is_admin(visitor) and visitor.chat_id is not None]
+    sent = 0
+    for admin in admins:
+        try:
+            for text in messages:
+                await bot.send_message(admin.chat_id, text)
+                sent += 1
+        except TelegramAPIError as e:
+            logging.error(f"Не удалось отправить сводку просроченных устройств админу {admin.email}: {e}")
+    logging.info(f"Сводка просроченных устройств отправлена {len(admins)} админам, сообщений: {sent}")
+    return sent
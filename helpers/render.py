@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+from models import ActionType, Resource, ResourceRow
+
+MESSAGE_LIMIT = 4096
+CARD_CACHE_SIZE = 5000
+
+
+class CardCache:
+    """
+    Тексты карточек устройств по (id, версия строки). Любая запись в resource меняет версию,
+    поэтому устаревшая карточка из кэша не достается, а вытесняется как самая давняя
+    """
+
+    def __repr__(self):
+        return f"CardCache(size={len(self._cards)}, " \
+               f"max_size={self.max_size}, " \
+               f"hits={self.hits}, " \
+               f"misses={self.misses})"
+
+    def __init__(self, max_size: int = CARD_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cards: OrderedDict[tuple[int, int], str] = OrderedDict()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def get(self, resource: Resource | ResourceRow) -> str:
+        version = getattr(resource, "version", None)
+        if version is None:
+            return str(resource)
+        key = (resource.id, version)
+        card = self._cards.get(key)
+        if card is not None:
+            self.hits += 1
+            self._cards.move_to_end(key)
+            return card
+        self.misses += 1
+        card = str(resource)
+        self._cards[key] = card
+        if len(self._cards) > self.max_size:
+            self._cards.popitem(last=False)
+        return card
+
+
+cards = CardCache()
+
+
+def render_note(resource: Resource | ResourceRow, action: ActionType, is_admin: bool) -> str:
+    """Карточка из кэша и команды, которые зависят от того, кто смотрит"""
+    suffix = f"{action.value}{resource.id}\r\n"
+    if is_admin:
+        suffix += f"{ActionType.EDIT.value}{resource.id}\r\n"
+        suffix += f"История: /history{resource.id}\r\n"
+    return f"{cards.get(resource)}\r\n{suffix}\r\n"
+
+
+def split_pages(lengths: list[int], reserved: int = 0, limit: int = MESSAGE_LIMIT, max_elements: int = 10) -> list[int]:
+    """
+    Возвращает индексы первых элементов страниц так, чтобы текст каждой страницы вместе с заголовком длины reserved
+    не превышал limit символов и на странице было не больше max_elements элементов.
+    Элемент, который не влезает даже один, занимает отдельную страницу
+    """
+    bounds = []
+    page_length = page_elements = 0
+    for index, length in enumerate(lengths):
+        if len(bounds) == 0 or page_elements == max_elements or page_length + length > limit - reserved:
+            bounds.append(index)
+            page_length = page_elements = 0
+        page_length += length
+        page_elements += 1
+    return bounds
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import zlib
+from datetime import datetime, time, timedelta
+from time import perf_counter
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import func, select
+
+from models import get_engine
+
+# верхняя граница сна: так планировщик замечает сдвиг системных часов не позже, чем через минуту
+MAX_SLEEP_SECONDS = 60
+LOCK_PREFIX = "zoo_job:"
+
+
+def get_next_run(now: datetime, every: timedelta, at: time | None = None) -> datetime:
+    """Без at задача повторяется каждые every от now, с at - каждый день в это время"""
+    if at is None:
+        return now + every
+    next_run = datetime.combine(now.date(), at)
+    return next_run if next_run > now else next_run + timedelta(days=1)
+
+
+def get_lock_key(name: str) -> int:
+    """Ключ pg_advisory_lock: одинаковый для задачи с этим именем во всех репликах бота"""
+    return zlib.crc32(f"{LOCK_PREFIX}{name}".encode())
+
+
+class Job:
+    __slots__ = ("name", "fn", "every", "at", "next_run", "runs", "skipped", "failures", "last_seconds")
+
+    def __repr__(self):
+        return f"Job(name={self.name}, every={self.every}, at={self.at}, next_run={self.next_run}, " \
+               f"runs={self.runs}, skipped={self.skipped}, failures={self.failures})"
+
+    def __init__(self, name: str, fn: Callable[[], Awaitable[Any]], every: timedelta, at: time | None,
+                 next_run: datetime):
+        self.name = name
+        self.fn = fn
+        self.every = every
+        self.at = at
+        self.next_run = next_run
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_seconds: float | None = None
+
+
+class Scheduler:
+    """
+    Фоновые задачи бота: партиции и уплотнение журнала, ночные расчеты. Бот может работать в нескольких репликах,
+    поэтому перед запуском задача берет pg_try_advisory_lock со своим ключом. Если задачу уже выполняет другая
+    реплика, этот запуск пропускается. Блокировка держится на отдельном соединении и снимается сама,
+    если соединение оборвется. Реплика, проснувшаяся чуть позже, может выполнить ту же задачу еще раз,
+    поэтому задачи должны быть идемпотентны
+    """
+
+    def __repr__(self):
+        return f"Scheduler(jobs={list(self._jobs.values())})"
+
+    def __str__(self):
+        jobs = ", ".join(f"{job.name} ({job.runs}, пропущено {job.skipped}, ошибок {job.failures})"
+                         for job in self._jobs.values())
+        return f"Фоновые задачи: {jobs or 'нет'}"
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._task: asyncio.Task | None = None
+
+    def add(self, name: str, fn: Callable[[], Awaitable[Any]], every: timedelta = timedelta(days=1),
+            at: time | None = None) -> None:
+        """Задача без at первый раз выполняется сразу после старта, с at - в ближайшее это время"""
+        now = datetime.now()
+        self._jobs[name] = Job(name, fn, every, at, now if at is None else get_next_run(now, every, at))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now()
+            for job in self._jobs.values():
+                if job.next_run <= now:
+                    await self.run_job(job)
+                    job.next_run = get_next_run(datetime.now(), job.every, job.at)
+            next_run = min((job.next_run for job in self._jobs.values()), default=None)
+            delay = MAX_SLEEP_SECONDS if next_run is None else (next_run - datetime.now()).total_seconds()
+            await asyncio.sleep(min(max(delay, 0), MAX_SLEEP_SECONDS))
+
+    async def run_job(self, job: Job) -> bool:
+        """Возвращает False, если задачу сейчас выполняет другая реплика или она упала"""
+        key = get_lock_key(job.name)
+        try:
+            async with get_engine().connect() as conn:
+                locked = (await conn.execute(select(func.pg_try_advisory_lock(key)))).scalar()
+                # блокировка сессионная, а открытая на все время задачи транзакция мешала бы vacuum
+                await conn.commit()
+                if not locked:
+                    job.skipped += 1
+                    logging.info(f"Задачу {job.name} уже выполняет другая реплика бота")
+                    return False
+                try:
+                    started = perf_counter()
+                    await job.fn()
+                    job.last_seconds = perf_counter() - started
+                    job.runs += 1
+                    logging.info(f"Задача {job.name} выполнена за {job.last_seconds:.1f}с")
+                    return True
+                finally:
+                    await conn.execute(select(func.pg_advisory_unlock(key)))
+                    await conn.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            job.failures += 1
+            logging.exception(f"Задача {job.name} упала, следующая попытка по расписанию")
+            return False
+
+
+scheduler = Scheduler()
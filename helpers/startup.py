@@ -0,0 +1,33 @@
+import logging
+from time import perf_counter
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    """Замеряет длительность фаз запуска. Фазы могут выполняться параллельно, поэтому сумма может превышать итог"""
+
+    def __repr__(self):
+        return f"StartupTimer(phases={self.phases})"
+
+    def __str__(self):
+        phases = ", ".join(f"{name} {duration:.2f}с" for name, duration in self.phases.items())
+        return f"Запуск занял {self.total():.2f}с: {phases}"
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases: dict[str, float] = {}
+
+    async def measure(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[name] = perf_counter() - start
+
+    def total(self) -> float:
+        return perf_counter() - self.started
+
+    def report(self) -> None:
+        logging.info(str(self))
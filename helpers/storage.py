@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from copy import copy
+from time import monotonic
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+DIALOG_TTL_SECONDS = 30 * 60
+MAX_DIALOGS = 10000
+SWEEP_SECONDS = 60
+NO_STATE_GROUP = "без состояния"
+
+ExpireCallback = Callable[[StorageKey, str | None], Awaitable[None]]
+
+
+class Dialog:
+    __slots__ = ("state", "data", "touched_at")
+
+    def __init__(self):
+        self.state: str | None = None
+        self.data: dict[str, Any] = {}
+        self.touched_at = monotonic()
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM-хранилище в памяти, которое не растет бесконечно. Запись живет, пока у диалога есть состояние или данные,
+    и удаляется, если пользователь не отвечал ttl секунд или диалогов стало больше max_dialogs (самые давние).
+    Просроченные диалоги убирает фоновая задача, а on_expire позволяет сообщить пользователю, что диалог сброшен
+    """
+
+    def __repr__(self):
+        return f"BoundedMemoryStorage(dialogs={len(self.dialogs)}, " \
+               f"ttl={self.ttl}, " \
+               f"max_dialogs={self.max_dialogs}, " \
+               f"expired={self.expired}, " \
+               f"evicted={self.evicted})"
+
+    def __str__(self):
+        groups = ", ".join(f"{group} {count}" for group, count in sorted(self.gauges().items())) or "нет"
+        return f"Незавершенных диалогов {len(self.dialogs)}: {groups}. " \
+               f"Сброшено по времени {self.expired}, вытеснено по лимиту {self.evicted}"
+
+    def __init__(self, ttl: float = DIALOG_TTL_SECONDS, max_dialogs: int = MAX_DIALOGS,
+                 sweep_interval: float = SWEEP_SECONDS, on_expire: ExpireCallback | None = None):
+        self.ttl = ttl
+        self.max_dialogs = max_dialogs
+        self.sweep_interval = sweep_interval
+        self.on_expire = on_expire
+        self.dialogs: OrderedDict[StorageKey, Dialog] = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+        self._task: asyncio.Task | None = None
+        self._notifications: set[asyncio.Task] = set()
+
+    def gauges(self) -> dict[str, int]:
+        """Число живых диалогов по группам состояний, например AddResourceFSM"""
+        return dict(Counter(
+            dialog.state.split(":")[0] if dialog.state else NO_STATE_GROUP for dialog in self.dialogs.values()
+        ))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sweep_forever())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        dialog = self._get(key, create=state is not None)
+        if dialog is not None:
+            dialog.state = state
+            self._drop_if_empty(key, dialog)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        dialog = self._get(key)
+        return dialog.state if dialog is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        dialog = self._get(key, create=len(data) != 0)
+        if dialog is not None:
+            dialog.data = data.copy()
+            self._drop_if_empty(key, dialog)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        dialog = self._get(key)
+        return dialog.data.copy() if dialog is not None else {}
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any | None = None) -> Any | None:
+        dialog = self._get(storage_key)
+        return copy(dialog.data.get(dict_key, default)) if dialog is not None else default
+
+    def sweep(self) -> int:
+        """Удаляет просроченные диалоги. Они упорядочены по последнему обращению, поэтому проверяются только старые"""
+        deadline = monotonic() - self.ttl
+        count = 0
+        while len(self.dialogs) != 0:
+            key, dialog = next(iter(self.dialogs.items()))
+            if dialog.touched_at > deadline:
+                break
+            self._expire(key, dialog)
+            count += 1
+        return count
+
+    def _get(self, key: StorageKey, create: bool = False) -> Dialog | None:
+        dialog = self.dialogs.get(key)
+        if dialog is not None and monotonic() - dialog.touched_at >= self.ttl:
+            self._expire(key, dialog)
+            dialog = None
+        if dialog is None:
+            if not create:
+                return None
+            dialog = self.dialogs[key] = Dialog()
+            self._evict_overflow()
+        dialog.touched_at = monotonic()
+        self.dialogs.move_to_end(key)
+        return dialog
+
+    def _drop_if_empty(self, key: StorageKey, dialog: Dialog) -> None:
+        if dialog.state is None and len(dialog.data) == 0:
+            self.dialogs.pop(key, None)
+
+    def _evict_overflow(self) -> None:
+        while len(self.dialogs) > self.max_dialogs:
+            key, dialog = self.dialogs.popitem(last=False)
+            self.evicted += 1
+            logging.warning(f"Диалогов больше {self.max_dialogs}: сброшен самый давний, chat_id {key.chat_id}, "
+                            f"состояние {dialog.state}")
+            self._notify(key, dialog)
+
+    def _expire(self, key: StorageKey, dialog: Dialog) -> None:
+        self.dialogs.pop(key, None)
+        self.expired += 1
+        logging.info(f"Сброшен заброшенный диалог: chat_id {key.chat_id}, состояние {dialog.state}")
+        self._notify(key, dialog)
+
+    def _notify(self, key: StorageKey, dialog: Dialog) -> None:
+        if self.on_expire is None or dialog.state is None:
+            return
+        task = asyncio.create_task(self._run_notification(key, dialog.state))
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    async def _run_notification(self, key: StorageKey, state: str) -> None:
+        try:
+            await self.on_expire(key, state)
+        except Exception as e:
+            logging.warning(f"Не удалось сообщить chat_id {key.chat_id} о сброшенном диалоге: {e!r}")
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
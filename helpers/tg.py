@@ -4,7 +4,7 @@ from aiogram import types
 from aiogram.types import ReplyKeyboardMarkup, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
-from helpers import db, chat
+from helpers import db, chat, render
 
 
 def get_reply_keyboard(elements: list[str]) -> ReplyKeyboardMarkup:
@@ -15,11 +15,14 @@ def get_reply_keyboard(elements: list[str]) -> ReplyKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_inline_keyboard(elements: list[str], callback_data: str) -> InlineKeyboardMarkup:
+def get_inline_keyboard(elements: list[str], callback_data: str,
+                        labels: dict[str, str] | None = None) -> InlineKeyboardMarkup:
+    """labels - подписи кнопок, если они отличаются от значения в callback_data"""
+    labels = labels or {}
     builder = InlineKeyboardBuilder()
     for element in elements:
         builder.row(types.InlineKeyboardButton(
-            text=f"{element}",
+            text=labels.get(element, f"{element}"),
             callback_data=f"{callback_data} {element}")
         )
     builder.adjust(2)
@@ -40,9 +43,12 @@ class Paginator:
                f"количество элементов {self.page_elements}, " \
                f"количество видимых страниц {self.visible_results}"
 
-    def __init__(self, page: int, objects: list, visible_results: int = 5, page_elements: int = 5):
+    def __init__(self, page: int, objects: list, visible_results: int = 5, page_elements: int = 5,
+                 bounds: list[int] | None = None):
+        """bounds - индексы первых элементов страниц, если страницы разного размера. Иначе по visible_results"""
         self.objects = objects
-        self.pages = math.ceil(len(objects) / visible_results)
+        self.bounds = bounds
+        self.pages = len(bounds) if bounds is not None else math.ceil(len(objects) / visible_results)
         self.visible_results = visible_results
         self.page_elements = page_elements
         self.page = page
@@ -75,7 +81,17 @@ class Paginator:
         left, right = self.get_array_indexes()
         return self.objects[left: right + 1]
 
+    def set_bounds(self, bounds: list[int]) -> None:
+        """Переключает на страницы разного размера. Если страниц стало меньше, открывается последняя"""
+        self.bounds = bounds
+        self.pages = len(bounds)
+        self.page = min(self.page, self.pages)
+
     def get_array_indexes(self) -> tuple[int, int]:
+        if self.bounds is not None:
+            left_index = self.bounds[self.page - 1]
+            right_index = self.bounds[self.page] - 1 if self.page < self.pages else len(self.objects) - 1
+            return left_index, right_index
         left_index = 0 + self.visible_results * (self.page - 1)
         right_index = min((self.visible_results - 1) + self.visible_results * (self.page - 1), len(self.objects) - 1)
         return left_index, right_index
@@ -87,8 +103,16 @@ class Paginator:
 
 
 async def get_standard_paginator(page, resources, command_name, chat_id) -> tuple[str, InlineKeyboardMarkup]:
-    paginator = Paginator(page, resources)
+    """Размер страницы подбирается по длине карточек, чтобы сообщение влезло в лимит Телеграма"""
+    notes = await db.render_notes(resources, chat_id)
+    return get_notes_paginator(page, notes, command_name)
+
+
+def get_notes_paginator(page: int, notes: list[str], command_name: str) -> tuple[str, InlineKeyboardMarkup]:
+    paginator = Paginator(page, notes)
+    header = paginator.result_message()
+    paginator.set_bounds(render.split_pages([len(note) for note in notes], reserved=len(header)))
     keyboard = paginator.create_keyboard(command_name)
-    notes = await db.format_notes(paginator.get_objects_on_page(), chat_id)
-    reply = paginator.result_message() + notes
+    left, right = paginator.get_array_indexes()
+    reply = header + "".join(notes[left: right + 1])
     return reply, keyboard
@@ -1,15 +1,31 @@
 import asyncio
+import gc
 import logging
+from datetime import time, timedelta
+from functools import partial
 from logging.handlers import TimedRotatingFileHandler
 from os import getenv
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import ReplyKeyboardRemove
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
-from handlers import backdoor, search, auth, add_resource, take, cancel, edit, actions
-from models import Base, BDInit, engine
+import migrations
+from handlers import backdoor, search, auth, add_resource, take, cancel, edit, actions, history, stats, overdue
+from helpers import analytics, chat
+from helpers.admins import roster
+from helpers.changefeed import changefeed
+from helpers.executor import executor
+from helpers.overdue import send_digest
+from helpers.scheduler import scheduler
+from helpers.startup import StartupTimer
+from helpers.storage import BoundedMemoryStorage
+from middlewares.auth_middleware import AuthMiddleware
+from middlewares.commands import CommandMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from models import BDInit, Event
 
 SECRETS_IN_FILE = getenv("SECRETS_IN_FILE")
 if SECRETS_IN_FILE == "true":
@@ -25,6 +41,7 @@ WEBHOOK_ROUTE = "/webhook"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_ROUTE}"
 
 USE_POLLING = getenv("USE_POLLING") == "true"
+FAST_STARTUP = getenv("STARTUP_MODE", "fast") == "fast"
 
 WEBAPP_HOST = getenv("ZOO_HOST")
 WEBAPP_PORT = int(getenv("ZOO_PORT"))
@@ -38,19 +55,60 @@ COMMANDS = [
 ]
 
 
-async def init_base():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    await BDInit.init()
+async def init_base(timer: StartupTimer, bot: Bot):
+    if FAST_STARTUP:
+        await timer.measure("migrations", migrations.upgrade_if_needed())
+    else:
+        await timer.measure("migrations", migrations.upgrade())
+    changefeed.start()
+    schedule_jobs(bot)
+    await asyncio.gather(
+        timer.measure("db_init", BDInit.init()),
+        timer.measure("db_warmup", BDInit.warm_up()),
+        timer.measure("admins", roster.start())
+    )
 
 
-async def main(with_test_data: bool = False):
-    await init_base()
-    if with_test_data:
-        await BDInit.prepare_test_data()
-    bot = Bot(token=TOKEN)
-    await bot.set_my_commands(COMMANDS)
-    dp = Dispatcher(storage=MemoryStorage())
+def schedule_jobs(bot: Bot) -> None:
+    scheduler.add("event_partitions", Event.ensure_partitions, every=timedelta(hours=6))
+    scheduler.add("event_compaction", Event.compact_cold, at=time(3, 30))
+    scheduler.add("usage_rollup", analytics.run_rollup, at=time(4, 0))
+    scheduler.add("overdue_digest", partial(send_digest, bot), at=time(10, 0))
+    scheduler.start()
+
+
+async def prepare_bot(bot: Bot) -> None:
+    """Вызовы Telegram API не зависят друг от друга и от базы, поэтому выполняются параллельно"""
+    if USE_POLLING:
+        await asyncio.gather(
+            bot.set_my_commands(COMMANDS),
+            bot.delete_webhook(drop_pending_updates=True)
+        )
+        return
+    logging.info(f"Телеграму передан адрес вебхука: {WEBHOOK_URL}")
+    await asyncio.gather(
+        bot.set_my_commands(COMMANDS),
+        bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, drop_pending_updates=True)
+    )
+
+
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    async def notify_expired_dialog(key: StorageKey, state: str) -> None:
+        await bot.send_message(key.chat_id, chat.dialog_expired_msg, reply_markup=ReplyKeyboardRemove())
+
+    storage = BoundedMemoryStorage(on_expire=notify_expired_dialog)
+    storage.start()
+    dp = Dispatcher(storage=storage)
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    dp.message.outer_middleware(CommandMiddleware())
+    dp.message.outer_middleware(AuthMiddleware())
+    dp.shutdown.register(changefeed.stop)
+    dp.shutdown.register(roster.stop)
+    dp.shutdown.register(storage.close)
+    dp.shutdown.register(executor.stop)
+    dp.shutdown.register(scheduler.stop)
     dp.include_router(cancel.router)
     dp.include_router(backdoor.router)
     dp.include_router(auth.router)
@@ -58,20 +116,38 @@ async def main(with_test_data: bool = False):
     dp.include_router(take.router)
     dp.include_router(edit.router)
     dp.include_router(actions.router)
+    dp.include_router(history.router)
+    dp.include_router(stats.router)
+    dp.include_router(overdue.router)
     dp.include_router(search.router)
-    await bot.delete_webhook(drop_pending_updates=True)
+    return dp
+
+
+async def main(with_test_data: bool = False):
+    timer = StartupTimer()
+    bot = Bot(token=TOKEN)
+    await asyncio.gather(
+        init_base(timer, bot),
+        timer.measure("telegram", prepare_bot(bot))
+    )
+    if with_test_data:
+        await BDInit.prepare_test_data()
+    dp = create_dispatcher(bot)
+    # модули, инвентарь и пул соединений живут до остановки бота: полная сборка мусора больше не обходит их,
+    # и импорт большого csv не останавливает цикл событий на десятки миллисекунд
+    gc.freeze()
     if USE_POLLING:
         logging.info("Приложение запустилось в режиме polling")
+        timer.report()
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
         return
-    logging.info(f"Телеграму передан адрес вебхука: {WEBHOOK_URL}")
-    await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
     app = web.Application()
     webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET)
     webhook_requests_handler.register(app, path=WEBHOOK_ROUTE)
     setup_application(app, dp, bot=bot)
     logging.info(f"Приложение запустилось на сервере. Хост: {WEBAPP_HOST}, порт: {WEBAPP_PORT}. "
                  f"URL вебхука: {WEBHOOK_HOST}")
+    timer.report()
     await web._run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
 
 
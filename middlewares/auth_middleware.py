@@ -13,7 +13,6 @@ class AuthMiddleware(BaseMiddleware):
             event: Message,
             data: Dict[str, Any]
     ) -> Any:
-        if await Visitor.is_exist(event.chat.id):
-            data["authorized"] = True
+        data["authorized"] = await Visitor.is_exist(event.chat.id)
         result = await handler(event, data)
         return result
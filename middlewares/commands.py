@@ -0,0 +1,62 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+
+class ParsedCommand:
+    """Команда вида /take12, /edit 5 или /edit5@zoo_bot: имя без слэша, id устройства и текст после команды"""
+    __slots__ = ("name", "id", "args")
+
+    def __repr__(self):
+        return f"ParsedCommand(name={self.name}, id={self.id}, args={self.args})"
+
+    def __init__(self, name: str, id: int | None, args: str):
+        self.name = name
+        self.id = id
+        self.args = args
+
+
+def parse_command(text: str | None) -> ParsedCommand | None:
+    if not text or text[0] != "/":
+        return None
+    token, _, args = text.partition(" ")
+    token = token.partition("@")[0]
+    name = token[1:].rstrip("0123456789")
+    digits = token[len(name) + 1:]
+    args = args.strip()
+    if not digits:
+        # /edit 5 - id через пробел тоже принимается
+        first, _, rest = args.partition(" ")
+        if first.isdecimal():
+            digits, args = first, rest.strip()
+    return ParsedCommand(name, int(digits) if digits else None, args)
+
+
+class CommandMiddleware(BaseMiddleware):
+    """Разбирает команду один раз на сообщение и кладет ее в data["parsed_command"] для фильтра IdCommand"""
+
+    async def __call__(
+            self,
+            handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+            event: Message,
+            data: Dict[str, Any]
+    ) -> Any:
+        data["parsed_command"] = parse_command(event.text)
+        return await handler(event, data)
+
+
+class IdCommand(BaseFilter):
+    """
+    Пропускает команды вида /<name><id> с именем из names и передает в обработчик resource_id.
+    Вместо регулярного выражения на каждый обработчик - сравнение уже разобранного имени с множеством
+    """
+
+    def __init__(self, *names: str):
+        self.names = frozenset(names)
+
+    async def __call__(self, message: Message, parsed_command: ParsedCommand | None = None) -> bool | Dict[str, Any]:
+        if parsed_command is None or parsed_command.id is None or parsed_command.name not in self.names:
+            return False
+        return {"resource_id": parsed_command.id, "command_name": parsed_command.name}
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from helpers import chat
+
+THROTTLE_RATE = 1.0
+THROTTLE_BURST = 5
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity. Каждое событие забирает один токен"""
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "warned")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.warned = False
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.warned = False
+        return True
+
+
+class PageClicks:
+    """Очередь нажатий по кнопкам одного сообщения: выполняется только самое свежее из ожидающих"""
+    __slots__ = ("lock", "generation", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.generation = 0
+        self.waiting = 0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту сообщений и нажатий кнопок от одного чата, не обращаясь к базе.
+    Лишние сообщения отбрасываются с одним предупреждением, лишние нажатия получают пустой call.answer().
+    Нажатия по одному сообщению выполняются по очереди, а если пока шло одно, пришло несколько,
+    выполняется только последнее
+    """
+
+    def __repr__(self):
+        return f"ThrottlingMiddleware(rate={self.rate}, burst={self.burst}, buckets={len(self.buckets)}, " \
+               f"throttled={self.throttled}, coalesced={self.coalesced})"
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST, max_buckets: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self.buckets: dict[int, TokenBucket] = {}
+        self.clicks: dict[tuple[int, int], PageClicks] = {}
+        self.throttled = 0
+        self.coalesced = 0
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            return await self._handle_callback(handler, event, data)
+        if isinstance(event, Message) and not self.allow(event.chat.id):
+            bucket = self.buckets[event.chat.id]
+            if not bucket.warned:
+                bucket.warned = True
+                await event.answer(chat.throttled_msg)
+            return None
+        return await handler(event, data)
+
+    def allow(self, chat_id: int) -> bool:
+        now = monotonic()
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._drop_idle_buckets(now)
+            bucket = self.buckets[chat_id] = TokenBucket(self.rate, self.burst, now)
+        if bucket.take(now):
+            return True
+        self.throttled += 1
+        logging.info(f"Запрос от chat_id {chat_id} отброшен: превышена частота запросов")
+        return False
+
+    def _drop_idle_buckets(self, now: float) -> None:
+        for chat_id in [chat_id for chat_id, bucket in self.buckets.items()
+                        if bucket.tokens + (now - bucket.updated_at) * bucket.rate >= bucket.capacity]:
+            del self.buckets[chat_id]
+
+    async def _handle_callback(self, handler, call: CallbackQuery, data: Dict[str, Any]) -> Any:
+        if call.message is None:
+            return await handler(call, data)
+        if not self.allow(call.message.chat.id):
+            await call.answer()
+            return None
+        key = (call.message.chat.id, call.message.message_id)
+        clicks = self.clicks.setdefault(key, PageClicks())
+        clicks.generation += 1
+        generation = clicks.generation
+        clicks.waiting += 1
+        try:
+            async with clicks.lock:
+                if generation != clicks.generation:
+                    self.coalesced += 1
+                    await call.answer()
+                    return None
+                return await handler(call, data)
+        finally:
+            clicks.waiting -= 1
+            if clicks.waiting == 0:
+                del self.clicks[key]
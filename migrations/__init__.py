@@ -0,0 +1,66 @@
+import logging
+import os
+from functools import cache
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+import models
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+BASELINE_REVISION = "0001"
+
+
+def get_config(connection: Connection | None = None) -> Config:
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+@cache
+def get_head_revision() -> str:
+    return ScriptDirectory.from_config(get_config()).get_current_head()
+
+
+async def get_current_revision() -> str | None:
+    async with models.get_engine().connect() as connection:
+        try:
+            return (await connection.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+        except DBAPIError:
+            return None
+
+
+async def is_up_to_date() -> bool:
+    """Сверяет ревизию в базе с последней ревизией из файлов миграций за один запрос, не загружая alembic env"""
+    return await get_current_revision() == get_head_revision()
+
+
+def _upgrade(connection: Connection, revision: str) -> None:
+    tables = inspect(connection).get_table_names()
+    connection.commit()
+    config = get_config(connection)
+    if "alembic_version" not in tables and "resource" in tables:
+        logging.info(f"База создана до появления миграций, помечаем ее ревизией {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, revision)
+
+
+async def upgrade(revision: str = "head") -> None:
+    """Накатывает миграции до ревизии revision. Базу, созданную через create_all, сначала помечает базовой ревизией"""
+    async with models.get_engine().connect() as connection:
+        await connection.run_sync(_upgrade, revision)
+    logging.info(f"Схема базы обновлена до ревизии {revision}")
+
+
+async def upgrade_if_needed() -> bool:
+    """Накатывает миграции, только если ревизия в базе отличается от последней. Возвращает, были ли изменения"""
+    if await is_up_to_date():
+        logging.info(f"Схема базы актуальна, ревизия {get_head_revision()}")
+        return False
+    await upgrade()
+    return True
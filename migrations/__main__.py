@@ -0,0 +1,13 @@
+"""
+Применяет миграции из командной строки: python -m migrations [ревизия]
+Для остальных команд (downgrade, history, revision) используйте alembic с alembic.ini из корня проекта
+"""
+import asyncio
+import logging
+import sys
+
+from migrations import upgrade
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    asyncio.run(upgrade(sys.argv[1] if len(sys.argv) > 1 else "head"))
@@ -0,0 +1,53 @@
+"""
+Операции для миграций, которые не блокируют таблицы resource и record, пока бот обслуживает пользователей.
+Используются только внутри функций upgrade/downgrade ревизий.
+"""
+import logging
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def _is_invalid_index(index_name: str) -> bool:
+    stmt = sa.text("SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                   "WHERE c.relname = :name")
+    return bool(op.get_bind().execute(stmt, {"name": index_name}).scalar())
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: list, **kwargs) -> None:
+    """
+    Создает индекс через CREATE INDEX CONCURRENTLY вне транзакции миграции.
+    Если прошлая попытка упала и оставила невалидный индекс, он сначала удаляется
+    """
+    with op.get_context().autocommit_block():
+        if _is_invalid_index(index_name):
+            logging.warning(f"Найден невалидный индекс {index_name}, пересоздаем его")
+            op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True, if_exists=True)
+        op.create_index(index_name, table_name, columns, postgresql_concurrently=True, if_not_exists=True, **kwargs)
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True, if_exists=True)
+
+
+def backfill_in_batches(table_name: str, set_clause: str, where_clause: str, key: str = "id",
+                        batch_size: int = 1000, params: dict | None = None) -> int:
+    """
+    Заполняет колонки пачками по batch_size строк, каждая пачка в своей короткой транзакции.
+    :where_clause - условие на еще не заполненные строки, после UPDATE оно должно стать ложным,
+    например "version IS NULL"
+    """
+    stmt = sa.text(
+        f"UPDATE {table_name} SET {set_clause} WHERE {key} IN "
+        f"(SELECT {key} FROM {table_name} WHERE {where_clause} LIMIT :batch_size)"
+    )
+    total = 0
+    with op.get_context().autocommit_block():
+        while True:
+            updated = op.get_bind().execute(stmt, {**(params or {}), "batch_size": batch_size}).rowcount
+            if updated == 0:
+                break
+            total += updated
+            logging.info(f"Backfill {table_name}: обновлено {total} строк")
+    return total
@@ -0,0 +1,80 @@
+"""Исходная схема, которую раньше создавал Base.metadata.create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-03-25 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+ACTION_TYPE = sa.Enum("TAKE", "QUEUE", "RETURN", "LEAVE", "EDIT", name="actiontype")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "action",
+        sa.Column("type", ACTION_TYPE, nullable=False),
+        sa.PrimaryKeyConstraint("type"),
+        sa.UniqueConstraint("type"),
+    )
+    op.create_table(
+        "category",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_table(
+        "visitor",
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("is_admin", sa.Boolean(), nullable=False),
+        sa.Column("chat_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("full_name", sa.String(), nullable=True),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("comment", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("email"),
+    )
+    op.create_table(
+        "resource",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("category_name", sa.String(), nullable=False),
+        sa.Column("vendor_code", sa.String(), nullable=False),
+        sa.Column("reg_date", sa.DateTime(), nullable=True),
+        sa.Column("firmware", sa.String(), nullable=True),
+        sa.Column("comment", sa.String(), nullable=True),
+        sa.Column("user_email", sa.String(), nullable=True),
+        sa.Column("address", sa.String(), nullable=True),
+        sa.Column("return_date", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["category_name"], ["category.name"]),
+        sa.ForeignKeyConstraint(["user_email"], ["visitor.email"], onupdate="cascade", ondelete="cascade"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("vendor_code"),
+    )
+    op.create_table(
+        "record",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("resource", sa.Integer(), nullable=False),
+        sa.Column("user_email", sa.String(), nullable=False),
+        sa.Column("action", ACTION_TYPE, nullable=False),
+        sa.Column("time", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["action"], ["action.type"], onupdate="cascade", ondelete="cascade"),
+        sa.ForeignKeyConstraint(["resource"], ["resource.id"], onupdate="cascade", ondelete="cascade"),
+        sa.ForeignKeyConstraint(["user_email"], ["visitor.email"], onupdate="cascade", ondelete="cascade"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("record")
+    op.drop_table("resource")
+    op.drop_table("visitor")
+    op.drop_table("category")
+    op.drop_table("action")
+    ACTION_TYPE.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,34 @@
+"""Версия строки устройства для инкрементального обновления кэша инвентаря
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-04-08 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations import operations
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE IF NOT EXISTS inventory_version_seq")
+    op.add_column("resource", sa.Column("version", sa.BigInteger(), nullable=True))
+    op.alter_column("resource", "version", server_default=sa.text("nextval('inventory_version_seq')"))
+    operations.backfill_in_batches("resource", "version = nextval('inventory_version_seq')", "version IS NULL")
+    op.execute("ALTER TABLE resource ADD CONSTRAINT resource_version_not_null CHECK (version IS NOT NULL) NOT VALID")
+    op.execute("ALTER TABLE resource VALIDATE CONSTRAINT resource_version_not_null")
+    op.alter_column("resource", "version", nullable=False)
+    op.drop_constraint("resource_version_not_null", "resource")
+    operations.create_index_concurrently("ix_resource_version", "resource", ["version"])
+
+
+def downgrade() -> None:
+    operations.drop_index_concurrently("ix_resource_version", "resource")
+    op.drop_column("resource", "version")
+    op.execute("DROP SEQUENCE IF EXISTS inventory_version_seq")
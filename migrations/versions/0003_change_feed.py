@@ -0,0 +1,57 @@
+"""Триггеры NOTIFY для подписки реплик бота на изменения таблиц
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-04-15 12:00:00
+
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+CHANNEL = "zoo_changes"
+TABLE_KEYS = {"resource": "id", "visitor": "email", "record": "id", "category": "name"}
+
+
+def upgrade() -> None:
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION zoo_notify_change() RETURNS trigger AS $$
+        DECLARE
+            changed jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := to_jsonb(OLD);
+            ELSE
+                changed := to_jsonb(NEW);
+            END IF;
+            PERFORM pg_notify('{CHANNEL}', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'key', changed ->> TG_ARGV[0]
+            )::text);
+            IF TG_OP = 'UPDATE' AND (to_jsonb(OLD) ->> TG_ARGV[0]) IS DISTINCT FROM (changed ->> TG_ARGV[0]) THEN
+                PERFORM pg_notify('{CHANNEL}', json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', 'DELETE',
+                    'key', to_jsonb(OLD) ->> TG_ARGV[0]
+                )::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table, key in TABLE_KEYS.items():
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION zoo_notify_change('{key}')
+        """)
+
+
+def downgrade() -> None:
+    for table in TABLE_KEYS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS zoo_notify_change()")
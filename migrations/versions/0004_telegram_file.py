@@ -0,0 +1,29 @@
+"""file_id документов, уже загруженных в Телеграм, по хэшу содержимого
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-04-22 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "telegram_file",
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.Column("file_name", sa.String(), nullable=False),
+        sa.Column("file_id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("sha256", "file_name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("telegram_file")
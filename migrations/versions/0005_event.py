@@ -0,0 +1,79 @@
+"""Журнал смены владельцев устройств и триггер, который его пишет
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-04-29 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "event",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column("resource_id", sa.Integer(), nullable=False),
+        sa.Column("user_email", sa.String(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("time", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_event_resource_time", "event", ["resource_id", "time", "id"])
+    # Смена почты в visitor каскадом меняет user_email устройств, но владелец при этом тот же: старой почты
+    # к моменту каскада уже нет в visitor, и такое изменение в журнал не пишется
+    op.execute("""
+        CREATE OR REPLACE FUNCTION zoo_record_event() RETURNS trigger AS $$
+        DECLARE
+            old_email text;
+            new_email text;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                old_email := OLD.user_email;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                new_email := NEW.user_email;
+            END IF;
+            IF old_email IS NOT DISTINCT FROM new_email THEN
+                RETURN NULL;
+            END IF;
+            IF old_email IS NOT NULL AND new_email IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM visitor WHERE email = old_email) THEN
+                RETURN NULL;
+            END IF;
+            IF old_email IS NOT NULL THEN
+                INSERT INTO event (resource_id, user_email, type) VALUES (OLD.id, old_email, 'return');
+            END IF;
+            IF new_email IS NOT NULL THEN
+                INSERT INTO event (resource_id, user_email, type) VALUES (NEW.id, new_email, 'take');
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER resource_record_event
+        AFTER INSERT OR UPDATE OF user_email OR DELETE ON resource
+        FOR EACH ROW EXECUTE FUNCTION zoo_record_event()
+    """)
+    # нынешние владельцы попадают в журнал с датой последней записи TAKE, если она сохранилась
+    op.execute("""
+        INSERT INTO event (resource_id, user_email, type, time)
+        SELECT resource.id, resource.user_email, 'take', COALESCE(
+            (SELECT max(record.time) FROM record WHERE record.resource = resource.id
+                AND record.user_email = resource.user_email AND record.action = 'TAKE'),
+            now())
+        FROM resource WHERE resource.user_email IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS resource_record_event ON resource")
+    op.execute("DROP FUNCTION IF EXISTS zoo_record_event()")
+    op.drop_index("ix_event_resource_time", table_name="event")
+    op.drop_table("event")
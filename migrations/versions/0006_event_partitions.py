@@ -0,0 +1,98 @@
+"""Помесячные партиции журнала event, свернутые пары событий в holding и индексы record для горячих запросов
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-05-06 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations import operations
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 2
+RESET_EVENT_ID = "SELECT setval(pg_get_serial_sequence('event', 'id'), " \
+                 "COALESCE((SELECT max(id) FROM event), 0) + 1, false)"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "holding",
+        sa.Column("take_event_id", sa.BigInteger(), nullable=False),
+        sa.Column("return_event_id", sa.BigInteger(), nullable=False),
+        sa.Column("resource_id", sa.Integer(), nullable=False),
+        sa.Column("user_email", sa.String(), nullable=False),
+        sa.Column("taken_at", sa.DateTime(), nullable=False),
+        sa.Column("returned_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("take_event_id"),
+    )
+    op.create_index("ix_holding_resource_taken", "holding", ["resource_id", "taken_at", "take_event_id"])
+    op.create_index("ix_holding_resource_returned", "holding", ["resource_id", "returned_at", "return_event_id"])
+
+    # журнал появился в 0005 и еще мал, поэтому переливается целиком в одной транзакции
+    op.execute("CREATE TEMP TABLE event_copy ON COMMIT DROP AS SELECT * FROM event")
+    op.drop_index("ix_event_resource_time", table_name="event")
+    op.drop_table("event")
+    op.execute("""
+        CREATE TABLE event (
+            id bigint GENERATED BY DEFAULT AS IDENTITY,
+            resource_id integer NOT NULL,
+            user_email varchar NOT NULL,
+            type varchar NOT NULL,
+            time timestamp without time zone NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time)
+    """)
+    op.create_index("ix_event_resource_time", "event", ["resource_id", "time", "id"])
+    # запасная партиция на случай, если планировщик не успел создать партицию месяца
+    op.execute("CREATE TABLE event_default PARTITION OF event DEFAULT")
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN SELECT generate_series(
+                date_trunc('month', COALESCE((SELECT min(time) FROM event_copy), now())),
+                date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                interval '1 month'
+            )::date LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF event FOR VALUES FROM (%L) TO (%L)',
+                               'event_' || to_char(month, 'YYYY_MM'), month, month + interval '1 month');
+            END LOOP;
+        END $$
+    """)
+    op.execute("INSERT INTO event SELECT * FROM event_copy")
+    op.execute(RESET_EVENT_ID)
+
+    operations.create_index_concurrently("ix_record_user_email", "record", ["user_email", "action"])
+    operations.create_index_concurrently("ix_record_resource", "record", ["resource", "action"])
+
+
+def downgrade() -> None:
+    operations.drop_index_concurrently("ix_record_resource", "record")
+    operations.drop_index_concurrently("ix_record_user_email", "record")
+    op.execute("""
+        CREATE TEMP TABLE event_copy ON COMMIT DROP AS
+        SELECT id, resource_id, user_email, type, time FROM event
+        UNION ALL SELECT take_event_id, resource_id, user_email, 'take', taken_at FROM holding
+        UNION ALL SELECT return_event_id, resource_id, user_email, 'return', returned_at FROM holding
+    """)
+    op.drop_table("event")
+    op.drop_table("holding")
+    op.create_table(
+        "event",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column("resource_id", sa.Integer(), nullable=False),
+        sa.Column("user_email", sa.String(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("time", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_event_resource_time", "event", ["resource_id", "time", "id"])
+    op.execute("INSERT INTO event OVERRIDING SYSTEM VALUE SELECT * FROM event_copy")
+    op.execute(RESET_EVENT_ID)
@@ -0,0 +1,83 @@
+"""Ожидания в очереди, дневные сводки использования устройств и категорий и их водяной знак
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-05-13 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+USAGE_COLUMNS = ("held_seconds", "takes", "queued", "served", "wait_seconds", "queue_seconds")
+
+
+def usage_columns() -> list[sa.Column]:
+    return [sa.Column(name, sa.BigInteger(), server_default="0", nullable=False) for name in USAGE_COLUMNS]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "queue_wait",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column("resource_id", sa.Integer(), nullable=False),
+        sa.Column("user_email", sa.String(), nullable=False),
+        sa.Column("queued_at", sa.DateTime(), nullable=False),
+        sa.Column("left_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.Column("served", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_queue_wait_left_at", "queue_wait", ["left_at"])
+    # запись QUEUE удаляется, когда пользователь покинул очередь или устройство перешло к нему. Во втором случае
+    # устройство к этому моменту уже записано на него (db.pass_resource_to_next_user)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION zoo_record_queue_wait() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO queue_wait (resource_id, user_email, queued_at, served)
+            VALUES (OLD.resource, OLD.user_email, OLD.time,
+                    EXISTS (SELECT 1 FROM resource WHERE id = OLD.resource AND user_email = OLD.user_email));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER record_queue_wait
+        AFTER DELETE ON record
+        FOR EACH ROW WHEN (OLD.action = 'QUEUE') EXECUTE FUNCTION zoo_record_queue_wait()
+    """)
+    op.create_table(
+        "usage_device_day",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("resource_id", sa.Integer(), nullable=False),
+        sa.Column("category_name", sa.String(), nullable=True),
+        *usage_columns(),
+        sa.PrimaryKeyConstraint("day", "resource_id"),
+    )
+    op.create_table(
+        "usage_category_day",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("category_name", sa.String(), nullable=False),
+        sa.Column("devices", sa.Integer(), server_default="0", nullable=False),
+        *usage_columns(),
+        sa.PrimaryKeyConstraint("day", "category_name"),
+    )
+    op.create_table(
+        "rollup_watermark",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_watermark")
+    op.drop_table("usage_category_day")
+    op.drop_table("usage_device_day")
+    op.execute("DROP TRIGGER IF EXISTS record_queue_wait ON record")
+    op.execute("DROP FUNCTION IF EXISTS zoo_record_queue_wait()")
+    op.drop_index("ix_queue_wait_left_at", table_name="queue_wait")
+    op.drop_table("queue_wait")
@@ -0,0 +1,25 @@
+"""Частичный индекс по дате возврата занятых устройств для списка просроченных
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-05-20 12:00:00
+
+"""
+import sqlalchemy as sa
+
+from migrations import operations
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    operations.create_index_concurrently(
+        "ix_resource_overdue", "resource", ["return_date"],
+        postgresql_where=sa.text("user_email IS NOT NULL AND return_date IS NOT NULL"))
+
+
+def downgrade() -> None:
+    operations.drop_index_concurrently("ix_resource_overdue", "resource")
@@ -1,41 +1,159 @@
-import inspect
-import json
+import asyncio
 import logging
-from datetime import datetime
+import os
+from datetime import date, datetime
 from enum import Enum
+from functools import cache
 from os import getenv
-from typing import Optional, Self
+from time import monotonic
+from typing import Callable, ClassVar, Iterable, Optional, Self
 
 from aiogram.types import Message
-from sqlalchemy import ForeignKey, select, or_
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import (
+    BigInteger, ForeignKey, Identity, Index, Sequence, bindparam, delete, inspect, literal_column, select, or_, text,
+    true, tuple_, union_all, update
+)
+from sqlalchemy.dialects.postgresql import distinct_on, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import (
+    AsyncAttrs, AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, Mapper, mapped_column, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.sql.dml import DMLWhereBase, Insert
 from sqlalchemy.sql.operators import ilike_op
 
-SECRETS_IN_FILE = getenv("SECRETS_IN_FILE")
-if SECRETS_IN_FILE == "true":
-    SECRETS_ADDRESS = getenv("SECRETS_ADDRESS")
-    PG_DB_NAME = open(f"{SECRETS_ADDRESS}/pg_db_name").readline()
-    PG_USER = open(f"{SECRETS_ADDRESS}/pg_user").readline()
-    PG_PASSWORD = open(f"{SECRETS_ADDRESS}/pg_pass").readline()
-else:
-    PG_DB_NAME = getenv("PG_DB_NAME")
-    PG_USER = getenv("PG_USER")
-    PG_PASSWORD = getenv("PG_PASSWORD")
+from helpers.metrics import instrument
 
+SECRETS_IN_FILE = getenv("SECRETS_IN_FILE")
+SECRETS_ADDRESS = getenv("SECRETS_ADDRESS")
 DB_HOST = getenv("POSTGRES_URL")
+WARMUP_CONNECTIONS = 5
+VISITOR_CACHE_SECONDS = 30
+HISTORY_PAGE_SIZE = 20
+EVENT_HOT_MONTHS = 3
+EVENT_MONTHS_AHEAD = 2
+USAGE_COUNTERS = ("held_seconds", "takes", "queued", "served", "wait_seconds", "queue_seconds")
+
+
+def get_database_url() -> str:
+    if SECRETS_IN_FILE == "true":
+        pg_db_name = open(f"{SECRETS_ADDRESS}/pg_db_name").readline()
+        pg_user = open(f"{SECRETS_ADDRESS}/pg_user").readline()
+        pg_password = open(f"{SECRETS_ADDRESS}/pg_pass").readline()
+    else:
+        pg_db_name = getenv("PG_DB_NAME")
+        pg_user = getenv("PG_USER")
+        pg_password = getenv("PG_PASSWORD")
+    return f"postgresql+asyncpg://{pg_user}:{pg_password}@{DB_HOST}/{pg_db_name}"
+
+
+def get_read_database_url() -> str | None:
+    if SECRETS_IN_FILE == "true":
+        path = os.path.join(SECRETS_ADDRESS, "read_database_url")
+        return open(path).readline().strip() if os.path.exists(path) else None
+    return getenv("READ_DATABASE_URL") or None
+
+
+@cache
+def get_engine() -> AsyncEngine:
+    """Движок создается при первом обращении, а не при импорте модуля"""
+    engine = create_async_engine(get_database_url())
+    instrument(engine, "primary")
+    return engine
+
+
+@cache
+def get_read_engine() -> AsyncEngine:
+    """Движок реплики для чтения. Без READ_DATABASE_URL чтение идет в основную базу"""
+    url = get_read_database_url()
+    if url is None:
+        return get_engine()
+    engine = create_async_engine(url)
+    instrument(engine, "replica")
+    return engine
+
+
+@cache
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(get_engine(), expire_on_commit=False)
+
+
+@cache
+def get_read_session_maker() -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(get_read_engine(), expire_on_commit=False)
+
+
+def get_reader(primary: bool = False) -> async_sessionmaker[AsyncSession]:
+    """
+    Сессии для чтения. Реплика может отставать, поэтому проверки перед записью и чтение сразу после своей записи
+    передают primary=True
+    """
+    return get_session_maker() if primary else get_read_session_maker()
 
-engine = create_async_engine(f"postgresql+asyncpg://{PG_USER}:{PG_PASSWORD}@{DB_HOST}/{PG_DB_NAME}")
 
 CATEGORIES = ["ККТ", "Весы", "Принтер кухонный", "Планшет", "Терминал", "Эквайринг", "Сканер", "Другое"]
 
 
+class ModelInfo:
+    """
+    Метаданные модели: один раз вычисляются из маппера SQLAlchemy при объявлении класса.
+    Служебные колонки (info={"system": True}) не считаются полями модели
+    """
+    __slots__ = ("model_name", "primary_key", "columns", "column_names", "required")
+
+    def __repr__(self):
+        return f"ModelInfo(model_name={self.model_name}, " \
+               f"primary_key={self.primary_key}, " \
+               f"column_names={self.column_names}, " \
+               f"required={self.required})"
+
+    def __init__(self, mapper: Mapper):
+        self.model_name = mapper.class_.__name__
+        self.columns = {name: column for name, column in mapper.columns.items() if not column.info.get("system")}
+        primary_keys = [name for name, column in self.columns.items() if column.primary_key]
+        self.primary_key: str | None = primary_keys[0] if len(primary_keys) == 1 else None
+        self.column_names: tuple[str, ...] = tuple(self.columns.keys())
+        self.required: frozenset[str] = frozenset(
+            name for name, column in self.columns.items()
+            if not column.nullable and column.default is None and column.server_default is None
+        )
+
+    def unknown_fields(self, fields: Iterable[str]) -> list[str]:
+        return [field for field in fields if field not in self.columns]
+
+    def missing_fields(self, fields: Iterable[str]) -> list[str]:
+        return sorted(self.required.difference(fields))
+
+
 class Base(AsyncAttrs, DeclarativeBase):
+    __model_info__: ClassVar[ModelInfo]
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.__model_info__ = ModelInfo(inspect(cls))
+
+    @classmethod
+    def check_fields(cls, fields: Iterable[str], method_name: str) -> bool:
+        unknown_fields = cls.__model_info__.unknown_fields(fields)
+        if len(unknown_fields) != 0:
+            logging.error(f"В метод {cls.__name__}.{method_name} некорректно переданы поля: {unknown_fields}")
+            return False
+        return True
+
+    @classmethod
+    async def execute_returning(cls, stmt: Insert | DMLWhereBase, params: list[dict] | None = None) -> list[Self]:
+        """
+        Выполняет INSERT/UPDATE/DELETE с RETURNING всех колонок на соединении, без сессии и identity map.
+        Объекты собираются прямо из вернувшихся строк
+        """
+        async with get_engine().begin() as conn:
+            result = await conn.execute(stmt.returning(*cls.__table__.columns), params)
+            return [cls(**row) for row in result.mappings().all()]
 
     @classmethod
     async def add_existed(cls, model) -> Self:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 model = await session.merge(model)
@@ -44,8 +162,8 @@ class Base(AsyncAttrs, DeclarativeBase):
                 return model
 
     @classmethod
-    async def get_all(cls, limit: int = 100) -> list[Self]:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async def get_all(cls, limit: int = 100, primary: bool = False) -> list[Self]:
+        async_session = get_reader(primary)
         async with async_session() as session:
             async with session.begin():
                 stmt = select(cls).limit(limit)
@@ -54,33 +172,33 @@ class Base(AsyncAttrs, DeclarativeBase):
                 return list(objects)
 
     @classmethod
-    async def get(cls, name_and_value: dict, limit=100) -> list[Self]:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async def get(cls, name_and_value: dict, limit=100, primary: bool = False) -> list[Self]:
+        columns = cls.__model_info__.columns
+        unknown_fields = cls.__model_info__.unknown_fields(name_and_value)
+        if len(unknown_fields) != 0:
+            raise ValueError(f"Для класса {cls} не существует полей {unknown_fields}")
+        async_session = get_reader(primary)
         async with async_session() as session:
             async with session.begin():
-                stmt = select(cls).filter_by(**name_and_value).limit(limit)
-                result = await session.scalars(stmt)
+                stmt = select(cls).where(*[columns[name] == value for name, value in name_and_value.items()])
+                result = await session.scalars(stmt.limit(limit))
                 objects = result.all()
                 return list(objects)
 
     @classmethod
-    async def get_by_primary(cls, value) -> list[Self]:
-        primary_field_name = ""
-        members = inspect.getmembers(cls)
-        for name, member in members:
-            if hasattr(member, "primary_key") and getattr(member, "primary_key"):
-                primary_field_name = name
-        if primary_field_name == "":
+    async def get_by_primary(cls, value, primary: bool = False) -> list[Self]:
+        primary_field_name = cls.__model_info__.primary_key
+        if primary_field_name is None:
             raise ValueError(f"Не найден primary key для класса {cls}")
-        return await cls.get({primary_field_name: value})
+        return await cls.get({primary_field_name: value}, primary=primary)
 
     @classmethod
-    def get_fields_names(cls) -> list[str]:
-        return cls.__table__.columns.keys()
+    def get_fields_names(cls) -> tuple[str, ...]:
+        return cls.__model_info__.column_names
 
     @classmethod
     def get_fields(cls) -> dict[str, str | None]:
-        return {field: None for field in cls.get_fields_names()}
+        return dict.fromkeys(cls.__model_info__.column_names)
 
     @classmethod
     def _prepare_filters_for_strings(cls, fields: list[str], search_key: str) -> list:
@@ -93,6 +211,63 @@ class Base(AsyncAttrs, DeclarativeBase):
         return search_filter
 
 
+INVENTORY_VERSION = Sequence("inventory_version_seq", metadata=Base.metadata)
+
+ResourceListener = Callable[[list["Resource"], list[int]], None]
+resource_listeners: list[ResourceListener] = []
+
+
+def subscribe_resource_changes(listener: ResourceListener) -> None:
+    """listener вызывается после каждой записи в resource со списком измененных устройств и id удаленных"""
+    resource_listeners.append(listener)
+
+
+def notify_resource_changes(changed: "list[Resource]", deleted_ids: Iterable[int] = ()) -> None:
+    deleted_ids = list(deleted_ids)
+    if len(changed) == 0 and len(deleted_ids) == 0:
+        return
+    for listener in resource_listeners:
+        listener(changed, deleted_ids)
+
+
+class VisitorCache:
+    """
+    Пользователи по chat_id. Пока работает подписка на изменения в базе (helpers/changefeed),
+    записи живут без срока и удаляются по уведомлениям, иначе - не дольше ttl секунд
+    """
+
+    def __init__(self, ttl: float = VISITOR_CACHE_SECONDS):
+        self.ttl: float | None = ttl
+        self._by_chat_id: dict[int, tuple["Visitor", float]] = {}
+
+    def __len__(self):
+        return len(self._by_chat_id)
+
+    def get(self, chat_id: int) -> "Visitor | None":
+        cached = self._by_chat_id.get(chat_id)
+        if cached is None:
+            return None
+        visitor, cached_at = cached
+        if self.ttl is not None and monotonic() - cached_at >= self.ttl:
+            del self._by_chat_id[chat_id]
+            return None
+        return visitor
+
+    def put(self, visitor: "Visitor") -> None:
+        if visitor.chat_id is not None:
+            self._by_chat_id[visitor.chat_id] = (visitor, monotonic())
+
+    def forget_email(self, email: str) -> None:
+        for chat_id in [chat_id for chat_id, (visitor, _) in self._by_chat_id.items() if visitor.email == email]:
+            del self._by_chat_id[chat_id]
+
+    def clear(self) -> None:
+        self._by_chat_id.clear()
+
+
+visitor_cache = VisitorCache()
+
+
 class ActionType(str, Enum):
     TAKE = "Взять: /take",
     QUEUE = "Встать в очередь: /queue",
@@ -115,6 +290,10 @@ class Action(Base):
 
 class Record(Base):
     __tablename__ = "record"
+    __table_args__ = (
+        Index("ix_record_user_email", "user_email", "action"),
+        Index("ix_record_resource", "resource", "action"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     resource: Mapped[str] = mapped_column(ForeignKey("resource.id", onupdate="cascade", ondelete="cascade"))
@@ -138,23 +317,19 @@ class Record(Base):
 
     @classmethod
     async def delete(cls, **fields) -> bool:
-        for field in fields.keys():
-            if field not in cls.get_fields_names():
-                logging.error(f"В метод Record.delete некорректно передано поле field: {field}")
-                return False
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                records = await cls.get(fields)
-                if len(records) == 0:
-                    return False
-                await session.delete(records[-1])
-                await session.commit()
-        return True
+        """Удаляет последнюю запись с такими полями одним запросом"""
+        if not cls.check_fields(fields, "delete"):
+            return False
+        columns = cls.__model_info__.columns
+        last_record_id = select(func.max(cls.id)).where(
+            *[columns[name] == value for name, value in fields.items()]
+        ).scalar_subquery()
+        records = await cls.execute_returning(delete(cls).where(cls.id == last_record_id))
+        return len(records) != 0
 
     @classmethod
     async def add(cls, resource_id, email, action: ActionType) -> "Record":
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 record = Record(**{"resource": resource_id, "user_email": email, "action": action})
@@ -163,6 +338,346 @@ class Record(Base):
                 return record
 
 
+class EventType(str, Enum):
+    TAKE = "take"
+    RETURN = "return"
+
+
+def add_months(month: date, months: int) -> date:
+    """Первое число месяца, отстоящего от month на months"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_event_partition_name(month: date) -> str:
+    return f"event_{month.strftime('%Y_%m')}"
+
+
+class Holding(Base):
+    """
+    Закрытая запись устройства на пользователя: пара событий take и return из старых месяцев журнала,
+    свернутая в одну строку. Id исходных событий сохраняются, поэтому история выглядит так же, как до свертки
+    """
+    __tablename__ = "holding"
+    __table_args__ = (
+        Index("ix_holding_resource_taken", "resource_id", "taken_at", "take_event_id"),
+        Index("ix_holding_resource_returned", "resource_id", "returned_at", "return_event_id"),
+    )
+
+    take_event_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    return_event_id: Mapped[int] = mapped_column(BigInteger)
+    resource_id: Mapped[int] = mapped_column()
+    user_email: Mapped[str] = mapped_column()
+    taken_at: Mapped[datetime] = mapped_column()
+    returned_at: Mapped[datetime] = mapped_column()
+
+    def __repr__(self):
+        return f"Holding(resource_id={self.resource_id}, user_email={self.user_email}, " \
+               f"taken_at={self.taken_at}, returned_at={self.returned_at})"
+
+
+class Event(Base):
+    """
+    Журнал смены владельцев устройств, только на добавление. Строки пишет триггер на resource (миграция 0005)
+    в той же транзакции, что и само изменение, поэтому история не зависит от того, как устройство взяли или списали,
+    и остается после удаления устройства.
+    Таблица разбита на партиции по месяцам (миграция 0006). Последние EVENT_HOT_MONTHS месяцев - горячие,
+    более старые пары take и return сворачиваются в holding, а опустевшие партиции удаляются целиком.
+    Индекс (resource_id, time, id) обслуживает и страницы истории, и вопрос "у кого было устройство в момент t"
+    """
+    __tablename__ = "event"
+    __table_args__ = (
+        Index("ix_event_resource_time", "resource_id", "time", "id"),
+        {"postgresql_partition_by": "RANGE (time)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    resource_id: Mapped[int] = mapped_column()
+    user_email: Mapped[str] = mapped_column()
+    type: Mapped[str] = mapped_column()
+    time: Mapped[datetime] = mapped_column(primary_key=True, server_default=func.now())
+
+    def __repr__(self):
+        return f"Event(id={self.id}, resource_id={self.resource_id}, user_email={self.user_email}, " \
+               f"type={self.type}, time={self.time})"
+
+    def __str__(self):
+        action = "взял(а)" if self.type == EventType.TAKE else "вернул(а)"
+        return f"{self.time.strftime(r'%d.%m.%Y %H:%M')} {self.user_email} {action}"
+
+    @classmethod
+    def _timeline(cls, resource_id: int) -> list:
+        """События устройства из журнала и из свернутых пар, в одинаковых колонках"""
+        columns = [cls.id, cls.resource_id, cls.user_email, cls.type, cls.time]
+        taken = [Holding.take_event_id.label("id"), Holding.resource_id, Holding.user_email,
+                 literal_column(f"'{EventType.TAKE.value}'").label("type"), Holding.taken_at.label("time")]
+        returned = [Holding.return_event_id.label("id"), Holding.resource_id, Holding.user_email,
+                    literal_column(f"'{EventType.RETURN.value}'").label("type"), Holding.returned_at.label("time")]
+        return [
+            (select(*columns).where(cls.resource_id == resource_id), cls.time, cls.id),
+            (select(*taken).where(Holding.resource_id == resource_id), Holding.taken_at, Holding.take_event_id),
+            (select(*returned).where(Holding.resource_id == resource_id), Holding.returned_at, Holding.return_event_id),
+        ]
+
+    @classmethod
+    async def get_page(cls, resource_id: int, before: tuple[datetime, int] | None = None,
+                       limit: int = HISTORY_PAGE_SIZE) -> "list[Event]":
+        """
+        События устройства от новых к старым. before - время и id последнего события предыдущей страницы.
+        Каждая часть читается по своему индексу не дальше limit строк, поэтому размер журнала на скорость не влияет
+        """
+        parts = []
+        for stmt, time_column, id_column in cls._timeline(resource_id):
+            if before is not None:
+                stmt = stmt.where(tuple_(time_column, id_column) < tuple_(*before))
+            parts.append(stmt.order_by(time_column.desc(), id_column.desc()).limit(limit))
+        timeline = union_all(*parts).subquery()
+        stmt = select(timeline).order_by(timeline.c.time.desc(), timeline.c.id.desc()).limit(limit)
+        async with get_read_engine().connect() as conn:
+            result = await conn.execute(stmt)
+            return [cls(**row) for row in result.mappings().all()]
+
+    @classmethod
+    async def get_holders(cls, resource_id: int, start: datetime, end: datetime) -> list[str]:
+        """Почты всех, за кем устройство числилось хотя бы в один момент с start и до end, по порядку"""
+        before_start = select(cls.type, cls.user_email, cls.time, cls.id).where(
+            cls.resource_id == resource_id, cls.time <= start).order_by(cls.time.desc(), cls.id.desc()).limit(1)
+        during = select(cls.type, cls.user_email, cls.time, cls.id).where(
+            cls.resource_id == resource_id, cls.time > start, cls.time < end, cls.type == EventType.TAKE.value)
+        compacted = select(literal_column(f"'{EventType.TAKE.value}'"), Holding.user_email, Holding.taken_at,
+                           Holding.take_event_id).where(
+            Holding.resource_id == resource_id, Holding.taken_at < end, Holding.returned_at > start)
+        stmt = union_all(before_start, during, compacted).subquery()
+        async with get_read_engine().connect() as conn:
+            result = await conn.execute(select(stmt.c.type, stmt.c.user_email).order_by(stmt.c.time, stmt.c.id))
+            holders = [email for event_type, email in result.all() if event_type == EventType.TAKE]
+        return list(dict.fromkeys(holders))
+
+    @classmethod
+    async def get_partitions(cls, conn: AsyncConnection) -> list[str]:
+        stmt = text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = 'event'::regclass ORDER BY c.relname")
+        return list((await conn.execute(stmt)).scalars())
+
+    @classmethod
+    async def ensure_partitions(cls, months_ahead: int = EVENT_MONTHS_AHEAD) -> list[str]:
+        """
+        Создает партиции текущего и months_ahead следующих месяцев, если их еще нет. Строки, которые за это время
+        попали в запасную партицию event_default, переносятся в новую партицию
+        """
+        first = date.today().replace(day=1)
+        created = []
+        async with get_engine().begin() as conn:
+            existing = set(await cls.get_partitions(conn))
+            for months in range(months_ahead + 1):
+                month = add_months(first, months)
+                name = get_event_partition_name(month)
+                if name in existing:
+                    continue
+                bounds = f"time >= '{month.isoformat()}' AND time < '{add_months(month, 1).isoformat()}'"
+                await conn.execute(
+                    text(f"CREATE TEMP TABLE event_moving AS SELECT * FROM event_default WHERE {bounds}"))
+                await conn.execute(text(f"DELETE FROM event_default WHERE {bounds}"))
+                await conn.execute(text(f"CREATE TABLE {name} PARTITION OF event FOR VALUES "
+                                        f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"))
+                await conn.execute(text("INSERT INTO event SELECT * FROM event_moving"))
+                await conn.execute(text("DROP TABLE event_moving"))
+                created.append(name)
+        if len(created) != 0:
+            logging.info(f"Созданы партиции журнала событий: {created}")
+        return created
+
+    @classmethod
+    async def compact(cls, before: datetime) -> tuple[int, list[str]]:
+        """
+        Сворачивает пары take и return, закончившиеся раньше before, в holding и удаляет опустевшие партиции
+        месяцев до before. Открытые записи остаются в журнале, пока устройство не вернут.
+        Возвращает число свернутых пар и имена удаленных партиций
+        """
+        take = cls.__table__.alias("take")
+        following = cls.__table__.alias("following")
+        next_event = select(following.c.id, following.c.time, following.c.type, following.c.user_email).where(
+            following.c.resource_id == take.c.resource_id,
+            tuple_(following.c.time, following.c.id) > tuple_(take.c.time, take.c.id)
+        ).order_by(following.c.time, following.c.id).limit(1).lateral("next_event")
+        pairs = select(take.c.id, next_event.c.id, take.c.resource_id, take.c.user_email, take.c.time,
+                       next_event.c.time).join_from(take, next_event, true()).where(
+            take.c.type == EventType.TAKE.value, take.c.time < before,
+            next_event.c.type == EventType.RETURN.value, next_event.c.user_email == take.c.user_email,
+            next_event.c.time < before)
+        moved = insert(Holding).from_select(
+            ["take_event_id", "return_event_id", "resource_id", "user_email", "taken_at", "returned_at"], pairs
+        ).on_conflict_do_nothing().returning(Holding.take_event_id, Holding.return_event_id).cte("moved")
+        stmt = delete(cls).where(cls.time < before, or_(
+            cls.id.in_(select(moved.c.take_event_id)), cls.id.in_(select(moved.c.return_event_id))
+        )).add_cte(moved).returning(cls.id)
+        dropped = []
+        async with get_engine().begin() as conn:
+            deleted = len((await conn.execute(stmt)).all())
+            for name in await cls.get_partitions(conn):
+                if name == "event_default":
+                    continue
+                month = datetime.strptime(name, "event_%Y_%m").date()
+                if add_months(month, 1) > before.date():
+                    continue
+                if not (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))).scalar():
+                    await conn.execute(text(f"DROP TABLE {name}"))
+                    dropped.append(name)
+        logging.info(f"Журнал событий до {before} уплотнен: свернуто пар {deleted // 2}, удалены партиции {dropped}")
+        return deleted // 2, dropped
+
+    @classmethod
+    async def compact_cold(cls) -> tuple[int, list[str]]:
+        """Задача планировщика: уплотняет все месяцы старше EVENT_HOT_MONTHS"""
+        cutoff = add_months(date.today().replace(day=1), -EVENT_HOT_MONTHS)
+        return await cls.compact(datetime.combine(cutoff, datetime.min.time()))
+
+    @classmethod
+    async def get_held(cls, start: datetime, end: datetime) -> tuple[list[tuple], list[tuple]]:
+        """
+        Данные для подсчета владения всеми устройствами с start до end: события журнала (последнее до start
+        у каждого устройства и все за период) и свернутые пары из holding, которые пересекают период
+        """
+        last_before = select(cls.resource_id, cls.user_email, cls.type, cls.time, cls.id).where(
+            cls.time < start).ext(distinct_on(cls.resource_id)).order_by(
+            cls.resource_id, cls.time.desc(), cls.id.desc())
+        during = select(cls.resource_id, cls.user_email, cls.type, cls.time, cls.id).where(
+            cls.time >= start, cls.time < end)
+        events = union_all(last_before, during).subquery()
+        compacted = select(Holding.resource_id, Holding.taken_at, Holding.returned_at).where(
+            Holding.taken_at < end, Holding.returned_at > start)
+        async with get_read_engine().connect() as conn:
+            result = await conn.execute(select(events.c.resource_id, events.c.user_email, events.c.type,
+                                               events.c.time).order_by(events.c.time, events.c.id))
+            return [tuple(row) for row in result.all()], [tuple(row) for row in (await conn.execute(compacted)).all()]
+
+
+class QueueWait(Base):
+    """
+    Завершенное ожидание в очереди. Строку пишет триггер на удаление записи QUEUE из record (миграция 0007):
+    served - устройство досталось этому пользователю, иначе он сам покинул очередь
+    """
+    __tablename__ = "queue_wait"
+    __table_args__ = (Index("ix_queue_wait_left_at", "left_at"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    resource_id: Mapped[int] = mapped_column()
+    user_email: Mapped[str] = mapped_column()
+    queued_at: Mapped[datetime] = mapped_column()
+    left_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    served: Mapped[bool] = mapped_column()
+
+    def __repr__(self):
+        return f"QueueWait(resource_id={self.resource_id}, user_email={self.user_email}, " \
+               f"queued_at={self.queued_at}, left_at={self.left_at}, served={self.served})"
+
+    @classmethod
+    async def get_overlapping(cls, start: datetime, end: datetime) -> list[tuple]:
+        """(устройство, встал в очередь, ушел из нее или None, дождался) для ожиданий, пересекающих период"""
+        finished = select(cls.resource_id, cls.queued_at, cls.left_at, cls.served).where(
+            cls.left_at > start, cls.queued_at < end)
+        waiting = select(Record.resource, Record.time, literal_column("NULL::timestamp"),
+                         literal_column("false")).where(Record.action == ActionType.QUEUE, Record.time < end)
+        async with get_read_engine().connect() as conn:
+            return [tuple(row) for row in (await conn.execute(union_all(finished, waiting))).all()]
+
+
+class UsageDeviceDay(Base):
+    """Дневная сводка по устройству. Категория - та, в которой устройство было в момент расчета"""
+    __tablename__ = "usage_device_day"
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    resource_id: Mapped[int] = mapped_column(primary_key=True)
+    category_name: Mapped[Optional[str]] = mapped_column()
+    held_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    takes: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    queued: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    served: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    wait_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    queue_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+
+    def __repr__(self):
+        return f"UsageDeviceDay(day={self.day}, resource_id={self.resource_id}, held_seconds={self.held_seconds})"
+
+    @classmethod
+    async def save_days(cls, first_day: date, last_day: date, devices: list[dict], categories: list[dict]) -> None:
+        """
+        Заменяет сводки за дни с first_day по last_day и сдвигает водяной знак одной транзакцией. Повторный расчет
+        тех же дней дает тот же результат, поэтому задачу можно запускать из нескольких реплик
+        """
+        async with get_engine().begin() as conn:
+            for model, rows in ((cls, devices), (UsageCategoryDay, categories)):
+                await conn.execute(delete(model).where(model.day >= first_day, model.day <= last_day))
+                if len(rows) != 0:
+                    await conn.execute(insert(model), rows)
+            stmt = insert(RollupWatermark).values(name=UsageDeviceDay.__tablename__, day=last_day)
+            await conn.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={"day": last_day}))
+
+    @classmethod
+    async def get_totals(cls, start: date, end: date) -> list[tuple]:
+        """(устройство, категория, и суммы колонок сводки) за дни с start до end, не включая end"""
+        stmt = select(cls.resource_id, func.max(cls.category_name), *[
+            func.sum(getattr(cls, name)).cast(BigInteger) for name in USAGE_COUNTERS
+        ]).where(cls.day >= start, cls.day < end).group_by(cls.resource_id).order_by(cls.resource_id)
+        async with get_read_engine().connect() as conn:
+            return [tuple(row) for row in (await conn.execute(stmt)).all()]
+
+
+class UsageCategoryDay(Base):
+    """Дневная сводка по категории: суммы по ее устройствам и число устройств, которые в этот день были у кого-то"""
+    __tablename__ = "usage_category_day"
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    category_name: Mapped[str] = mapped_column(primary_key=True)
+    devices: Mapped[int] = mapped_column(server_default="0")
+    held_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    takes: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    queued: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    served: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    wait_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    queue_seconds: Mapped[int] = mapped_column(BigInteger, server_default="0")
+
+    def __repr__(self):
+        return f"UsageCategoryDay(day={self.day}, category_name={self.category_name}, " \
+               f"held_seconds={self.held_seconds})"
+
+    @classmethod
+    async def get_totals(cls, start: date, end: date) -> list[tuple]:
+        """(категория и суммы колонок сводки) за дни с start до end, не включая end"""
+        stmt = select(cls.category_name, *[
+            func.sum(getattr(cls, name)).cast(BigInteger) for name in USAGE_COUNTERS
+        ]).where(cls.day >= start, cls.day < end).group_by(cls.category_name).order_by(cls.category_name)
+        async with get_read_engine().connect() as conn:
+            return [tuple(row) for row in (await conn.execute(stmt)).all()]
+
+
+class RollupWatermark(Base):
+    """Последний день, обработанный ночной задачей с этим именем"""
+    __tablename__ = "rollup_watermark"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column()
+
+    def __repr__(self):
+        return f"RollupWatermark(name={self.name}, day={self.day})"
+
+    @classmethod
+    async def get_day(cls, name: str) -> date | None:
+        async with get_engine().connect() as conn:
+            return (await conn.execute(select(cls.day).where(cls.name == name))).scalar()
+
+    @classmethod
+    async def claim(cls, name: str, day: date) -> bool:
+        """
+        Сдвигает водяной знак на day, если он еще раньше. Из реплик, одновременно выполнивших задачу,
+        True получает только одна
+        """
+        stmt = insert(cls).values(name=name, day=day)
+        stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={"day": day}, where=cls.day < day)
+        async with get_engine().begin() as conn:
+            return (await conn.execute(stmt.returning(cls.name))).first() is not None
+
+
 class Visitor(Base):
     __tablename__ = "visitor"
 
@@ -191,64 +706,74 @@ class Visitor(Base):
                f"{'c админскими правами' if self.is_admin else 'без админских прав'}"
 
     @classmethod
-    async def auth(cls, email: str, message: Message) -> "Visitor":
-        with open("config.json", "r", encoding="utf-8") as file:
-            data = json.loads(file.read())
-            is_admin = email in data["admins"]
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async def auth(cls, email: str, message: Message, is_admin: bool = False) -> "Visitor":
+        """is_admin берется из списка админов helpers.admins.roster"""
+        stmt = insert(cls).values(
+            email=email,
+            chat_id=message.chat.id,
+            is_admin=is_admin,
+            user_id=message.from_user.id,
+            full_name=message.from_user.full_name,
+            username=message.from_user.username)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.email],
+            set_={cls.chat_id.key: stmt.excluded.chat_id, cls.is_admin.key: stmt.excluded.is_admin}
+        ).returning(cls, literal_column("xmax = 0").label("inserted"))
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
-                stmt = select(cls).where(cls.email == email)
-                result = await session.scalars(stmt)
-                users_with_email = result.all()
-                if len(users_with_email) != 0:
-                    users_with_email[0].chat_id = message.chat.id
-                    await session.commit()
-                    logging.info(f"Пользователь изменил chat_id: {repr(users_with_email[0])}")
-                    return users_with_email[0]
-                else:
-                    user = Visitor(
-                        email=email,
-                        chat_id=message.chat.id,
-                        is_admin=is_admin,
-                        user_id=message.from_user.id,
-                        full_name=message.from_user.full_name,
-                        username=message.from_user.username)
-                    session.add(user)
-                    await session.commit()
-                    logging.info(f"Пользователь авторизовался: {repr(user)}")
-                    return user
+                user, inserted = (await session.execute(stmt)).one()
+        visitor_cache.forget_email(email)
+        visitor_cache.put(user)
+        if inserted:
+            logging.info(f"Пользователь авторизовался: {repr(user)}")
+        else:
+            logging.info(f"Пользователь изменил chat_id: {repr(user)}")
+        return user
 
     @classmethod
     async def update_email(cls, current_email, new_email):
-        visitors = await cls.get_by_primary(current_email)
+        stmt = update(cls).where(cls.email == current_email).values(email=new_email)
+        visitors = await cls.execute_returning(stmt)
+        visitor_cache.forget_email(current_email)
         if len(visitors) == 0:
             return None
-        visitor = visitors[0]
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                visitor = await session.merge(visitor)
-                visitor.email = new_email
-                await session.commit()
+        stmt = update(Resource).where(Resource.user_email == new_email).values(version=INVENTORY_VERSION.next_value())
+        notify_resource_changes(await Resource.execute_returning(stmt))
         return True
 
+    @classmethod
+    async def sync_admins(cls, emails: Iterable[str]) -> list[str]:
+        """Одним UPDATE выставляет is_admin по списку почт. Возвращает почты, у которых флаг поменялся"""
+        is_listed = cls.email.in_(list(emails))
+        stmt = update(cls).where(cls.is_admin.is_distinct_from(is_listed)).values(is_admin=is_listed)
+        visitors = await cls.execute_returning(stmt)
+        for visitor in visitors:
+            visitor_cache.forget_email(visitor.email)
+        return [visitor.email for visitor in visitors]
+
     @classmethod
     async def get_current(cls, chat_id: int) -> "Visitor | None":
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        visitor = visitor_cache.get(chat_id)
+        if visitor is not None:
+            return visitor
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 stmt = select(cls).filter_by(chat_id=chat_id)
                 result = await session.scalars(stmt)
                 users = result.all()
                 if len(users) != 0:
+                    visitor_cache.put(users[0])
                     return users[0]
         logging.error(f"Не найден пользователь с chat_id: {chat_id}")
         return None
 
     @classmethod
     async def is_exist(cls, chat_id: int) -> bool:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        if visitor_cache.get(chat_id) is not None:
+            return True
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 stmt = select(cls).where(cls.chat_id == chat_id)
@@ -256,19 +781,27 @@ class Visitor(Base):
                 users = result.all()
         return len(users) == 1
 
+    @classmethod
+    def upsert_statement(cls, emails: Iterable[str]):
+        """INSERT ... ON CONFLICT DO NOTHING для почт, которых еще нет в базе. Возвращает вставленные почты"""
+        return insert(cls).values(
+            [{cls.email.key: email, cls.is_admin.key: False} for email in emails]
+        ).on_conflict_do_nothing(index_elements=[cls.email]).returning(cls.email)
+
     @classmethod
     async def add_if_needed(cls, email: str) -> bool:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        return len(await cls.add_many_if_needed([email])) != 0
+
+    @classmethod
+    async def add_many_if_needed(cls, emails: Iterable[str]) -> list[str]:
+        emails = sorted(set(emails))
+        if len(emails) == 0:
+            return []
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
-                stmt = select(cls).where(cls.email == email)
-                result = await session.scalars(stmt)
-                users = result.all()
-                if len(users) > 0:
-                    return False
-                session.add(Visitor(email=email))
-                await session.commit()
-                return True
+                result = await session.scalars(cls.upsert_statement(emails))
+                return list(result.all())
 
 
 class Category(Base):
@@ -284,31 +817,58 @@ class Category(Base):
 
     @classmethod
     async def add(cls, category_name: str) -> None:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        await cls.add_many([category_name])
+
+    @classmethod
+    async def add_many(cls, category_names: Iterable[str]) -> list[str]:
+        category_names = sorted(set(category_names))
+        if len(category_names) == 0:
+            return []
+        stmt = insert(cls).values([{cls.name.key: name} for name in category_names])
+        stmt = stmt.on_conflict_do_nothing(index_elements=[cls.name]).returning(cls.name)
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
-                stmt = select(Category).where(Category.name == category_name)
                 result = await session.scalars(stmt)
-                categories = result.all()
-                if len(categories) == 0:
-                    session.add(Category(name=category_name))
-                await session.commit()
+                return list(result.all())
 
 
-class Resource(Base):
-    __tablename__ = "resource"
+class TelegramFile(Base):
+    """file_id документа, который бот уже загружал в Телеграм, по sha256 содержимого и имени файла"""
+    __tablename__ = "telegram_file"
+
+    sha256: Mapped[str] = mapped_column(primary_key=True)
+    file_name: Mapped[str] = mapped_column(primary_key=True)
+    file_id: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now(), info={"system": True})
+
+    def __repr__(self):
+        return f"TelegramFile(sha256={self.sha256}, file_name={self.file_name}, file_id={self.file_id})"
+
+    @classmethod
+    async def get_file_id(cls, sha256: str, file_name: str) -> str | None:
+        stmt = select(cls.file_id).where(cls.sha256 == sha256, cls.file_name == file_name)
+        async with get_read_engine().connect() as conn:
+            return (await conn.execute(stmt)).scalar_one_or_none()
+
+    @classmethod
+    async def save(cls, sha256: str, file_name: str, file_id: str) -> None:
+        """Прежние версии файла с тем же именем удаляются: отправлять их снова уже не понадобится"""
+        stmt = insert(cls).values(sha256=sha256, file_name=file_name, file_id=file_id)
+        stmt = stmt.on_conflict_do_update(index_elements=[cls.sha256, cls.file_name], set_={"file_id": file_id})
+        async with get_engine().begin() as conn:
+            await conn.execute(delete(cls).where(cls.file_name == file_name, cls.sha256 != sha256))
+            await conn.execute(stmt)
+
+    @classmethod
+    async def forget(cls, sha256: str, file_name: str) -> None:
+        async with get_engine().begin() as conn:
+            await conn.execute(delete(cls).where(cls.sha256 == sha256, cls.file_name == file_name))
 
-    id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
-    category_name: Mapped[str] = mapped_column(ForeignKey("category.name"))
-    vendor_code: Mapped[str] = mapped_column(unique=True)
-    reg_date: Mapped[Optional[datetime]] = mapped_column()
-    firmware: Mapped[Optional[str]] = mapped_column()
-    comment: Mapped[Optional[str]] = mapped_column()
-    user_email: Mapped[Optional[str]] = mapped_column(
-        ForeignKey("visitor.email", onupdate="cascade", ondelete="cascade"))
-    address: Mapped[Optional[str]] = mapped_column()
-    return_date: Mapped[Optional[datetime]] = mapped_column()
+
+class ResourceFormat:
+    """Текстовые представления устройства, общие для ORM-модели Resource и легкой записи ResourceRow"""
+    __slots__ = ()
 
     def __repr__(self):
         return f"Resource(id={self.id}, " \
@@ -331,9 +891,45 @@ class Resource(Base):
                 f"Где находится: {self.address}\r\n" if self.address is not None else "",
             ]))[:-2]
 
+    def get_csv_value(self) -> list[str]:
+        return [
+            str(self.id),
+            self.name,
+            self.category_name,
+            self.vendor_code,
+            self.reg_date.strftime(r'%d.%m.%Y') if self.reg_date is not None else " ",
+            self.firmware if self.firmware is not None else " ",
+            self.comment if self.comment is not None else " ",
+            self.user_email if self.user_email is not None else " ",
+            self.address if self.address is not None else " ",
+            self.return_date.strftime(r'%d.%m.%Y') if self.return_date is not None else " "
+        ]
+
+
+class Resource(ResourceFormat, Base):
+    __tablename__ = "resource"
+    __table_args__ = (
+        Index("ix_resource_overdue", "return_date",
+              postgresql_where=text("user_email IS NOT NULL AND return_date IS NOT NULL")),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+    category_name: Mapped[str] = mapped_column(ForeignKey("category.name"))
+    vendor_code: Mapped[str] = mapped_column(unique=True)
+    reg_date: Mapped[Optional[datetime]] = mapped_column()
+    firmware: Mapped[Optional[str]] = mapped_column()
+    comment: Mapped[Optional[str]] = mapped_column()
+    user_email: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("visitor.email", onupdate="cascade", ondelete="cascade"))
+    address: Mapped[Optional[str]] = mapped_column()
+    return_date: Mapped[Optional[datetime]] = mapped_column()
+    version: Mapped[int] = mapped_column(
+        BigInteger, server_default=text("nextval('inventory_version_seq')"), index=True, info={"system": True})
+
     @classmethod
-    async def get_single(cls, resource_id) -> "Resource | None":
-        resources = await Resource.get_by_primary(resource_id)
+    async def get_single(cls, resource_id, primary: bool = False) -> "Resource | None":
+        resources = await Resource.get_by_primary(resource_id, primary=primary)
         if len(resources) == 0:
             logging.error(f"Не найден ресурс с resource_id={resource_id}")
             return None
@@ -341,79 +937,158 @@ class Resource(Base):
 
     @classmethod
     async def update(cls, resource_id: int, **fields) -> "Resource | None":
-        for field in fields.keys():
-            if field not in Resource.get_fields_names():
-                logging.error(f"В метод Resource.update некорректно передано поле field: {field}")
-                return None
-        if "user_email" in fields.keys() and fields["user_email"] is not None:
-            await Visitor.add_if_needed(email=fields["user_email"])
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        resources = await Resource.get_by_primary(resource_id)
-        resource = resources[0]
-        async with async_session() as session:
-            async with session.begin():
-                resource = await session.merge(resource)
-                for field, value in fields.items():
-                    setattr(resource, field, value)
-                await session.commit()
-        return resource
+        if not cls.check_fields(fields, "update"):
+            return None
+        stmt = update(cls).where(cls.id == resource_id).values(**fields, version=INVENTORY_VERSION.next_value())
+        if fields.get("user_email") is not None:
+            stmt = stmt.add_cte(Visitor.upsert_statement([fields["user_email"]]).cte("new_visitor"))
+        resources = await cls.execute_returning(stmt)
+        notify_resource_changes(resources)
+        if len(resources) == 0:
+            logging.error(f"Не найден ресурс с resource_id={resource_id} для обновления полей {list(fields)}")
+            return None
+        return resources[0]
 
     @classmethod
     async def add(cls, **fields) -> "Resource | None":
-        for field in fields.keys():
-            if field not in Resource.get_fields_names():
-                logging.error(f"В метод Resource.update некорректно передано поле field: {field}")
-                return None
-        if "name" not in fields.keys() or "category_name" not in fields.keys() or "vendor_code" not in fields.keys() or "id" not in fields.keys():
-            logging.error(f"При добавлении ресурса в метод не переданы name, category_name, "
-                          f"vendor_code или id. Значение fields: {fields}")
+        if not cls.check_fields(fields, "add"):
             return None
-        if "user_email" in fields.keys() and fields["user_email"] is not None:
-            await Visitor.add_if_needed(email=fields["user_email"])
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                resource = Resource(**fields)
-                session.add(resource)
-                await session.commit()
-                return resource
+        missing_fields = cls.__model_info__.missing_fields(fields)
+        if len(missing_fields) != 0:
+            logging.error(f"При добавлении ресурса в метод не переданы {missing_fields}. Значение fields: {fields}")
+            return None
+        stmt = insert(cls).values(**fields)
+        if fields.get("user_email") is not None:
+            stmt = stmt.add_cte(Visitor.upsert_statement([fields["user_email"]]).cte("new_visitor"))
+        resources = await cls.execute_returning(stmt)
+        notify_resource_changes(resources)
+        return resources[0]
 
     @classmethod
     async def take(cls, resource_id, user_email, address=None, return_date=None) -> "Resource | None":
-        resources = await cls.get({"id": resource_id})
+        resources = await cls.take_many([resource_id], user_email, address, return_date)
         if len(resources) == 0:
             logging.error(f"Не найдено устройство с resource_id {resource_id}, "
                           f"пользователь {user_email} будет расстроен")
             return None
-        resource = resources[0]
-        await Visitor.add_if_needed(email=user_email)
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                resource = await session.merge(resource)
-                resource.user_email = user_email
-                resource.address = address
-                resource.return_date = return_date
-                await session.commit()
-                return resource
+        return resources[0]
 
     @classmethod
-    async def free(cls, resource_id) -> "Resource":
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                stmt = select(cls).where(cls.id == resource_id)
-                result = await session.scalars(stmt)
-                resources = result.all()
-                resource = resources[0]
-                resource.user_email = None
-                resource.address = None
-                resource.return_date = None
-                await session.commit()
-                return resource
+    async def take_many(cls, resource_ids: Iterable[int], user_email, address=None,
+                        return_date=None) -> "list[Resource]":
+        """Записывает устройства на пользователя одним запросом: UPDATE вместе с добавлением пользователя в CTE"""
+        new_visitor = Visitor.upsert_statement([user_email]).cte("new_visitor")
+        stmt = update(cls).where(cls.id.in_(list(resource_ids))).values(
+            user_email=user_email,
+            address=address,
+            return_date=return_date,
+            version=INVENTORY_VERSION.next_value()
+        ).add_cte(new_visitor)
+        resources = await cls.execute_returning(stmt)
+        notify_resource_changes(resources)
+        return resources
+
+    @classmethod
+    async def add_many(cls, resources: "list[Resource | ResourceRow]") -> "list[Resource]":
+        """Добавляет устройства и их пользователей в одной транзакции, например при загрузке из csv"""
+        async with get_engine().begin() as conn:
+            resources = await cls._insert_many(conn, resources)
+        notify_resource_changes(resources)
+        return resources
+
+    @classmethod
+    async def _insert_many(cls, conn: AsyncConnection, resources: "list[Resource | ResourceRow]") -> "list[Resource]":
+        if len(resources) == 0:
+            return []
+        rows = [{field: getattr(resource, field) for field in cls.get_fields_names()} for resource in resources]
+        emails = [row["user_email"] for row in rows if row["user_email"] is not None]
+        if len(emails) != 0:
+            await conn.execute(Visitor.upsert_statement(sorted(set(emails))))
+        result = await conn.execute(insert(cls).returning(*cls.__table__.columns), rows)
+        return [cls(**row) for row in result.mappings().all()]
+
+    @classmethod
+    async def apply_sync(cls, inserts: "list[Resource | ResourceRow]", updates: list[dict], deleted_ids: list[int],
+                         versions: dict[int, int]) -> "list[Resource] | None":
+        """
+        Применяет сверку с файлом в одной транзакции: удаление, обновление только изменившихся полей, добавление.
+        versions - версии обновляемых и удаляемых устройств на момент сверки. Если кто-то успел их поменять
+        или изменения нарушают уникальность, ничего не применяется и возвращается None
+        """
+        async with get_engine().connect() as conn:
+            async with conn.begin() as transaction:
+                locked = await conn.execute(
+                    select(cls.id, cls.version).where(cls.id.in_(list(versions))).with_for_update())
+                if dict(locked.all()) != versions:
+                    logging.error("Устройства изменились после сверки с файлом, синхронизация не применена")
+                    await transaction.rollback()
+                    return None
+                try:
+                    if len(deleted_ids) != 0:
+                        await conn.execute(delete(cls).where(cls.id.in_(deleted_ids), cls.user_email.is_(None)))
+                    for fields, params in cls._group_updates(updates).items():
+                        values = {name: bindparam(f"new_{name}") for name in fields}
+                        values["version"] = INVENTORY_VERSION.next_value()
+                        stmt = update(cls.__table__).where(
+                            cls.__table__.c.id == bindparam("resource_id")).values(values)
+                        await conn.execute(stmt, params)
+                    changed = await cls._insert_many(conn, inserts)
+                except IntegrityError as e:
+                    logging.error(f"Синхронизация с файлом нарушает ограничения базы и не применена: {e.orig}")
+                    await transaction.rollback()
+                    return None
+                if len(updates) != 0:
+                    result = await conn.execute(select(*cls.__table__.columns).where(
+                        cls.id.in_([fields["id"] for fields in updates])))
+                    changed += [cls(**row) for row in result.mappings().all()]
+        notify_resource_changes(changed, deleted_ids)
+        return changed
+
+    @staticmethod
+    def _group_updates(updates: list[dict]) -> dict[tuple[str, ...], list[dict]]:
+        """Обновления с одинаковым набором полей выполняются одним executemany"""
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        for fields in updates:
+            names = tuple(sorted(name for name in fields if name != "id"))
+            params = {f"new_{name}": fields[name] for name in names}
+            params["resource_id"] = fields["id"]
+            groups.setdefault(names, []).append(params)
+        return groups
 
     @classmethod
-    async def search(cls, search_key: str, limit=100) -> "list[Resource]":
+    async def free(cls, resource_id) -> "Resource | None":
+        stmt = update(cls).where(cls.id == resource_id).values(
+            user_email=None, address=None, return_date=None, version=INVENTORY_VERSION.next_value())
+        resources = await cls.execute_returning(stmt)
+        notify_resource_changes(resources)
+        return resources[0] if len(resources) != 0 else None
+
+    @classmethod
+    async def select_rows(cls, *where, limit: int | None = None, primary: bool = False) -> "list[ResourceRow]":
+        """Чтение для списков и выгрузок: строки результата сразу раскладываются в ResourceRow, без ORM и сессии"""
+        stmt = select(*RESOURCE_ROW_COLUMNS).where(*where).order_by(cls.id).limit(limit)
+        engine = get_engine() if primary else get_read_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(stmt)
+            return [ResourceRow.from_values(values) for values in result]
+
+    @classmethod
+    async def get_overdue(cls, before: datetime) -> "list[tuple[ResourceRow, int]]":
+        """
+        Занятые устройства с датой возврата раньше before и длина очереди за каждым, по почте владельца.
+        Один запрос по частичному индексу ix_resource_overdue: свободные устройства и устройства без даты в нем не лежат
+        """
+        queue_length = select(func.count()).where(
+            Record.resource == cls.id, Record.action == ActionType.QUEUE).scalar_subquery()
+        stmt = select(*RESOURCE_ROW_COLUMNS, queue_length).where(
+            cls.user_email.is_not(None), cls.return_date.is_not(None), cls.return_date < before
+        ).order_by(cls.user_email, cls.return_date, cls.id)
+        async with get_read_engine().connect() as conn:
+            result = await conn.execute(stmt)
+            return [(ResourceRow.from_values(values[:-1]), values[-1]) for values in result]
+
+    @classmethod
+    async def search(cls, search_key: str, limit=100) -> "list[ResourceRow]":
         if search_key.isnumeric() and int(search_key) < 1000000:
             filters = [Resource.id.in_([int(search_key)])]
         else:
@@ -421,40 +1096,40 @@ class Resource(Base):
                 fields=["name", "category_name", "user_email", "vendor_code"],
                 search_key=search_key
             )
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                stmt = select(cls).filter(or_(*filters)).limit(limit)
-                result = await session.scalars(stmt)
-                resources = result.all()
-                return list(resources)
+        return await cls.select_rows(or_(*filters), limit=limit)
 
     @classmethod
-    async def delete(cls, id) -> None:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                resource = (await cls.get_by_primary(id))[0]
-                await session.delete(resource)
-                await session.commit()
+    async def delete(cls, id, only_free: bool = False) -> "Resource | None":
+        """Удаляет устройство и возвращает его. С only_free удаляет, только если устройство ни на кого не записано"""
+        stmt = delete(cls).where(cls.id == id)
+        if only_free:
+            stmt = stmt.where(cls.user_email.is_(None))
+        resources = await cls.execute_returning(stmt)
+        notify_resource_changes([], [resource.id for resource in resources])
+        return resources[0] if len(resources) != 0 else None
 
     @classmethod
-    async def get_resources_taken_by_user(cls, user) -> "list[Resource]":
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            async with session.begin():
-                stmt = select(cls).where(cls.user_email == user.email)
-                result = await session.scalars(stmt)
-                resources = result.all()
-                return list(resources)
+    async def get_inventory_version(cls) -> tuple[int, int]:
+        """
+        Ключ состояния таблицы: любая вставка или правка увеличивает максимальную версию, удаление - уменьшает
+        число строк. Если ключ не изменился, не изменились и устройства
+        """
+        stmt = select(func.coalesce(func.max(cls.version), 0), func.count())
+        async with get_read_engine().connect() as conn:
+            max_version, count = (await conn.execute(stmt)).one()
+            return max_version, count
 
     @classmethod
-    async def get_by_vendor_code(cls, vendor_code) -> "list[Resource]":
-        return await Resource.get({"vendor_code": vendor_code})
+    async def get_resources_taken_by_user(cls, user, primary: bool = False) -> "list[ResourceRow]":
+        return await cls.select_rows(cls.user_email == user.email, primary=primary)
+
+    @classmethod
+    async def get_by_vendor_code(cls, vendor_code, primary: bool = False) -> "list[Resource]":
+        return await Resource.get({"vendor_code": vendor_code}, primary=primary)
 
     @classmethod
     async def get_categories(cls) -> "list[str]":
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        async_session = get_read_session_maker()
         async with async_session() as session:
             async with session.begin():
                 stmt = select(cls).with_only_columns(cls.category_name).distinct()
@@ -462,26 +1137,36 @@ class Resource(Base):
                 resources = result.all()
                 return list(resources)
 
-    async def get_csv_value(self) -> list[str]:
-        return [
-            str(self.id),
-            self.name,
-            self.category_name,
-            self.vendor_code,
-            self.reg_date.strftime(r'%d.%m.%Y') if self.reg_date is not None else " ",
-            self.firmware if self.firmware is not None else " ",
-            self.comment if self.comment is not None else " ",
-            self.user_email if self.user_email is not None else " ",
-            self.address if self.address is not None else " ",
-            self.return_date.strftime(r'%d.%m.%Y') if self.return_date is not None else " "
-        ]
+
+class ResourceRow(ResourceFormat):
+    """Легкая запись устройства без ORM и identity map: для кэша инвентаря и списков"""
+    __slots__ = Resource.__model_info__.column_names + ("version",)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_resource(cls, resource: "Resource | ResourceRow") -> "ResourceRow":
+        return cls(**{name: getattr(resource, name) for name in cls.__slots__})
+
+    @classmethod
+    def from_values(cls, values: Iterable) -> "ResourceRow":
+        """values - строка результата select(*RESOURCE_ROW_COLUMNS), значения в порядке __slots__"""
+        row = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            setattr(row, name, value)
+        return row
+
+
+RESOURCE_ROW_COLUMNS = [Resource.__table__.c[name] for name in ResourceRow.__slots__]
 
 
 class BDInit:
 
     @classmethod
     async def init(cls) -> None:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 stmt = select(Action)
@@ -495,9 +1180,25 @@ class BDInit:
                     session.add(Category(name=category))
                 await session.commit()
 
+    @classmethod
+    async def warm_up(cls, connections: int = WARMUP_CONNECTIONS) -> None:
+        """Заранее открывает соединения пула и готовит на каждом запросы, которые выполняются на каждый апдейт"""
+        statements = [
+            select(Visitor).where(Visitor.chat_id == 0),
+            select(Resource).limit(100),
+            select(Record).where(Record.user_email == ""),
+        ]
+
+        async def warm_connection() -> None:
+            async with get_engine().connect() as conn:
+                for stmt in statements:
+                    await conn.execute(stmt)
+
+        await asyncio.gather(*[warm_connection() for _ in range(connections)])
+
     @classmethod
     async def prepare_test_data(cls) -> None:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
+        async_session = get_session_maker()
         async with async_session() as session:
             async with session.begin():
                 stmt = select(Visitor)
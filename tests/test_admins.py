@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from helpers.admins import AdminRoster
+
+
+def write_admins(path, content, mtime):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_roster_reloads_only_changed_file(tmp_path):
+    path = tmp_path / "config.json"
+    write_admins(path, json.dumps({"admins": ["A@skbkontur.ru"]}), 1)
+    roster = AdminRoster(str(path))
+    assert not roster.is_admin_email("a@skbkontur.ru")
+    assert roster.reload_if_changed()
+    assert roster.is_admin_email("a@skbkontur.ru")
+    assert not roster.reload_if_changed()
+    write_admins(path, json.dumps({"admins": ["b@skbkontur.ru"]}), 2)
+    assert roster.reload_if_changed()
+    assert roster.emails == {"b@skbkontur.ru"}
+
+
+def test_roster_keeps_list_when_file_is_broken(tmp_path):
+    path = tmp_path / "config.json"
+    write_admins(path, json.dumps({"admins": ["a@skbkontur.ru"]}), 1)
+    roster = AdminRoster(str(path))
+    roster.reload_if_changed()
+    assert roster.emails == {"a@skbkontur.ru"}
+    write_admins(path, "{\"admins\": [", 2)
+    assert not roster.reload_if_changed()
+    assert roster.emails == {"a@skbkontur.ru"}
+
+
+def test_roster_does_not_reread_broken_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    write_admins(path, "{\"admins\": [", 1)
+    roster = AdminRoster(str(path))
+    assert not roster.reload_if_changed()
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: pytest.fail("файл перечитан"))
+    assert not roster.reload_if_changed()
+    assert not roster.is_admin_email("a@skbkontur.ru")
@@ -0,0 +1,49 @@
+from datetime import date, datetime
+
+from helpers.analytics import get_held_intervals, rollup_days, split_by_days
+
+
+def test_split_by_days_clips_to_period():
+    parts = list(split_by_days(datetime(2024, 5, 5, 18), datetime(2024, 5, 8, 6), date(2024, 5, 6), date(2024, 5, 8)))
+    assert parts == [(date(2024, 5, 6), 86400), (date(2024, 5, 7), 86400)]
+
+
+def test_held_intervals_from_events_and_holding():
+    events = [
+        (1, "a@skbkontur.ru", "take", datetime(2024, 5, 1, 10)),
+        (2, "b@skbkontur.ru", "return", datetime(2024, 5, 6, 9)),
+        (1, "a@skbkontur.ru", "return", datetime(2024, 5, 6, 12)),
+        (1, "b@skbkontur.ru", "take", datetime(2024, 5, 6, 12)),
+    ]
+    compacted = [(3, datetime(2024, 4, 30), datetime(2024, 5, 6, 1))]
+    assert sorted(get_held_intervals(events, compacted, datetime(2024, 5, 7))) == [
+        (1, datetime(2024, 5, 1, 10), datetime(2024, 5, 6, 12)),
+        (1, datetime(2024, 5, 6, 12), datetime(2024, 5, 7)),
+        (3, datetime(2024, 4, 30), datetime(2024, 5, 6, 1)),
+    ]
+
+
+def test_rollup_days():
+    events = [
+        (1, "a@skbkontur.ru", "take", datetime(2024, 5, 5, 12)),
+        (1, "a@skbkontur.ru", "return", datetime(2024, 5, 6, 6)),
+        (1, "b@skbkontur.ru", "take", datetime(2024, 5, 6, 6)),
+        (2, "c@skbkontur.ru", "take", datetime(2024, 5, 7, 18)),
+    ]
+    waits = [
+        (1, datetime(2024, 5, 6, 0), datetime(2024, 5, 6, 6), True),
+        (1, datetime(2024, 5, 6, 12), None, False),
+    ]
+    devices, categories = rollup_days(date(2024, 5, 6), date(2024, 5, 8), events, [], waits, {1: "ККТ", 2: "ККТ"})
+    assert devices == [
+        {"day": date(2024, 5, 6), "resource_id": 1, "category_name": "ККТ", "held_seconds": 86400, "takes": 1,
+         "queued": 2, "served": 1, "wait_seconds": 6 * 3600, "queue_seconds": 18 * 3600},
+        {"day": date(2024, 5, 7), "resource_id": 1, "category_name": "ККТ", "held_seconds": 86400, "takes": 0,
+         "queued": 0, "served": 0, "wait_seconds": 0, "queue_seconds": 86400},
+        {"day": date(2024, 5, 7), "resource_id": 2, "category_name": "ККТ", "held_seconds": 6 * 3600, "takes": 1,
+         "queued": 0, "served": 0, "wait_seconds": 0, "queue_seconds": 0},
+    ]
+    assert [(row["day"], row["devices"], row["held_seconds"], row["takes"]) for row in categories] == [
+        (date(2024, 5, 6), 1, 86400, 1),
+        (date(2024, 5, 7), 2, 86400 + 6 * 3600, 1),
+    ]
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 import pytest
 
 from helpers import checker
@@ -11,3 +13,13 @@ def test_is_kontur_email(email):
 @pytest.mark.parametrize("email", ["mnoskov@skontur.ru", "nnn@gmail.com"])
 def test_is_kontur_email_negative_cases(email):
     assert checker.is_kontur_email(email) is None
+
+
+def test_parse_period():
+    assert checker.parse_period("15.03.2024") == (datetime(2024, 3, 15), datetime(2024, 3, 16))
+    assert checker.parse_period("01.03.2024 - 31.03.2024") == (datetime(2024, 3, 1), datetime(2024, 4, 1))
+
+
+@pytest.mark.parametrize("text", ["март", "31.03.2024-01.03.2024", "01.03.2024-02.03.2024-03.03.2024", ""])
+def test_parse_period_rejects(text):
+    assert checker.parse_period(text) is None
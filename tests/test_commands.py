@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from middlewares.commands import IdCommand, parse_command
+
+
+@pytest.mark.parametrize("text, name, resource_id, args", [
+    ("/take12", "take", 12, ""),
+    ("/update_address7", "update_address", 7, ""),
+    ("/edit5@cashbox_zoo_bot", "edit", 5, ""),
+    ("/edit 5", "edit", 5, ""),
+    ("/history 49 15.03.2024", "history", 49, "15.03.2024"),
+    ("/start ККТ", "start", None, "ККТ"),
+    ("/all", "all", None, ""),
+])
+def test_parse_command(text, name, resource_id, args):
+    command = parse_command(text)
+    assert (command.name, command.id, command.args) == (name, resource_id, args)
+
+
+@pytest.mark.parametrize("text", [None, "", "take12", "Отменить"])
+def test_not_a_command(text):
+    assert parse_command(text) is None
+
+
+def test_id_command_filter_passes_resource_id():
+    check = IdCommand("return", "queue")
+    assert asyncio.run(check(None, parse_command("/queue3"))) == {"resource_id": 3, "command_name": "queue"}
+    assert asyncio.run(check(None, parse_command("/take3"))) is False
+    assert asyncio.run(check(None, parse_command("/queue"))) is False
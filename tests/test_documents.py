@@ -0,0 +1,26 @@
+import asyncio
+import hashlib
+
+from helpers.documents import CachedExport
+
+
+def test_cached_export_rebuilds_only_when_key_changes():
+    export = CachedExport()
+    builds = []
+
+    async def build() -> bytes:
+        builds.append(len(builds))
+        return f"выгрузка {len(builds)}".encode()
+
+    async def main():
+        first = await export.get((10, 3), build)
+        again = await export.get((10, 3), build)
+        changed = await export.get((11, 3), build)
+        return first, again, changed
+
+    first, again, changed = asyncio.run(main())
+    assert first == again
+    assert first[1] == hashlib.sha256(first[0]).hexdigest()
+    assert changed[0] != first[0]
+    assert len(builds) == 2
+
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from helpers.executor import Cancelled, Offloader, raise_if_cancelled
+
+
+def wait_for_cancel(started: threading.Event, cancelled: threading.Event | None = None):
+    started.set()
+    while True:
+        raise_if_cancelled(cancelled)
+        time.sleep(0.001)
+
+
+def test_run_returns_result_and_caps_concurrency():
+    offloader = Offloader("thread", workers=2, max_jobs=1)
+    active = []
+
+    def job(number):
+        active.append(number)
+        time.sleep(0.01)
+        assert len(active) == 1
+        active.remove(number)
+        return number * 2
+
+    async def main():
+        return await asyncio.gather(*[offloader.run(job, number) for number in range(4)])
+
+    assert asyncio.run(main()) == [0, 2, 4, 6]
+    assert offloader.completed == 4
+
+
+def test_cancel_stops_running_thread_job():
+    offloader = Offloader("thread", workers=1)
+    started = threading.Event()
+
+    async def main():
+        task = asyncio.create_task(offloader.run(wait_for_cancel, started, cancellable=True))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # место в очереди освобождается, когда задача в потоке действительно завершилась
+        assert await asyncio.wait_for(offloader.run(sum, [1, 2]), timeout=1) == 3
+
+    asyncio.run(main())
+    assert offloader.cancelled == 1
+
+
+def test_raise_if_cancelled():
+    event = threading.Event()
+    raise_if_cancelled(event)
+    raise_if_cancelled(None)
+    event.set()
+    with pytest.raises(Cancelled):
+        raise_if_cancelled(event)
@@ -0,0 +1,65 @@
+from io import BytesIO
+
+from helpers import ingest
+from models import Resource, ResourceRow
+
+ROWS = "Айди,Название\r\n\r\n1,Эвотор 5\r\n2,\"Атол, 91Ф\"\r\n"
+
+
+def test_get_charset_looks_past_ascii_prefix():
+    prefix = b"1,ascii only\r\n" * (ingest.CHARSET_SAMPLE_BYTES // 14 + 10)
+    file = BytesIO(prefix + "2,Касса Эвотор 7.2,Кассы\r\n".encode("utf_8") * 50)
+    assert ingest.get_charset(file) == "utf_8"
+    assert file.tell() == 0
+
+
+def test_get_charset_cp1251():
+    assert ingest.get_charset(BytesIO((ROWS * 20).encode("cp1251"))) == "cp1251"
+
+
+def test_iter_rows_skips_header_and_empty_lines():
+    rows = list(ingest.iter_rows(BytesIO(ROWS.encode("cp1251")), "cp1251"))
+    assert rows == [(3, ["1", "Эвотор 5"]), (4, ["2", "Атол, 91Ф"])]
+
+
+def make_row(id, vendor_code, name="Эвотор", user_email=None, version=1) -> ResourceRow:
+    return ResourceRow(id=id, name=name, category_name="ККТ", vendor_code=vendor_code, user_email=user_email,
+                       version=version)
+
+
+def make_resource(id, vendor_code, name="Эвотор", **fields) -> Resource:
+    return Resource(id=id, name=name, category_name="ККТ", vendor_code=vendor_code, reg_date=None, firmware=None,
+                    comment=None, user_email=fields.get("user_email"), address=None, return_date=None)
+
+
+def test_plan_sync_diffs_rows():
+    current = [
+        make_row(1, "A"),
+        make_row(2, "B", version=7),
+        make_row(3, "C"),
+        make_row(4, "D", user_email="a.ivanov@skbkontur.ru"),
+    ]
+    incoming = [
+        make_resource(1, "A", user_email="m.noskov@skbkontur.ru"),
+        make_resource(2, "B2", name="Атол"),
+        make_resource(5, "E"),
+    ]
+    plan = ingest.plan_sync(current, incoming)
+    assert [resource.id for resource in plan.inserts] == [5]
+    assert plan.get_update_params() == [{"id": 2, "name": "Атол", "vendor_code": "B2"}]
+    assert plan.unchanged == 1
+    assert [row.id for row in plan.removed] == [3]
+    assert [row.id for row in plan.kept_taken] == [4]
+    assert plan.versions == {2: 7, 3: 1}
+    assert plan.conflicts == []
+    assert not plan.is_empty
+
+
+def test_plan_sync_reports_vendor_code_of_kept_taken_device():
+    current = [make_row(1, "A", user_email="a.ivanov@skbkontur.ru")]
+    plan = ingest.plan_sync(current, [make_resource(2, "A")])
+    assert [(resource.id, row.id) for resource, row in plan.conflicts] == [(2, 1)]
+
+
+def test_plan_sync_without_changes_is_empty():
+    assert ingest.plan_sync([make_row(1, "A")], [make_resource(1, "A")]).is_empty
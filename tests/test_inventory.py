@@ -0,0 +1,63 @@
+import asyncio
+
+from helpers.inventory import Inventory
+from models import ResourceRow
+
+
+def make_inventory(*rows: ResourceRow) -> Inventory:
+    inventory = Inventory(refresh_interval=3600)
+    for row in rows:
+        inventory.put(row)
+    inventory.loaded = True
+    inventory._checked_at = float("inf")
+    return inventory
+
+
+def row(resource_id, version, user_email=None, category_name="ККТ", name="MSPOS-N"):
+    return ResourceRow(id=resource_id, name=name, category_name=category_name, vendor_code=f"vc{resource_id}",
+                       user_email=user_email, version=version)
+
+
+def test_put_moves_resource_between_holders():
+    inventory = make_inventory(row(1, 1, "a@skbkontur.ru"))
+    inventory.put(row(1, 2, "b@skbkontur.ru"))
+    assert asyncio.run(inventory.taken_by("a@skbkontur.ru")) == []
+    assert [r.id for r in asyncio.run(inventory.taken_by("b@skbkontur.ru"))] == [1]
+
+
+def test_older_version_is_ignored():
+    inventory = make_inventory(row(1, 5, "a@skbkontur.ru"))
+    inventory.put(row(1, 4))
+    assert asyncio.run(inventory.get(1)).user_email == "a@skbkontur.ru"
+
+
+def test_removed_resource_is_not_resurrected_by_stale_row():
+    inventory = make_inventory(row(1, 3))
+    inventory.remove(1)
+    inventory.put(row(1, 3))
+    assert asyncio.run(inventory.get(1)) is None
+    assert asyncio.run(inventory.categories()) == []
+
+
+def test_tombstones_are_pruned_behind_watermark():
+    inventory = make_inventory(row(1, 3), row(2, 250))
+    inventory.remove(1)
+    inventory.remove(2)
+    inventory._watermark = 300
+    inventory._prune_tombstones()
+    assert inventory._tombstones == {2: 250}
+
+
+def test_search_by_id_and_substring():
+    inventory = make_inventory(row(1, 1, name="Штрих-М"), row(2, 2, name="АТОЛ 91Ф", category_name="Весы"))
+    assert [r.id for r in asyncio.run(inventory.search("2"))] == [2]
+    assert [r.id for r in asyncio.run(inventory.search("атол"))] == [2]
+    assert [r.id for r in asyncio.run(inventory.search("ккт"))] == [1]
+
+
+def test_category_counts_follow_taking_and_returning():
+    inventory = make_inventory(row(1, 1), row(2, 1, "a@skbkontur.ru"), row(3, 1, category_name="Весы"))
+    assert asyncio.run(inventory.category_counts()) == [("Весы", 1, 1), ("ККТ", 1, 2)]
+    inventory.put(row(2, 2))
+    inventory.remove(3)
+    assert asyncio.run(inventory.category_counts()) == [("ККТ", 2, 2)]
@@ -0,0 +1,71 @@
+import os
+from datetime import date
+
+import pytest
+
+from helpers import log_index
+
+
+def write(path, *lines: str) -> None:
+    with open(path, "a", encoding="utf-8") as file:
+        file.writelines(lines)
+
+
+def test_parse_query():
+    query = log_index.parse_query("42 Ivan@skbkontur.ru 20.04.2024-22.04.2024")
+    assert query.groups == [["id:42", "chat:42"], ["email:ivan@skbkontur.ru"]]
+    assert (query.date_from, query.date_to) == (date(2024, 4, 20), date(2024, 4, 22))
+    assert log_index.parse_query("chat:-100 id:7").groups == [["chat:-100"], ["id:7"]]
+
+
+@pytest.mark.parametrize("text", ["", "21.04.2024", "вчера 42", "42 22.04.2024-20.04.2024"])
+def test_parse_query_rejects(text):
+    assert log_index.parse_query(text) is None
+
+
+def test_extract_terms():
+    line = b"2024-04-21 10:00:00,000 - INFO - root - Resource(id=5, name=x, user_email=A@skbkontur.ru) " \
+           b"took chat_id 123, resource_id=7\n"
+    assert log_index.extract_terms(line) == {"id:5", "id:7", "chat:123", "email:a@skbkontur.ru"}
+
+
+def test_index_follows_rotation(tmp_path):
+    index = log_index.LogIndex(str(tmp_path))
+    current = tmp_path / "cashbox_zoo.log"
+    write(current, "2024-04-21 10:00:00,000 - INFO - root - resource_id=5 chat_id 1\n",
+          "2024-04-21 10:00:01,000 - ERROR - root - Resource(id=6, name=x)\n",
+          "Traceback: resource_id=5\n")
+    indexed = index.update([str(current)])
+    assert indexed == os.path.getsize(current)
+    assert len(index.search(log_index.parse_query("id:5"))) == 2
+
+    # полночь: файл переименован, начат новый, а в старый успели дописать еще строку без перевода строки
+    rotated = tmp_path / "cashbox_zoo.log.2024-04-21"
+    os.rename(current, rotated)
+    write(current, "2024-04-22 09:00:00,000 - INFO - root - resource_id=5 chat_id 2\n", "2024-04-22 09:00:01")
+    index.update([str(current), str(rotated)])
+    assert index.update([str(current), str(rotated)]) == 0
+
+    found = index.search(log_index.parse_query("5"))
+    assert [path for path, _ in found] == [str(current), str(rotated), str(rotated)]
+    assert log_index.read_lines(found)[0].endswith("resource_id=5 chat_id 2")
+    assert len(index.search(log_index.parse_query("id:5 chat:1"))) == 1
+    assert len(index.search(log_index.parse_query("id:5 22.04.2024"))) == 1
+
+    os.remove(rotated)
+    index.update([str(current)])
+    assert [path for path, _ in index.search(log_index.parse_query("id:5"))] == [str(current)]
+
+
+def test_rotation_before_read_needs_reindex(tmp_path):
+    index = log_index.LogIndex(str(tmp_path))
+    current = tmp_path / "cashbox_zoo.log"
+    write(current, "2024-04-21 10:00:00,000 - INFO - root - resource_id=5 chat_id 1\n")
+    index.update([str(current)])
+    found = index.search(log_index.parse_query("id:5"))
+    rotated = tmp_path / "cashbox_zoo.log.2024-04-21"
+    os.rename(current, rotated)
+    with pytest.raises(FileNotFoundError):
+        log_index.read_lines(found)
+    lines = log_index.search_logs(str(tmp_path), [str(rotated)], log_index.parse_query("id:5"))
+    assert lines == ["2024-04-21 10:00:00,000 - INFO - root - resource_id=5 chat_id 1"]
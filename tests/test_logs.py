@@ -0,0 +1,62 @@
+import logging
+import os
+import shutil
+from datetime import date
+from zipfile import ZipFile
+
+import pytest
+
+from helpers import logs
+
+LINES = [
+    b"2024-04-21 10:00:00,000 - INFO - root - first\n",
+    b"2024-04-21 10:00:01,000 - ERROR - root - failed\n",
+    b"Traceback (most recent call last):\n",
+    b"ValueError: boom\n",
+    b"2024-04-22 09:00:00,000 - INFO - root - second\n",
+]
+
+
+def test_parse_log_filter():
+    log_filter = logs.parse_log_filter("20.04.2024-22.04.2024 error")
+    assert (log_filter.date_from, log_filter.date_to, log_filter.min_level) == \
+           (date(2024, 4, 20), date(2024, 4, 22), logging.ERROR)
+    assert logs.parse_log_filter("21.04.2024").date_to == date(2024, 4, 21)
+    assert logs.parse_log_filter("все").is_empty
+
+
+@pytest.mark.parametrize("text", ["вчера", "22.04.2024-20.04.2024", "1.2.3-4.5.6-7.8.9"])
+def test_parse_log_filter_rejects(text):
+    assert logs.parse_log_filter(text) is None
+
+
+def test_filter_keeps_continuation_lines_with_their_record():
+    assert list(logs.iter_filtered_lines(LINES, logs.LogFilter(min_level=logging.ERROR))) == LINES[1:4]
+    only_22 = logs.LogFilter(date(2024, 4, 22), date(2024, 4, 22))
+    assert list(logs.iter_filtered_lines(LINES, only_22)) == LINES[4:]
+
+
+def test_build_archives_skips_old_files_and_splits(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs, "SIZE_CHECK_EVERY_BYTES", 1000)
+    old = tmp_path / "cashbox_zoo.log.2024-01-01"
+    old.write_bytes(b"2024-01-01 10:00:00,000 - ERROR - root - old\n")
+    current = tmp_path / "cashbox_zoo.log"
+    # случайный текст почти не сжимается, поэтому архив гарантированно не поместится в одну часть
+    noise = b"".join(b"2024-04-21 10:00:00,000 - INFO - root - " + os.urandom(32).hex().encode() + b"\n"
+                     for _ in range(2000))
+    current.write_bytes(noise)
+    log_filter = logs.LogFilter(date(2024, 4, 21), date(2024, 4, 22))
+    directory, archives = logs.build_archives([str(current), str(old)], log_filter, part_bytes=2000)
+    try:
+        assert len(archives) > 1
+        names = []
+        content = b""
+        for path in archives:
+            with ZipFile(path) as archive:
+                names += archive.namelist()
+                content += b"".join(archive.read(name) for name in archive.namelist())
+        assert "cashbox_zoo.log.2024-01-01" not in names
+        assert names[:2] == ["cashbox_zoo.log", "cashbox_zoo.log.2"]
+        assert content == noise
+    finally:
+        shutil.rmtree(directory)
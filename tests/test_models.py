@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+from models import (
+    RESOURCE_ROW_COLUMNS, Resource, ResourceRow, Visitor, Record, VisitorCache, add_months, get_event_partition_name
+)
+
+
+@pytest.mark.parametrize("model, expected", [(Resource, "id"), (Visitor, "email"), (Record, "id")])
+def test_primary_key(model, expected):
+    assert model.__model_info__.primary_key == expected
+
+
+def test_column_names_keep_declaration_order():
+    assert Resource.get_fields_names()[:4] == ("id", "name", "category_name", "vendor_code")
+
+
+def test_missing_fields_for_resource():
+    assert Resource.__model_info__.missing_fields(["id", "name"]) == ["category_name", "vendor_code"]
+
+
+def test_unknown_fields():
+    assert Resource.__model_info__.unknown_fields(["id", "color"]) == ["color"]
+    assert not Resource.check_fields({"colour": 1}, "update")
+
+
+def test_visitor_cache_forgets_changed_email():
+    cache = VisitorCache()
+    cache.put(Visitor(email="a@skbkontur.ru", chat_id=1))
+    cache.put(Visitor(email="b@skbkontur.ru", chat_id=2))
+    cache.forget_email("a@skbkontur.ru")
+    assert cache.get(1) is None
+    assert cache.get(2).email == "b@skbkontur.ru"
+
+
+def test_visitor_cache_expires_without_changefeed():
+    cache = VisitorCache(ttl=0)
+    cache.put(Visitor(email="a@skbkontur.ru", chat_id=1))
+    assert cache.get(1) is None
+    cache.ttl = None
+    cache.put(Visitor(email="a@skbkontur.ru", chat_id=1))
+    assert cache.get(1) is not None
+
+
+def test_resource_row_projection_follows_slots_order():
+    assert [column.name for column in RESOURCE_ROW_COLUMNS] == list(ResourceRow.__slots__)
+    row = ResourceRow.from_values(range(len(ResourceRow.__slots__)))
+    assert (row.id, row.version) == (0, len(ResourceRow.__slots__) - 1)
+
+
+def test_add_months_and_partition_names():
+    assert add_months(date(2024, 11, 1), 2) == date(2025, 1, 1)
+    assert add_months(date(2024, 1, 1), -3) == date(2023, 10, 1)
+    assert get_event_partition_name(date(2024, 5, 1)) == "event_2024_05"
@@ -0,0 +1,34 @@
+from datetime import date, datetime
+
+from helpers.overdue import holder_blocks, overdue_messages
+from helpers.render import MESSAGE_LIMIT
+from models import ResourceRow
+
+
+def overdue_row(resource_id: int, email: str, return_date: datetime) -> ResourceRow:
+    return ResourceRow(id=resource_id, name=f"Касса {resource_id}", category_name="ККТ", user_email=email,
+                       return_date=return_date)
+
+
+def test_holder_blocks_group_by_email():
+    overdue = [
+        (overdue_row(1, "a@skbkontur.ru", datetime(2024, 5, 1)), 0),
+        (overdue_row(2, "a@skbkontur.ru", datetime(2024, 5, 9)), 2),
+        (overdue_row(3, "b@skbkontur.ru", datetime(2024, 5, 9)), 0),
+    ]
+    assert holder_blocks(overdue, date(2024, 5, 10)) == [
+        "a@skbkontur.ru:\r\n"
+        "Касса 1 (ККТ) /history1 - с 01.05.2024, 9 дн.\r\n"
+        "Касса 2 (ККТ) /history2 - с 09.05.2024, 1 дн., в очереди 2\r\n\r\n",
+        "b@skbkontur.ru:\r\n"
+        "Касса 3 (ККТ) /history3 - с 09.05.2024, 1 дн.\r\n\r\n",
+    ]
+
+
+def test_overdue_messages_fit_telegram_limit():
+    overdue = [(overdue_row(i, f"u{i // 150}@skbkontur.ru", datetime(2024, 5, 1)), i % 3) for i in range(600)]
+    messages = overdue_messages(overdue, date(2024, 5, 10))
+    assert all(len(text) <= MESSAGE_LIMIT for text in messages)
+    assert all(text.startswith("Просрочено устройств: 600, у пользователей: 4") for text in messages)
+    assert sum(text.count("/history") for text in messages) == 600
+    assert overdue_messages([], date(2024, 5, 10)) == []
@@ -0,0 +1,34 @@
+import pytest
+
+from helpers.render import CardCache, split_pages
+from helpers.tg import Paginator
+from models import ResourceRow
+
+
+def row(version, name="MSPOS-N"):
+    return ResourceRow(id=1, name=name, category_name="ККТ", vendor_code="vc1", version=version)
+
+
+def test_card_is_rendered_again_after_version_change():
+    cards = CardCache()
+    assert cards.get(row(1)) == cards.get(row(1, name="Другое название"))
+    assert "Эвотор" in cards.get(row(2, name="Эвотор"))
+    assert (cards.hits, cards.misses) == (1, 2)
+
+
+@pytest.mark.parametrize("lengths, reserved, limit, max_elements, expected", [
+    ([100] * 7, 0, 4096, 5, [0, 5]),
+    ([1000] * 5, 100, 4096, 10, [0, 3]),
+    ([5000, 10, 10], 0, 4096, 10, [0, 1]),
+    ([], 0, 4096, 10, []),
+])
+def test_split_pages(lengths, reserved, limit, max_elements, expected):
+    assert split_pages(lengths, reserved, limit, max_elements) == expected
+
+
+def test_paginator_with_bounds():
+    paginator = Paginator(2, list(range(7)))
+    paginator.set_bounds([0, 3, 6])
+    assert paginator.get_array_indexes() == (3, 5)
+    paginator.page = 3
+    assert paginator.get_objects_on_page() == [6]
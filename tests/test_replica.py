@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from helpers.metrics import pool_metrics
+from models import Category, Resource, get_engine, get_read_database_url, get_read_engine
+
+pytestmark = pytest.mark.skipif(
+    not get_read_database_url(),
+    reason="нужны две базы: основная из PG_* и POSTGRES_URL, реплика из READ_DATABASE_URL"
+)
+
+
+def test_reads_go_to_replica_and_checks_before_write_to_primary():
+    async def scenario():
+        primary, replica = get_engine(), get_read_engine()
+        assert primary is not replica
+        try:
+            await Category.add("Другое")
+            await Resource.add(id=999999, name="Тест реплики", category_name="Другое", vendor_code="REPLICA-TEST-1")
+            primary_queries = pool_metrics["primary"].queries
+            assert len(await Resource.get_by_vendor_code("REPLICA-TEST-1", primary=True)) == 1
+            assert pool_metrics["primary"].queries == primary_queries + 1
+            replica_queries = pool_metrics["replica"].queries
+            await Resource.get_by_vendor_code("REPLICA-TEST-1")
+            assert pool_metrics["replica"].queries == replica_queries + 1
+            assert pool_metrics["primary"].queries == primary_queries + 1
+        finally:
+            await Resource.delete(999999)
+            await primary.dispose()
+            await replica.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,20 @@
+from datetime import datetime, time, timedelta
+
+from helpers.scheduler import get_lock_key, get_next_run
+
+
+def test_next_run_every():
+    now = datetime(2024, 5, 6, 12, 0)
+    assert get_next_run(now, timedelta(hours=6)) == datetime(2024, 5, 6, 18, 0)
+
+
+def test_next_run_at_time_of_day():
+    assert get_next_run(datetime(2024, 5, 6, 1, 0), timedelta(days=1), time(3, 30)) == datetime(2024, 5, 6, 3, 30)
+    assert get_next_run(datetime(2024, 5, 6, 3, 30), timedelta(days=1), time(3, 30)) == datetime(2024, 5, 7, 3, 30)
+    assert get_next_run(datetime(2024, 12, 31, 23, 0), timedelta(days=1), time(3, 30)) == datetime(2025, 1, 1, 3, 30)
+
+
+def test_lock_key_is_stable_and_per_job():
+    assert get_lock_key("event_compaction") == get_lock_key("event_compaction")
+    assert get_lock_key("event_compaction") != get_lock_key("event_partitions")
+    assert 0 <= get_lock_key("event_compaction") < 2 ** 63
@@ -0,0 +1,44 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from helpers.storage import BoundedMemoryStorage
+
+
+def key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+
+
+def test_reads_do_not_create_dialogs_and_clear_removes_them():
+    async def scenario():
+        storage = BoundedMemoryStorage()
+        assert await storage.get_state(key(1)) is None
+        assert len(storage.dialogs) == 0
+        await storage.set_state(key(1), "AddResourceFSM:write_name")
+        await storage.set_data(key(1), {"name": "MSPOS-N"})
+        assert storage.gauges() == {"AddResourceFSM": 1}
+        await storage.set_state(key(1), None)
+        await storage.set_data(key(1), {})
+        assert len(storage.dialogs) == 0
+
+    asyncio.run(scenario())
+
+
+def test_expired_and_overflowing_dialogs_are_dropped_with_notification():
+    async def scenario():
+        notified = []
+
+        async def on_expire(storage_key, state):
+            notified.append((storage_key.chat_id, state))
+
+        storage = BoundedMemoryStorage(ttl=3600, max_dialogs=2, on_expire=on_expire)
+        for chat_id in (1, 2, 3):
+            await storage.set_state(key(chat_id), "EditFSM:choosing")
+        assert list(dialog.chat_id for dialog in storage.dialogs) == [2, 3]
+        storage.ttl = 0
+        assert storage.sweep() == 2
+        await asyncio.sleep(0)
+        assert sorted(notified) == [(1, "EditFSM:choosing"), (2, "EditFSM:choosing"), (3, "EditFSM:choosing")]
+        assert (storage.evicted, storage.expired) == (1, 2)
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.types import CallbackQuery
+
+from middlewares.throttling import ThrottlingMiddleware, TokenBucket
+
+
+def test_token_bucket_refills_with_time():
+    bucket = TokenBucket(rate=1, capacity=2, now=0)
+    assert bucket.take(0) and bucket.take(0)
+    assert not bucket.take(0.5)
+    assert bucket.take(1.5)
+
+
+def test_stale_page_clicks_are_coalesced():
+    async def scenario():
+        middleware = ThrottlingMiddleware(burst=10)
+        handled, answered = [], []
+
+        async def handler(call, data):
+            handled.append(call.data)
+            await asyncio.sleep(0.01)
+
+        def click(data):
+            call = CallbackQuery.model_construct(
+                id=data, data=data, message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10))
+            object.__setattr__(call, "answer", lambda: asyncio.sleep(0, answered.append(data)))
+            return middleware(handler, call, {})
+
+        await asyncio.gather(*(click(f"search_resource {page}") for page in (1, 2, 3, 4)))
+        assert handled == ["search_resource 1", "search_resource 4"]
+        assert answered == ["search_resource 2", "search_resource 3"]
+        assert middleware.clicks == {}
+
+    asyncio.run(scenario())